@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Benchmark the number of database round trips of vlan writes
+         in REST app and synchronizer using a local SQLite database.
+
+Usage: python benchmarks/bench_db.py [--vlans 500] [--output result.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'configurator'))
+
+
+def setup_config(tmp_dir, db_url=None, provider='ansible'):
+    # point the app to a SQLite database in temporary directory
+    db_url = db_url or f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    with open(os.path.join(tmp_dir, 'configurator.cfg'), 'w') as fp:
+        fp.write("---\n"
+                 "database:\n"
+                 f"  url: {db_url}\n"
+                 "defaults:\n"
+                 f"  provider: {provider}\n")
+    os.environ['CONFIGURATOR_CFG'] = tmp_dir
+
+
+class RoundTrips(object):
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def measure(self, func, *args, **kwargs):
+        start_count = self.count
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        return {'round_trips': self.count - start_count, 'seconds': round(time.perf_counter() - start, 6)}
+
+
+def per_row_update(db, Vlans, config):
+    # the earlier per record implementation, kept as baseline
+    for vlan_config in config:
+        vlan = Vlans.query.get(vlan_config['vlan_id'])
+        vlan.name = vlan_config['name']
+        db.session.flush()
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vlans', type=int, default=500, help='number of vlans written per request')
+    parser.add_argument('--output', help='path of json result file, default is stdout')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='configurator-bench-')
+    setup_config(tmp_dir)
+
+    from database import create_app, db, Vlans, update_vlans_db
+    import synchronizer
+
+    app = create_app()
+
+    config = [{'vlan_id': vlan_id, 'name': f'vlan{vlan_id}', 'description': f'vlan {vlan_id}'}
+              for vlan_id in range(1, args.vlans + 1)]
+    renamed = [dict(item, name=f"{item['name']}-new") for item in config]
+    results = {'vlans': args.vlans}
+
+    with app.app_context():
+        db.create_all()
+        counter = RoundTrips(db.engine)
+
+        def rest_write(items, action):
+            update_vlans_db(items, action=action)
+            db.session.commit()
+
+        results['rest_add'] = counter.measure(rest_write, config, 'add')
+        results['rest_update'] = counter.measure(rest_write, renamed, 'update')
+        results['rest_update_per_row_baseline'] = counter.measure(per_row_update, db, Vlans, config)
+        results['rest_delete'] = counter.measure(rest_write, config, 'delete')
+        db.session.remove()
+
+    engine = synchronizer.get_engine()
+    vlans_obj = synchronizer.ResourceDb(engine, engine.connect(), synchronizer.metadata)
+    counter = RoundTrips(engine)
+    records = [(item['vlan_id'], item['name'], item['description']) for item in config]
+    half = records[:len(records) // 2]
+
+    def sync_write(upsert, delete):
+        with vlans_obj.connection.begin():
+            if upsert:
+                vlans_obj.upsert_records(upsert)
+            if delete:
+                vlans_obj.delete_records(delete)
+
+    sync_write(half, None)
+    results['sync_upsert'] = counter.measure(sync_write, records, None)
+    results['sync_delete'] = counter.measure(sync_write, None, records)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Load test the REST API served in sync mode by the Flask server and
+         in async mode by uvicorn, against in-memory fake devices with
+         latency. Each client opens a new connection for every request.
+
+Usage: python benchmarks/bench_load.py [--modes sync,async] [--clients 100,1000]
+                                       [--requests 5] [--devices 10]
+                                       [--latency-ms 50] [--output result.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_db import setup_config
+from bench_suite import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'configurator'))
+
+HOST = '127.0.0.1'
+
+
+def serve(args):
+    # run in the server process started by run_mode
+    from configurator.provider import manage
+    from configurator.provider.fake.vlans import FakeManageVlans
+
+    fake = FakeManageVlans(hosts=args.devices, latency_ms=args.latency_ms, vlans=args.vlans)
+    manage_vlans = manage.ManageVlans(obj=fake, max_in_flight=args.max_in_flight)
+    if args.serve == 'sync':
+        import server
+        server.create_app(manage_vlans).run(host=HOST, port=args.port, threaded=True)
+    else:
+        import asgi
+        import uvicorn
+        uvicorn.run(asgi.create_app(manage_vlans, reconciler=False), host=HOST, port=args.port,
+                    lifespan='on', log_level='warning', backlog=4096)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise Exception(f"server did not listen on port {port} in {timeout} seconds")
+
+
+async def send_request(port, method, path, body=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else b''
+    head = f"{method} {path} HTTP/1.1\r\nHost: {HOST}\r\nConnection: close\r\nContent-Length: {len(data)}\r\n"
+    if body is not None:
+        head += "Content-Type: application/json\r\n"
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        writer.write(head.encode('latin-1') + b"\r\n" + data)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def load(port, scenario, clients, requests, vlans):
+    latencies = []
+    statuses = {}
+
+    async def client(index):
+        for count in range(requests):
+            vlan_id = (index * requests + count) % vlans + 1
+            if scenario == 'get_vlan':
+                request = ('GET', f'/config/vlans/{vlan_id}', None)
+            else:
+                request = ('PUT', f'/config/vlans/{vlan_id}', {'vlan_id': vlan_id, 'name': f'load{index}-{count}'})
+            start = time.perf_counter()
+            try:
+                status = str(await send_request(port, *request))
+            except (OSError, IndexError, ValueError):
+                status = 'error'
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(index) for index in range(clients)])
+    seconds = time.perf_counter() - start
+    return {
+        'clients': clients,
+        'requests': len(latencies),
+        'seconds': round(seconds, 3),
+        'throughput_rps': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'status_codes': dict(sorted(statuses.items())),
+    }
+
+
+def run_mode(mode, args):
+    port = free_port()
+    command = [sys.executable, os.path.realpath(__file__), '--serve', mode, '--port', str(port),
+               '--devices', str(args.devices), '--vlans', str(args.vlans),
+               '--latency-ms', str(args.latency_ms), '--max-in-flight', str(args.max_in_flight)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        result = {'mode': mode}
+        for scenario in args.scenarios.split(','):
+            result[scenario] = [asyncio.run(load(port, scenario, int(clients), args.requests, args.vlans))
+                                for clients in args.clients.split(',')]
+        return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default='sync,async', help='comma separated serving modes, sync or async')
+    parser.add_argument('--scenarios', default='get_vlan,put_vlan', help='comma separated scenarios, '
+                                                                          'get_vlan or put_vlan')
+    parser.add_argument('--clients', default='100,1000', help='comma separated number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=5, help='number of requests sent by each client')
+    parser.add_argument('--devices', type=int, default=10, help='number of fake devices')
+    parser.add_argument('--vlans', type=int, default=1024, help='number of vlans in database and on devices')
+    parser.add_argument('--latency-ms', type=float, default=50, help='latency of each fake device round trip')
+    parser.add_argument('--max-in-flight', type=int, default=16, help='number of concurrent device operations')
+    parser.add_argument('--db-url', help='database url, default is a SQLite database in temporary directory')
+    parser.add_argument('--output', help='path of json result file, default is stdout')
+    parser.add_argument('--serve', choices=('sync', 'async'), help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOGLEVEL', 'WARNING')
+    if args.serve:
+        serve(args)
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix='configurator-bench-')
+    setup_config(tmp_dir, db_url=args.db_url, provider='fake')
+
+    from database import create_app, db, Vlans, update_vlans_db
+    with create_app().app_context():
+        db.create_all()
+        Vlans.query.delete()
+        update_vlans_db([{'vlan_id': vlan_id, 'name': f'vlan{vlan_id}'} for vlan_id in range(1, args.vlans + 1)])
+        db.session.commit()
+
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'serve', 'port')},
+        'runs': [run_mode(mode, args) for mode in args.modes.split(',')],
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
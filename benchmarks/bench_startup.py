@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Benchmark the cold start time of the app modules, each scenario
+         runs in a new python process against a local SQLite database.
+
+Usage: python benchmarks/bench_startup.py [--runs 10] [--output result.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_db import setup_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+SCENARIOS = (
+    ('python', "pass"),
+    ('import_database', "import database"),
+    ('import_server', "import server"),
+    ('import_synchronizer', "import synchronizer"),
+    ('create_app', "import server; server.create_app()"),
+    ('first_request', "import server; server.create_app().test_client().get('/config/vlans')"),
+)
+
+
+def run_scenario(code, runs):
+    env = dict(os.environ, LOGLEVEL='WARNING',
+               PYTHONPATH=os.pathsep.join([os.path.join(ROOT, 'src', 'configurator'), os.path.join(ROOT, 'src')]))
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], env=env, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='number of processes started for each scenario')
+    parser.add_argument('--output', help='path of json result file, default is stdout')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='configurator-bench-')
+    setup_config(tmp_dir, provider='fake')
+
+    results = {'runs': args.runs}
+    for name, code in SCENARIOS:
+        results[name] = run_scenario(code, args.runs)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Compare the memory and the diff time of the per-device vlan state
+         of a fleet, kept as dict of vlan_id to vlan config, as tuple records
+         of RecordSnapshot and as compact VlanState. Every device is diffed
+         against the reference device, a fraction of the devices drift.
+
+Usage: python benchmarks/bench_state.py [--devices 10000] [--vlans 1024]
+                                        [--baseline-devices 1000] [--drift 0.01]
+                                        [--output result.json]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'configurator'))
+
+
+def device_config(index, vlans, drift, rand):
+    # config as parsed from a device, every string is a new object
+    config = [{'vlan_id': vlan_id, 'name': ''.join(['vlan', str(vlan_id)]),
+               'description': ' '.join(['uplink', 'vlan', str(vlan_id)])}
+              for vlan_id in range(1, vlans + 1)]
+    if index and rand.random() < drift:
+        config[rand.randrange(vlans)]['name'] = f'drift{index}'
+        del config[rand.randrange(vlans - 1)]
+        config.append({'vlan_id': vlans + 1 + rand.randrange(100), 'name': f'extra{index}'})
+    return config
+
+
+def build(kind, devices, args):
+    from configurator.provider.diff import to_state
+    from configurator.provider.vlanstate import VlanState
+    from synchronizer import RecordSnapshot
+
+    rand = random.Random(args.seed)
+    states = []
+    for index in range(devices):
+        config = device_config(index, args.vlans, args.drift, rand)
+        if kind == 'dict':
+            states.append(to_state(config))
+        elif kind == 'record_snapshot':
+            states.append(RecordSnapshot((item['vlan_id'], item.get('name'), item.get('description'))
+                                         for item in config))
+        elif kind == 'vlan_state':
+            states.append(VlanState.from_config(config))
+        else:
+            states.append(VlanState.from_config(config).intern())
+    return states
+
+
+def diff_all(kind, states):
+    from configurator.provider.diff import compute_delta
+
+    reference = states[0]
+    changed = 0
+    for state in states:
+        if kind == 'dict':
+            delta = compute_delta(reference, state)
+            changed += bool(delta.merged or delta.replaced or delta.deleted)
+        else:
+            changed += any(reference.diff(state))
+    return changed
+
+
+def run(kind, devices, args):
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    states = build(kind, devices, args)
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    begin = time.perf_counter()
+    changed = diff_all(kind, states)
+    seconds = time.perf_counter() - begin
+    scale = args.devices / devices
+    result = {
+        'state': kind,
+        'devices': devices,
+        'drifted_devices': changed,
+        'memory_mb': round(memory / 2 ** 20, 3),
+        'diff_seconds': round(seconds, 6),
+        'diff_us_per_device': round(seconds / devices * 10 ** 6, 3),
+    }
+    if scale != 1:
+        # linear estimate for the devices of the run
+        result['estimated_memory_mb'] = round(memory * scale / 2 ** 20, 3)
+        result['estimated_diff_seconds'] = round(seconds * scale, 6)
+    del states
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=10000, help='number of devices')
+    parser.add_argument('--vlans', type=int, default=1024, help='number of vlans on each device')
+    parser.add_argument('--baseline-devices', type=int, default=1000,
+                        help='number of devices of the dict and record_snapshot states, the result is '
+                             'extrapolated to --devices since these do not fit in memory at fleet scale')
+    parser.add_argument('--drift', type=float, default=0.01, help='fraction of devices that differ from reference')
+    parser.add_argument('--states', default='dict,record_snapshot,vlan_state,vlan_state_interned',
+                        help='comma separated states to compare')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the drift')
+    parser.add_argument('--output', help='path of json result file, default is stdout')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOGLEVEL', 'WARNING')
+    runs = []
+    for kind in args.states.split(','):
+        devices = min(args.devices, args.baseline_devices) if kind in ('dict', 'record_snapshot') else args.devices
+        runs.append(run(kind, devices, args))
+
+    output = json.dumps({'config': {key: value for key, value in vars(args).items() if key != 'output'},
+                         'runs': runs}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Benchmark REST latency, sync cycle time and database round trips
+         against in-memory fake devices using a local SQLite database or
+         the MySql database given with --db-url.
+
+Usage: python benchmarks/bench_suite.py [--devices 1,100,1000] [--vlans 1024]
+                                        [--requests 50] [--latency-ms 2]
+                                        [--failure-rate 0] [--output result.json]
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+from bench_db import RoundTrips, setup_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'configurator'))
+
+
+def percentile(values, percent):
+    # nearest rank percentile
+    values = sorted(values)
+    index = max(0, int(math.ceil(percent / 100.0 * len(values))) - 1)
+    return values[index]
+
+
+class Bench(object):
+    def __init__(self, counter, fake):
+        '''
+        :param counter: RoundTrips object of database engine
+        :param fake: FakeManageVlans object
+        '''
+        self.counter = counter
+        self.fake = fake
+
+    def measure(self, func, *args, **kwargs):
+        db_start = self.counter.count
+        device_start = self.fake.round_trips
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        return {
+            'seconds': round(time.perf_counter() - start, 6),
+            'db_round_trips': self.counter.count - db_start,
+            'device_round_trips': self.fake.round_trips - device_start,
+        }
+
+    def requests(self, send, count):
+        '''
+        Send count requests and report the latency percentiles
+        :param send: Callable with request index as argument, returns response
+        :param count: Number of requests
+        '''
+        latencies = []
+        statuses = {}
+        db_start = self.counter.count
+        device_start = self.fake.round_trips
+        for index in range(count):
+            start = time.perf_counter()
+            response = send(index)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return {
+            'requests': count,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / count, 3),
+            'db_round_trips_per_request': round((self.counter.count - db_start) / count, 2),
+            'device_round_trips_per_request': round((self.fake.round_trips - device_start) / count, 2),
+            'status_codes': {str(code): total for code, total in sorted(statuses.items())},
+        }
+
+
+def run_devices(devices, args):
+    import server
+    import synchronizer
+    from database import db, Vlans
+    from configurator.provider import manage
+    from configurator.provider.fake.vlans import FakeManageVlans
+
+    fake = FakeManageVlans(hosts=devices, latency_ms=args.latency_ms, failure_rate=args.failure_rate,
+                           vlans=args.vlans, seed=args.seed)
+    manage_vlans = manage.ManageVlans(obj=fake, max_in_flight=args.max_in_flight)
+    app = server.create_app(manage_vlans)
+    client = app.test_client()
+    result = {'devices': devices}
+
+    with app.app_context():
+        Vlans.query.delete()
+        db.session.commit()
+        bench = Bench(RoundTrips(db.engine), fake)
+
+        # the devices already have the vlans, only the database is written
+        response = None
+
+        def seed():
+            nonlocal response
+            response = client.post('/config/vlans/bulk', json={'range': f'1-{args.vlans}'})
+            response.get_data()
+
+        result['rest_bulk_seed'] = bench.measure(seed)
+        result['rest_bulk_seed']['status_code'] = response.status_code
+
+        result['rest_get_vlans'] = bench.requests(lambda index: client.get('/config/vlans'), args.requests)
+        etag = client.get('/config/vlans').headers['ETag']
+        result['rest_get_vlans_not_modified'] = bench.requests(
+            lambda index: client.get('/config/vlans', headers={'If-None-Match': etag}), args.requests)
+        result['rest_get_vlans_page'] = bench.requests(
+            lambda index: client.get('/config/vlans?limit=100&fields=vlan_id,name'), args.requests)
+        result['rest_get_vlan'] = bench.requests(
+            lambda index: client.get(f'/config/vlans/{index % args.vlans + 1}'), args.requests)
+        result['rest_put_vlan'] = bench.requests(
+            lambda index: client.put(f'/config/vlans/{index % args.vlans + 1}',
+                                     json={'vlan_id': index % args.vlans + 1, 'name': f'bench{index}'}),
+            args.requests)
+        db.session.remove()
+
+    bench = Bench(RoundTrips(synchronizer.get_engine()), fake)
+    state = synchronizer.SyncState()
+    std_dev = synchronizer.reference_host(manage_vlans)
+
+    def sync_cycle():
+        with synchronizer.resources_db() as resource_dbs:
+            synchronizer.sync_resources(resource_dbs, manage_vlans, state)
+
+    def reconcile():
+        with synchronizer.resources_db() as resource_dbs:
+            synchronizer.reconcile_hosts(resource_dbs, manage_vlans, manage_vlans.hosts)
+
+    result['sync_cycle_cold'] = bench.measure(sync_cycle)
+    result['sync_cycle_steady'] = bench.measure(sync_cycle)
+
+    # change a tenth of the vlans on the reference device outside the app
+    changed = [{'vlan_id': vlan_id, 'name': f'changed{vlan_id}'} for vlan_id in range(1, args.vlans + 1, 10)]
+    fake.configure(std_dev, changed)
+    result['sync_cycle_changed'] = bench.measure(sync_cycle)
+    result['reconcile_all_hosts'] = bench.measure(reconcile)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', default='1,100,1000', help='comma separated number of fake devices of each run')
+    parser.add_argument('--vlans', type=int, default=1024, help='number of vlans on each device')
+    parser.add_argument('--requests', type=int, default=50, help='number of requests of each REST scenario')
+    parser.add_argument('--latency-ms', type=float, default=2, help='latency of each fake device round trip')
+    parser.add_argument('--failure-rate', type=float, default=0, help='probability of a fake device round trip to fail')
+    parser.add_argument('--max-in-flight', type=int, default=16, help='number of concurrent device operations')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the fake device failures')
+    parser.add_argument('--db-url', help='database url, default is a SQLite database in temporary directory')
+    parser.add_argument('--output', help='path of json result file, default is stdout')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='configurator-bench-')
+    setup_config(tmp_dir, db_url=args.db_url, provider='fake')
+    os.environ.setdefault('LOGLEVEL', 'WARNING')
+
+    from database import create_app, db
+    with create_app().app_context():
+        db.create_all()
+
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'runs': [run_devices(int(devices), args) for devices in args.devices.split(',')],
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
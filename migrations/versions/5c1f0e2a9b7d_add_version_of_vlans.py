@@ -0,0 +1,34 @@
+"""add version of vlans
+
+Revision ID: 5c1f0e2a9b7d
+Revises: 
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1f0e2a9b7d'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the table of a database created before the migrations were tracked
+    # may already have the column if it was created by db.create_all()
+    inspector = sa.inspect(op.get_bind())
+    if 'vlans' not in inspector.get_table_names():
+        return
+    if 'version' in [column['name'] for column in inspector.get_columns('vlans')]:
+        return
+    # existing rows start at version 1, the ETag of a vlan never written since
+    with op.batch_alter_table('vlans') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('vlans') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,31 @@
+"""add table versions
+
+Revision ID: 8d4b6f3e2c1a
+Revises: 5c1f0e2a9b7d
+Create Date: 2026-10-18 14:37:05.204119
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4b6f3e2c1a'
+down_revision = '5c1f0e2a9b7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the table may already be created by db.create_all()
+    if 'table_versions' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    table = op.create_table('table_versions',
+                            sa.Column('name', sa.String(length=64), nullable=False),
+                            sa.Column('version', sa.Integer(), nullable=False),
+                            sa.PrimaryKeyConstraint('name'))
+    op.bulk_insert(table, [{'name': 'vlans', 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('table_versions')
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: ASGI adapter of the REST API for async servers. The views of the
+         Flask app in server.py serve the requests on a thread pool, the
+         request body is spooled before the view runs and the response,
+         including the streamed bulk results, is sent as the view yields it.
+
+Usage: python asgi.py
+       uvicorn --factory asgi:create_app
+"""
+import asyncio
+import logging
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+import server
+from config.base import get_option, setup_logging
+
+log = logging.getLogger(__name__)
+
+# request body kept in memory up to this size, spooled to a file beyond
+MAX_BODY_IN_MEMORY = 1024 * 1024
+
+
+def wsgi_environ(scope, body):
+    '''
+    Build the WSGI environ of an ASGI http request
+    :param scope: ASGI scope of the request
+    :param body: file like object of the request body
+    :return: dict of WSGI environ
+    '''
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('127.0.0.1', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        # repeated headers are folded in a single comma separated value
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class AsgiApp(object):
+    def __init__(self, app, workers=None, reconciler=False):
+        '''
+        :param app: Flask app of the REST API, see server.create_app
+        :param workers: Number of threads that run the views
+        :param reconciler: If True start the drift reconciler on server startup
+        '''
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=workers or get_option('workers', 'asgi') or 32,
+                                           thread_name_prefix='asgi')
+        self.reconciler = reconciler
+
+    async def lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await loop.run_in_executor(self.executor, server.start_background, self.app, self.reconciler)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await loop.run_in_executor(self.executor, server.stop_background, self.app)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        body = SpooledTemporaryFile(max_size=MAX_BODY_IN_MEMORY)
+        while True:
+            message = await receive()
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self.run_view, wsgi_environ(scope, body), loop, send)
+        finally:
+            body.close()
+
+    def run_view(self, environ, loop, send):
+        # runs on a thread of the pool, the messages are sent on the loop
+        def send_message(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = []
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [int(status.split(' ', 1)[0]),
+                           [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]]
+
+        def start():
+            if not started:
+                started.append(True)
+                send_message({'type': 'http.response.start', 'status': response[0], 'headers': response[1]})
+
+        result = self.app(environ, start_response)
+        try:
+            for data in result:
+                start()
+                if data:
+                    send_message({'type': 'http.response.body', 'body': data, 'more_body': True})
+            start()
+            send_message({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+def create_app(manage_vlans=None, workers=None, reconciler=None):
+    '''
+    Create the ASGI app of the REST API
+    :param manage_vlans: ManageVlans object, defaults to the configured
+                         provider created on first request
+    :param workers: Number of threads that run the views
+    :param reconciler: If True start the drift reconciler on server startup,
+                       defaults to reconciler enabled option
+    :return: AsgiApp object
+    '''
+    if reconciler is None:
+        reconciler = bool(get_option('enabled', 'reconciler'))
+    return AsgiApp(server.create_app(manage_vlans), workers=workers, reconciler=reconciler)
+
+
+def main():
+    # the ASGI server is required only to serve the app in async mode
+    import uvicorn
+
+    setup_logging()
+    uvicorn.run(create_app(), host=get_option('host', 'asgi') or '0.0.0.0',  #nosec
+                port=get_option('port', 'asgi') or 8000, lifespan='on')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Parse and validate bulk vlan requests given as compact range
+         syntax or as newline delimited json stream.
+"""
+import json
+
+VALID_KEYS = frozenset(['name', 'vlan_id', 'description'])
+VALID_VLAN_IDS = frozenset(range(1, 1025))
+
+
+def parse_intervals(value):
+    '''
+    Parse vlan range string like '100-900,905,910-920' to intervals
+    :param value: range string
+    :return: list of tuple of first and last vlan_id of each interval
+    '''
+    intervals = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        try:
+            start = int(start)
+            end = int(end) if end else start
+        except ValueError:
+            raise ValueError(f"invalid vlan range '{part}'")
+        if start > end or start not in VALID_VLAN_IDS or end not in VALID_VLAN_IDS:
+            raise ValueError(f"invalid vlan range '{part}', vlan_id should be between 1 and 1024")
+        intervals.append((start, end))
+    return intervals
+
+
+def parse_range(value):
+    '''
+    Parse vlan range string like '100-900,905,910-920'
+    :param value: range string
+    :return: generator of vlan_id
+    '''
+    for start, end in parse_intervals(value):
+        for vlan_id in range(start, end + 1):
+            yield vlan_id
+
+
+def expand_range(body):
+    '''
+    Expand range request to vlan config
+    :param body: dict with keys 'range' (mandatory), 'name_template' and
+                 'description_template', '{id}' in templates is replaced by vlan_id
+    :return: generator of dict of vlan config
+    '''
+    unknown = set(body) - {'range', 'name_template', 'description_template'}
+    if unknown:
+        raise ValueError(f"invalid keys {', '.join(sorted(unknown))} in range request")
+    if not isinstance(body.get('range'), str):
+        raise ValueError("range key is required and should be of type string")
+
+    name_template = body.get('name_template', 'vlan{id}')
+    description_template = body.get('description_template')
+    # the templates are checked before streaming, the response status is
+    # sent with the first chunk
+    if not isinstance(name_template, str) or not name_template:
+        raise ValueError(f"invalid name_template {name_template}, should be a non empty string")
+    if description_template is not None and not isinstance(description_template, str):
+        raise ValueError(f"invalid description_template {description_template}, should be of type string")
+    # parse range before streaming so that an invalid range fails the request
+    vlan_ids = list(parse_range(body['range']))
+
+    def generate():
+        for vlan_id in vlan_ids:
+            vlan = {'vlan_id': vlan_id, 'name': name_template.replace('{id}', str(vlan_id))}
+            if description_template:
+                vlan['description'] = description_template.replace('{id}', str(vlan_id))
+            yield vlan
+
+    return generate()
+
+
+def iter_ndjson(stream):
+    '''
+    Read vlan config from newline delimited json stream
+    :param stream: file like object of bytes
+    :return: generator of tuple of line number and dict of vlan config or error string
+    '''
+    for index, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError as e:
+            yield index, f"invalid json at line {index}: {e}"
+
+
+def validate_vlan(vlan):
+    '''
+    Validate vlan config dict
+    :param vlan: dict of vlan config
+    :return: error string, None if valid
+    '''
+    if not isinstance(vlan, dict):
+        return f"invalid vlan config {vlan}, should be of type dict"
+    unknown = vlan.keys() - VALID_KEYS
+    if unknown:
+        return "invalid key '%s' in config dict %s" % (', '.join(sorted(unknown)), vlan)
+    vlan_id = vlan.get('vlan_id')
+    # bool is a subclass of int, true is not a vlan_id
+    if not isinstance(vlan_id, int) or isinstance(vlan_id, bool) or vlan_id not in VALID_VLAN_IDS:
+        return "invalid vlan_id value %s in config dict %s" % (vlan_id, vlan)
+    if not vlan.get('name') or not isinstance(vlan['name'], str):
+        return f"name key is required in config dict {vlan}, should be of type string"
+    if vlan.get('description') is not None and not isinstance(vlan['description'], str):
+        return f"invalid description value {vlan['description']} in config dict {vlan}"
+    return None
+
+
+def chunked(items, size):
+    '''
+    Group items in lists of size
+    '''
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Write ahead log of the changes pushed to network devices. A change
+         is appended to the log in the transaction of the database update,
+         the devices are then brought to the logged state from the last change
+         acknowledged by each host. A host that missed changes, after a crash
+         or a device outage, catches up with the pending changes in bulk.
+"""
+import json
+import logging
+import threading
+import time
+
+from contextlib import ExitStack
+
+from sqlalchemy.exc import IntegrityError
+
+from config.base import get_option, setup_logging
+from database import db, get_app, ChangeLog, ChangeLogAck, ChangeLogSeq, Vlans
+from configurator.provider import manage
+from configurator.provider.fanout import FanoutResult, HostResult
+
+log = logging.getLogger(__name__)
+
+
+def next_seq():
+    '''
+    Increment the sequence of the change log in the transaction of the
+    caller. The counter row is locked until commit, so the changes are
+    committed in sequence order and a rolled back change leaves no gap.
+    :return: The sequence number of the change
+    '''
+    table = ChangeLogSeq.__table__
+    if not db.session.execute(table.update().where(table.c.id == 1).values(seq=table.c.seq + 1)).rowcount:
+        # table created without the counter row
+        db.session.execute(table.insert().values(id=1, seq=1))
+    return db.session.execute(db.select([table.c.seq]).where(table.c.id == 1)).scalar()
+
+
+def append(config, action, resource='vlans'):
+    '''
+    Append a change to the log, the caller commits it along with the
+    database update of the change
+    :param config: list of dict of resource config
+    :param action: The value of action can be merged, replaced, deleted, overridden.
+    :param resource: Name of the resource
+    :return: The sequence number of the change
+    '''
+    seq = next_seq()
+    db.session.add(ChangeLog(seq=seq, resource=resource, action=action, config=json.dumps(config),
+                             created=time.time()))
+    return seq
+
+
+class ChangeReplayer(object):
+    def __init__(self, manage_vlans=None, app=None, interval=None, batch_size=None):
+        '''
+        :param manage_vlans: ManageVlans object used to push the changes on device
+        :param app: Flask app of the database, defaults to the app of the process
+        :param interval: Seconds between background replays of the hosts behind the log
+        :param batch_size: Number of changes applied on the hosts in a single push
+        '''
+        self.manage_vlans = manage_vlans or manage.ManageVlans()
+        self.app = app
+        self.interval = interval or get_option('interval', 'changelog') or 30
+        self.batch_size = batch_size or get_option('batch_size', 'changelog') or 500
+        # a host is replayed by one thread at a time, from reading its
+        # acknowledged sequence to acknowledging the pushed changes
+        self.host_locks = manage.HostLocks()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _in_context(self, func, *args):
+        with (self.app or get_app()).app_context():
+            try:
+                return func(*args)
+            finally:
+                db.session.remove()
+
+    @staticmethod
+    def _read_log(hosts):
+        # acknowledged sequence of each host, None if never acknowledged,
+        # the first sequence kept in log and the last sequence
+        acks = dict(db.session.query(ChangeLogAck.host, ChangeLogAck.seq))
+        head = db.session.query(ChangeLogSeq.seq).filter(ChangeLogSeq.id == 1).scalar() or 0
+        first = db.session.query(db.func.min(ChangeLog.seq)).scalar() or head + 1
+        return {host: acks.get(host) for host in hosts}, first, head
+
+    @staticmethod
+    def _read_changes(after, head, limit):
+        entries = ChangeLog.query.filter(ChangeLog.seq > after, ChangeLog.seq <= head) \
+            .order_by(ChangeLog.seq).limit(limit)
+        return [(entry.seq, (entry.resource, json.loads(entry.config), entry.action)) for entry in entries]
+
+    @staticmethod
+    def _read_snapshot():
+        # the vlans in database and the last change included in them
+        head = db.session.query(ChangeLogSeq.seq).filter(ChangeLogSeq.id == 1).scalar() or 0
+        config = [{"vlan_id": vlan.vlan_id, "name": vlan.name, "description": vlan.description}
+                  for vlan in Vlans.query.all()]
+        return head, config
+
+    @staticmethod
+    def _ack(hosts, seq):
+        # the acknowledged sequence of a host only moves forward
+        table = ChangeLogAck.__table__
+        existing = set(host for host, in db.session.query(ChangeLogAck.host).filter(ChangeLogAck.host.in_(hosts)))
+        if existing:
+            db.session.execute(table.update().where(table.c.host.in_(existing)).where(table.c.seq < seq)
+                               .values(seq=seq))
+        created = [{'host': host, 'seq': seq} for host in hosts if host not in existing]
+        if created:
+            db.session.execute(table.insert(), created)
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            # acknowledged by another process meanwhile, the next replay
+            # pushes the changes again with no effect on the hosts
+            db.session.rollback()
+            log.info(f"failed to acknowledge change {seq} on hosts {hosts} with error {e.orig}")
+
+    def _record(self, result, seq, results):
+        # merge the result of each host, the hosts that succeeded are
+        # acknowledged at seq and continue with the next changes
+        for host, host_result in result.results.items():
+            previous = results.get(host)
+            if previous:
+                host_result.changed = host_result.changed or previous.changed
+                host_result.latency += previous.latency
+            results[host] = host_result
+        succeeded = sorted(host for host, host_result in result.results.items() if not host_result.failed)
+        if succeeded:
+            self._in_context(self._ack, succeeded, seq)
+        return succeeded
+
+    def _catch_up(self, hosts, ack, first, head, results):
+        if ack is None or ack < first - 1:
+            # the log does not have all the changes since the last
+            # acknowledged one, the known state of the hosts is stale, read
+            # it from the hosts and push the complete database state
+            gathered = self.manage_vlans.get_vlans(hosts=hosts, cached=False)
+            results.update({host: host_result for host, host_result in gathered.results.items()
+                            if host_result.failed})
+            hosts = sorted(gathered.data)
+            if not hosts:
+                return
+            ack, config = self._in_context(self._read_snapshot)
+            log.info(f"hosts {hosts} are behind the change log, override with database state at change {ack}")
+            hosts = self._record(self.manage_vlans.edit_vlans(config, action='overridden', hosts=hosts), ack, results)
+
+        while hosts and ack < head:
+            changes = self._in_context(self._read_changes, ack, head, self.batch_size)
+            if not changes:
+                break
+            # the changes are folded into a single edit of each host, a
+            # change already applied on the host leaves it unchanged
+            result = self.manage_vlans.edit_resources([change for _, change in changes], hosts=hosts)
+            log.info(f"replayed changes {ack + 1} to {changes[-1][0]} on hosts {hosts}")
+            ack = changes[-1][0]
+            hosts = self._record(result, ack, results)
+
+    @staticmethod
+    def _group(acks):
+        # hosts at the same acknowledged change are pushed together
+        groups = {}
+        for host in sorted(acks):
+            groups.setdefault(acks[host], []).append(host)
+        return groups
+
+    def replay(self, hosts=None, until=None, wait=True):
+        '''
+        Push the changes logged after the last acknowledged change of each
+        host, the hosts at the same change are pushed together. Only the
+        hosts of the group being pushed are locked.
+        :param hosts: list of host names, defaults to all hosts in inventory
+        :param until: Last change to push, defaults to the last change in log.
+                      A write pushes the changes up to its own change.
+        :param wait: If False the hosts being replayed by another thread are skipped
+        :return: FanoutResult object of the replayed hosts, the result of a host
+                 covers all the pushes of the replay
+        '''
+        hosts = sorted(set(hosts or self.manage_vlans.hosts))
+        acks, _, head = self._in_context(self._read_log, hosts)
+        if until is not None:
+            head = min(head, until)
+        results = {}
+        # the hosts already at the last change are not locked
+        replayed = [host for host, ack in acks.items() if ack is not None and ack >= head]
+        for ack, group in self._group(acks).items():
+            if ack is not None and ack >= head:
+                continue
+            with ExitStack() as stack:
+                locked = []
+                for host in group:
+                    lock = self.host_locks.get(host)
+                    if lock.acquire(blocking=wait):
+                        stack.callback(lock.release)
+                        locked.append(host)
+                if not locked:
+                    continue
+                # read again under the locks, another thread may have
+                # pushed the hosts meanwhile
+                acks, first, head = self._in_context(self._read_log, locked)
+                if until is not None:
+                    head = min(head, until)
+                for ack, subgroup in self._group(acks).items():
+                    self._catch_up(subgroup, ack, first, head, results)
+                replayed.extend(locked)
+        return FanoutResult({host: results.get(host) or HostResult(host) for host in sorted(replayed)})
+
+    @staticmethod
+    def _behind(hosts):
+        acks, _, head = ChangeReplayer._read_log(hosts)
+        return [host for host in hosts if acks[host] is None or acks[host] < head]
+
+    def behind(self, hosts=None):
+        '''
+        :param hosts: list of host names, defaults to all hosts in inventory
+        :return: list of the hosts that miss changes of the log, the replay
+                 brings them to the database state
+        '''
+        return self._in_context(self._behind, hosts or self.manage_vlans.hosts)
+
+    @staticmethod
+    def _truncate(hosts):
+        acks = [seq for host, seq in db.session.query(ChangeLogAck.host, ChangeLogAck.seq) if host in hosts]
+        if not acks:
+            return 0
+        deleted = ChangeLog.query.filter(ChangeLog.seq <= min(acks)).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def truncate(self):
+        '''
+        Delete the changes acknowledged by all the hosts in inventory, a
+        host without acknowledged change is overridden with database state
+        on replay and does not need the log.
+        :return: Number of changes deleted
+        '''
+        deleted = self._in_context(self._truncate, set(self.manage_vlans.hosts))
+        if deleted:
+            log.debug(f"deleted {deleted} changes acknowledged by all hosts from change log")
+        return deleted
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                # the hosts replayed by a write meanwhile are skipped
+                result = self.replay(wait=False)
+                if result.failed:
+                    log.error(f"failed to replay change log on hosts {result.failed}")
+                self.truncate()
+            except Exception as e:
+                log.error(f"failed to replay change log with error {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='change-replayer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == '__main__':
+    setup_logging()
+    ChangeReplayer().run()
@@ -9,28 +9,42 @@ import logging
 import yaml
 
 log = logging.getLogger(__name__)
-logging.basicConfig(level=os.environ.get("LOGLEVEL", "DEBUG"),
-                    format='%(process)d-%(levelname)s-%(message)s')
 
+CONFIG_DATA = None
 
-config_file_path = None
-config_dir_path = None
 
-# read config file path from environment variable
-# directory path that has configurator.cfg file
-config_dir_path = os.environ.get('CONFIGURATOR_CFG')
-if config_dir_path:
-    config_file_path = os.path.join(config_dir_path, 'configurator.cfg')
+def setup_logging():
+    '''
+    Configure the root logger, called by the entry point of each program
+    '''
+    logging.basicConfig(level=os.environ.get("LOGLEVEL", "DEBUG"),
+                        format='%(process)d-%(levelname)s-%(message)s')
+
 
-# read default config file
-if not config_file_path:
-    config_dir_path = os.path.dirname(os.path.realpath(__file__))
-    config_file_path = os.path.join(config_dir_path, 'configurator.cfg')
+def get_config_file_path():
+    # read config file path from environment variable
+    # directory path that has configurator.cfg file
+    config_dir_path = os.environ.get('CONFIGURATOR_CFG')
 
-log.info("loaded config file from path %s" % config_file_path)
+    # read default config file
+    if not config_dir_path:
+        config_dir_path = os.path.dirname(os.path.realpath(__file__))
+    return os.path.join(config_dir_path, 'configurator.cfg')
 
-with open(config_file_path) as fp:
-    CONFIG_DATA = yaml.safe_load(fp)
+
+def load_config():
+    '''
+    Read the config file on first use, the config is cached for the
+    lifetime of the process.
+    :return: dict of config sections
+    '''
+    global CONFIG_DATA
+    if CONFIG_DATA is None:
+        config_file_path = get_config_file_path()
+        with open(config_file_path) as fp:
+            CONFIG_DATA = yaml.safe_load(fp) or {}
+        log.info("loaded config file from path %s" % config_file_path)
+    return CONFIG_DATA
 
 
 def get_option(name, section="defaults"):
@@ -41,6 +55,24 @@ def get_option(name, section="defaults"):
     :return: Value of config parameter
     '''
     try:
-        return CONFIG_DATA.get(section, {})[name]
+        return load_config().get(section, {})[name]
     except KeyError:
         Exception("Unable to fetch config variable %s from section %s" % (name, section))
+
+
+def get_db_url():
+    '''
+    Get the database url, the 'url' option in database section takes
+    precedence over the individual connection options.
+    :return: database url string
+    '''
+    url = get_option('url', 'database')
+    if url:
+        return url
+
+    dialect = get_option('dialect', 'database')
+    user = get_option('user', 'database')
+    password = get_option('password', 'database')
+    host = get_option('host', 'database')
+    db_name = get_option('name', 'database')
+    return f'{dialect}://{user}:{password}@{host}/{db_name}'
@@ -6,67 +6,216 @@ Purpose: A simple Flask app that manages vlan configuration on network device.
 """
 import os
 import json
+import threading
 
-from flask import Flask
+from flask import Flask, current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
-from flask_script import Manager
-from flask_migrate import Migrate, MigrateCommand
 from sqlalchemy.exc import IntegrityError
 
-from config.base import get_option
+from config.base import get_db_url, setup_logging
+from metrics import instrument_engine
 
+# bound to the app in create_app, nothing is connected at import
+db = SQLAlchemy()
 
-app = Flask(__name__)
+_app = None
+_app_lock = threading.Lock()
 
-# Initialize a MySQL database towards the other container
-dialect = get_option('dialect', 'database')
-user = get_option('user', 'database')
-password = get_option('password', 'database')
-host = get_option('host', 'database')
-db_name = get_option('name', 'database')
-db_url = f'{dialect}://{user}:{password}@{host}/{db_name}'
 
-app.config['SQLALCHEMY_DATABASE_URI'] = db_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+def create_app():
+    '''
+    Create the Flask app bound to the database, the database connection is
+    opened and the tables are created on first use.
+    :return: Flask app object
+    '''
+    app = Flask(__name__)
 
-db = SQLAlchemy(app)
-db.create_all()
+    # Initialize a MySQL database towards the other container
+    app.config['SQLALCHEMY_DATABASE_URI'] = get_db_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+    with app.app_context():
+        # creating the engine does not connect to the database
+        instrument_engine(db.engine, 'app')
+
+    @app.before_first_request
+    def create_tables():
+        db.create_all()
+
+    return app
+
+
+def get_app():
+    '''
+    Get the app of current context, outside of an app context the
+    default app of the process is created on first use.
+    :return: Flask app object
+    '''
+    global _app
+    if has_app_context():
+        return current_app._get_current_object()
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+    return _app
+
+
+class VersionConflict(Exception):
+    """
+    The record is changed or deleted since the version given by the client
+    """
+    pass
 
-migrate = Migrate(app, db)
-manager = Manager(app)
-manager.add_command('db', MigrateCommand)
 
 class Vlans(db.Model):
     vlan_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     description = db.Column(db.String(255))
+    # incremented on every write, exposed as ETag of the vlan
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     def __repr__(self):
-        return "<Vlans(vlan_id='%d', name='%s', description='%s')>" % (self.vlan_id, self.name, self.description)
+        return "<Vlans(vlan_id='%d', name='%s', description='%s', version='%s')>" % (
+            self.vlan_id, self.name, self.description, self.version)
 
 
-def update_vlans_db(config, action='add'):
-    # update the vlan config in database
-    for vlan_config in config:
-        if action == 'add':
-            vl = Vlans(vlan_id=vlan_config['vlan_id'], name=vlan_config.get('name'),
-                       description=vlan_config.get('description'))
-            db.session.add(vl)
-        elif action == 'delete':
-            vlan = Vlans.query.get(vlan_config['vlan_id'])
-            if vlan:
-                db.session.delete(vlan)
-        elif action == 'update':
-            vlan = Vlans.query.get(vlan_config['vlan_id'])
+class Interfaces(db.Model):
+    name = db.Column(db.String(255), primary_key=True)
+    description = db.Column(db.String(255))
+    enabled = db.Column(db.Boolean)
+    mtu = db.Column(db.Integer)
+    speed = db.Column(db.String(32))
+
+    def __repr__(self):
+        return "<Interfaces(name='%s', description='%s', enabled='%s', mtu='%s', speed='%s')>" % (
+            self.name, self.description, self.enabled, self.mtu, self.speed)
+
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    # assigned from ChangeLogSeq, gapless and in commit order
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    resource = db.Column(db.String(64), nullable=False)
+    action = db.Column(db.String(16), nullable=False)
+    # json list of dict of resource config
+    config = db.Column(db.Text, nullable=False)
+    created = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return "<ChangeLog(seq='%d', resource='%s', action='%s', config='%s')>" % (
+            self.seq, self.resource, self.action, self.config)
+
+
+class ChangeLogSeq(db.Model):
+    __tablename__ = 'change_log_seq'
+    # single row, its lock orders the writers of the change log
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    seq = db.Column(db.Integer, nullable=False, default=0)
+
+
+# the counter row is created with the table
+db.event.listen(ChangeLogSeq.__table__, 'after_create',
+                db.DDL("INSERT INTO change_log_seq (id, seq) VALUES (1, 0)"))
+
+
+class ChangeLogAck(db.Model):
+    __tablename__ = 'change_log_acks'
+    host = db.Column(db.String(255), primary_key=True)
+    # last change applied on the host
+    seq = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return "<ChangeLogAck(host='%s', seq='%d')>" % (self.host, self.seq)
+
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    # change counter of a table, bumped in the transaction of every write
+    # of the app and of the synchronizer, the ETag of the vlans listing
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+# the counter rows are created with the table
+db.event.listen(TableVersion.__table__, 'after_create',
+                db.DDL("INSERT INTO table_versions (name, version) VALUES ('vlans', 0)"))
+
+
+def bump_table_version(name):
+    # a table without counter row is left as is, the lock of the row
+    # orders the writers of the table until commit
+    table = TableVersion.__table__
+    db.session.execute(table.update().where(table.c.name == name).values(version=table.c.version + 1))
+
+
+def _update_vlans(mappings, versions=None):
+    # bump the version in the same statement, with versions the row is
+    # updated only if it still has the version given by the client.
+    table = Vlans.__table__
+    groups = {}
+    for mapping in mappings:
+        groups.setdefault(tuple(sorted(mapping)), []).append(mapping)
+
+    for keys, group in groups.items():
+        query = table.update().where(table.c.vlan_id == db.bindparam('b_vlan_id'))
+        query = query.values(version=table.c.version + 1,
+                             **{key: db.bindparam('b_' + key) for key in keys if key != 'vlan_id'})
+        params = [{'b_' + key: value for key, value in mapping.items()} for mapping in group]
+        if versions is not None:
+            query = query.where(table.c.version == db.bindparam('b_expected_version'))
+            for param in params:
+                param['b_expected_version'] = versions[param['b_vlan_id']]
+        result = db.session.execute(query, params)
+        if versions is not None and result.rowcount != len(group):
+            raise VersionConflict(f"vlan {', '.join(str(mapping['vlan_id']) for mapping in group)} "
+                                  f"changed since the given version")
+
+
+def update_vlans_db(config, action='add', versions=None):
+    # update the vlan config in database with set based statements,
+    # the changes are committed by the caller in a single transaction.
+    # versions is dict of vlan_id to the version expected in database,
+    # VersionConflict is raised if any of the vlans has another version.
+    if not config:
+        return
+
+    vlan_ids = [vlan_config['vlan_id'] for vlan_config in config]
+    if action == 'add':
+        db.session.bulk_insert_mappings(Vlans, [
+            {'vlan_id': vlan_config['vlan_id'], 'name': vlan_config.get('name'),
+             'description': vlan_config.get('description')} for vlan_config in config])
+    elif action == 'delete':
+        query = Vlans.query.filter(Vlans.vlan_id.in_(vlan_ids))
+        if versions is not None:
+            query = query.filter(db.or_(*[db.and_(Vlans.vlan_id == vlan_id, Vlans.version == versions[vlan_id])
+                                          for vlan_id in vlan_ids]))
+        deleted = query.delete(synchronize_session=False)
+        if versions is not None and deleted != len(set(vlan_ids)):
+            raise VersionConflict(f"vlan {', '.join(str(vlan_id) for vlan_id in vlan_ids)} "
+                                  f"changed since the given version")
+    elif action == 'update':
+        existing = {vlan.vlan_id: vlan for vlan in Vlans.query.filter(Vlans.vlan_id.in_(vlan_ids))}
+        update = []
+        create = []
+        for vlan_config in config:
+            vlan = existing.get(vlan_config['vlan_id'])
             if vlan:
-                vlan.name = vlan_config['name']
+                mapping = {'vlan_id': vlan_config['vlan_id'], 'name': vlan_config['name']}
                 description = vlan_config.get('description')
                 if description:
-                    vlan.description = description
+                    mapping['description'] = description
+                update.append(mapping)
+            elif versions is not None:
+                raise VersionConflict(f"vlan {vlan_config['vlan_id']} does not exist")
             else:
-                vl = Vlans(vlan_id=vlan_config['vlan_id'], name=vlan_config.get('name'),
-                           description=vlan_config.get('description'))
-                db.session.add(vl)
+                create.append({'vlan_id': vlan_config['vlan_id'], 'name': vlan_config.get('name'),
+                               'description': vlan_config.get('description')})
+        if update:
+            _update_vlans(update, versions)
+        if create:
+            db.session.bulk_insert_mappings(Vlans, create)
+    bump_table_version(Vlans.__tablename__)
 
 
 def seed_data(seed_path, action='create'):
@@ -78,23 +227,37 @@ def seed_data(seed_path, action='create'):
             try:
                 db.session.add(Vlans(vlan_id=item['vlan_id'], name=item.get('name', ''),
                                      description=item.get('description', '')))
-                app.logger.debug(f"added seed data in db: {data}")
+                current_app.logger.debug(f"added seed data in db: {data}")
             except IntegrityError:
                 pass
         elif action == 'delete':
             vlan_record = db.session.query(Vlans).get(item['vlan_id'])
             if vlan_record:
                 db.session.delete(vlan_record)
-                app.logger.debug(f"deleted seed data in db: {item}")
+                current_app.logger.debug(f"deleted seed data in db: {item}")
             else:
-                app.logger.debug(f"record not found in db: {item}")
+                current_app.logger.debug(f"record not found in db: {item}")
         else:
             raise Exception(f"Invalid seed action {action}")
+    bump_table_version(Vlans.__tablename__)
 
 
 # seed_data("src/configurator/data/initial.json", action="delete")
 # seed_data("src/configurator/data/initial.json", action="create")
 
 
-if __name__ == '__main__':
+def main():
+    # the migration commands are wired only when run as a program
+    from flask_script import Manager
+    from flask_migrate import Migrate, MigrateCommand
+
+    app = create_app()
+    Migrate(app, db)
+    manager = Manager(app)
+    manager.add_command('db', MigrateCommand)
     manager.run()
+
+
+if __name__ == '__main__':
+    setup_logging()
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Report the divergence of the vlan config of every device from the
+         database. The vlans of all the hosts are gathered in parallel in a
+         single pass, hosts with identical config are grouped on the hash of
+         their state and each group is compared with the database once.
+
+Usage: python drift.py [--hosts host1,host2] [--cached] [--output report.json]
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+from config.base import setup_logging
+from configurator.provider import manage
+from configurator.provider.vlanstate import VlanState
+from reconciler import config_digest, get_db_config
+
+VLAN_FIELDS = ('vlan_id', 'name', 'description')
+
+log = logging.getLogger(__name__)
+
+
+def vlan_state(config):
+    '''
+    :param config: list of dict of vlan config
+    :return: VlanState object, an empty description is same as no description
+    '''
+    # the database and the devices differ in how an unset description is
+    # stored, '' and None compare equal
+    return VlanState((item['vlan_id'], item.get('name'), item.get('description') or None) for item in config or [])
+
+
+def group_report(db_state, state, hosts):
+    '''
+    :param db_state: VlanState object of database
+    :param state: VlanState object shared by the hosts
+    :param hosts: list of host names with the state
+    :return: dict of the divergence of the group from database
+    '''
+    extra, changed, missing = [[dict(zip(VLAN_FIELDS, record)) for record in records]
+                               for records in db_state.diff(state)]
+    return {
+        'digest': config_digest(state.to_config()),
+        'hosts': sorted(hosts),
+        'vlans': len(state),
+        'in_sync': not (extra or changed or missing),
+        # vlans on the device and not in database, or different from database
+        'extra': extra,
+        'changed': changed,
+        # vlans in database and not on the device
+        'missing': missing,
+    }
+
+
+def drift_report(manage_vlans=None, app=None, hosts=None, cached=False):
+    '''
+    Compare the vlan config of each host with the database
+    :param manage_vlans: ManageVlans object, defaults to the configured provider
+    :param app: Flask app, defaults to the app of the process
+    :param hosts: list of host names, defaults to all hosts in inventory
+    :param cached: If True use the vlans from device state cache when available,
+                   else fetch them from every device
+    :return: dict of the report, the groups of hosts with the same config are
+             sorted on the number of hosts
+    '''
+    start = time.perf_counter()
+    manage_vlans = manage_vlans or manage.ManageVlans()
+    db_state = vlan_state(get_db_config(app))
+    result = manage_vlans.get_vlans(hosts=hosts, cached=cached)
+
+    # VlanState hashes on its digest, the identical configs fall in one
+    # group without comparing the hosts pairwise
+    groups = {}
+    for host, host_result in result.results.items():
+        if not host_result.failed:
+            groups.setdefault(vlan_state(host_result.data), []).append(host)
+            # only the state of each distinct config is kept
+            host_result.data = None
+
+    reports = sorted((group_report(db_state, state, group_hosts) for state, group_hosts in groups.items()),
+                     key=lambda group: (-len(group['hosts']), group['hosts']))
+    diverged = sorted(host for group in reports if not group['in_sync'] for host in group['hosts'])
+    log.info(f"{len(diverged)} of {len(result.results)} hosts diverge from database in {len(reports)} "
+             f"distinct configs, {len(result.failed)} hosts failed")
+    return {
+        # digest of the normalized state, same as the digest of the hosts in sync
+        'db': {'digest': config_digest(db_state.to_config()), 'vlans': len(db_state)},
+        'hosts': len(result.results),
+        'in_sync': sorted(host for group in reports if group['in_sync'] for host in group['hosts']),
+        'diverged': diverged,
+        'failed': result.failed,
+        'groups': reports,
+        'seconds': round(time.perf_counter() - start, 6),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', help='comma separated host names, defaults to all hosts in inventory')
+    parser.add_argument('--cached', action='store_true', help='use the vlans in device state cache when available')
+    parser.add_argument('--output', help='path of json report file, default is stdout')
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    report = drift_report(hosts=args.hosts.split(',') if args.hosts else None, cached=args.cached)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output)
+    else:
+        print(output)
+    # non zero exit status if any of the hosts diverged or failed
+    return 1 if report['diverged'] or report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Apply database changes on network devices asynchronously. Jobs
+         queued for the same device are coalesced into a single push of
+         the vlans they changed.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from collections import OrderedDict, deque
+
+from database import db, get_app, Vlans
+
+log = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class Job(object):
+    def __init__(self, config, action, hosts):
+        self.id = uuid.uuid4().hex
+        self.config = config
+        self.action = action
+        self.hosts = list(hosts)
+        self.status = PENDING
+        self.created = time.time()
+        self.finished = None
+        # dict of host name to result dict of the push on that host
+        self.results = {}
+
+    def __repr__(self):
+        return "<Job(id='%s', action='%s', status='%s')>" % (self.id, self.action, self.status)
+
+    def to_dict(self):
+        return {'id': self.id, 'status': self.status, 'action': self.action, 'config': self.config,
+                'created': self.created, 'finished': self.finished, 'hosts': self.results}
+
+
+class JobQueue(object):
+    def __init__(self, manage_vlans, workers=4, max_jobs=1000, app=None):
+        '''
+        :param manage_vlans: ManageVlans object used to push config on device
+        :param app: Flask app to read the database state, defaults to the app of the process
+        :param workers: Number of worker threads, each worker pushes to one device at a time
+        :param max_jobs: Number of jobs kept for status query, oldest finished jobs are dropped
+        '''
+        self.manage_vlans = manage_vlans
+        self.app = app
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self._pending = {}
+        self._ready = deque()
+        self._running = set()
+        self._cond = threading.Condition()
+        self._threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, config, action, hosts=None):
+        '''
+        Queue a device push for a change already committed in database
+        :param config: list of dict of vlan config that is changed
+        :param action: The action of the change, for job status only
+        :param hosts: list of host names, defaults to all hosts in inventory
+        :return: Job object
+        '''
+        job = Job(config, action, hosts or self.manage_vlans.hosts)
+        with self._cond:
+            self.jobs[job.id] = job
+            self._evict()
+            for host in job.hosts:
+                self._pending.setdefault(host, []).append(job)
+                if host not in self._running and host not in self._ready:
+                    self._ready.append(host)
+            self._cond.notify_all()
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self.jobs.get(job_id)
+
+    def _evict(self):
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].status in (SUCCEEDED, FAILED):
+                del self.jobs[job_id]
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                host = self._ready.popleft()
+                jobs = self._pending.pop(host, [])
+                self._running.add(host)
+                for job in jobs:
+                    job.status = RUNNING
+
+            try:
+                self._push(host, jobs)
+            finally:
+                with self._cond:
+                    self._running.discard(host)
+                    if host in self._pending:
+                        self._ready.append(host)
+                        self._cond.notify_all()
+
+    def _read_changes(self, jobs):
+        # the changes of the jobs are already committed in database, in
+        # order. The rows of the changed vlans are their final state
+        # whatever the order the jobs were queued in.
+        vlan_ids = sorted(set(item['vlan_id'] for job in jobs for item in job.config))
+        with (self.app or get_app()).app_context():
+            try:
+                rows = {vlan.vlan_id: {'vlan_id': vlan.vlan_id, 'name': vlan.name, 'description': vlan.description}
+                        for vlan in Vlans.query.filter(Vlans.vlan_id.in_(vlan_ids))}
+            finally:
+                db.session.remove()
+
+        changes = []
+        deleted = [{'vlan_id': vlan_id} for vlan_id in vlan_ids if vlan_id not in rows]
+        if deleted:
+            changes.append(('vlans', deleted, 'deleted'))
+        if rows:
+            changes.append(('vlans', [rows[vlan_id] for vlan_id in sorted(rows)], 'replaced'))
+        return changes
+
+    def _push(self, host, jobs):
+        # a single push applies the changed vlans of all the queued jobs,
+        # the vlans not changed by the jobs are left to the reconciler.
+        try:
+            changes = self._read_changes(jobs)
+            result = self.manage_vlans.edit_resources(changes, hosts=[host]).results[host].to_dict()
+        except Exception as e:
+            result = {'changed': False, 'failed': True, 'latency': 0.0, 'error': str(e)}
+
+        log.info(f"pushed {len(jobs)} coalesced jobs to host {host}: {result}")
+        with self._cond:
+            for job in jobs:
+                job.results[host] = result
+                if len(job.results) == len(job.hosts):
+                    failed = any(item['failed'] for item in job.results.values())
+                    job.status = FAILED if failed else SUCCEEDED
+                    job.finished = time.time()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Paginated, filtered and projected listing of vlans with table
+         level ETag, shared by the sync and the async app.
+"""
+import hashlib
+
+from urllib.parse import urlencode
+
+from werkzeug.http import parse_etags
+
+from bulk import parse_intervals
+from database import db, TableVersion, Vlans
+
+VLAN_FIELDS = ('vlan_id', 'name', 'description')
+
+
+class VlanQuery(object):
+    def __init__(self, fields=None, after=None, limit=None, name=None, vlan_range=None):
+        '''
+        :param fields: list of fields in response, defaults to all the fields
+        :param after: Cursor, only the vlans with higher vlan_id are listed
+        :param limit: Maximum number of vlans in response, defaults to all
+        :param name: Name of the vlans, '*' matches any characters
+        :param vlan_range: Range of vlan_id like '100-900,905'
+        '''
+        self.fields = tuple(fields or VLAN_FIELDS)
+        self.after = after
+        self.limit = limit
+        self.name = name
+        self.vlan_range = vlan_range
+        self.intervals = parse_intervals(vlan_range) if vlan_range else None
+
+    @classmethod
+    def from_args(cls, args):
+        '''
+        Build the query from the url arguments fields, after, limit, name and range
+        :param args: dict of url argument to value
+        :return: VlanQuery object
+        :raises ValueError: if an argument is invalid
+        '''
+        fields = None
+        if args.get('fields'):
+            fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+            unknown = [field for field in fields if field not in VLAN_FIELDS]
+            if unknown or not fields:
+                raise ValueError(f"invalid fields {args['fields']}, valid fields are {', '.join(VLAN_FIELDS)}")
+            # the cursor of the next page is the vlan_id
+            fields = ['vlan_id'] + [field for field in dict.fromkeys(fields) if field != 'vlan_id']
+
+        after = limit = None
+        try:
+            if args.get('after'):
+                after = int(args['after'])
+            if args.get('limit'):
+                limit = int(args['limit'])
+        except ValueError:
+            raise ValueError(f"after and limit should be integers, got {args.get('after')} and {args.get('limit')}")
+        if limit is not None and limit < 1:
+            raise ValueError(f"invalid limit {limit}, limit should be greater than 0")
+
+        return cls(fields=fields, after=after, limit=limit, name=args.get('name') or None,
+                   vlan_range=args.get('range') or None)
+
+    def args(self, after=None):
+        # url arguments of the query, with after as cursor of the next page
+        args = {}
+        if self.fields != VLAN_FIELDS:
+            args['fields'] = ','.join(self.fields)
+        if self.name:
+            args['name'] = self.name
+        if self.vlan_range:
+            args['range'] = self.vlan_range
+        if after is not None:
+            args['after'] = after
+        elif self.after is not None:
+            args['after'] = self.after
+        if self.limit:
+            args['limit'] = self.limit
+        return args
+
+    def statement(self):
+        columns = [Vlans.__table__.columns[field] for field in self.fields]
+        query = db.select(columns).order_by(Vlans.vlan_id)
+        if self.after is not None:
+            query = query.where(Vlans.vlan_id > self.after)
+        if self.name:
+            if '*' in self.name:
+                pattern = self.name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('*', '%')
+                query = query.where(Vlans.name.like(pattern, escape='\\'))
+            else:
+                query = query.where(Vlans.name == self.name)
+        if self.intervals:
+            query = query.where(db.or_(*[Vlans.vlan_id.between(start, end) for start, end in self.intervals]))
+        if self.limit:
+            # one more row tells if there is a next page
+            query = query.limit(self.limit + 1)
+        return query
+
+
+def list_vlans(query):
+    '''
+    Fetch a page of vlans, only the fields of the query are read from database
+    :param query: VlanQuery object
+    :return: tuple of list of dict of vlan config and the cursor of next
+             page, None if it is the last page
+    '''
+    rows = db.session.execute(query.statement()).fetchall()
+    after = None
+    if query.limit and len(rows) > query.limit:
+        rows = rows[:query.limit]
+        after = rows[-1][0]
+    return [dict(zip(query.fields, row)) for row in rows], after
+
+
+def table_checksum():
+    # hash of the rows, for a database without the change counter of the
+    # table. The versions alone do not identify the content, a vlan deleted
+    # and created again has the same vlan_id and version with another name.
+    digest = hashlib.sha1()
+    rows = db.session.execute(db.select([Vlans.vlan_id, Vlans.version, Vlans.name, Vlans.description])
+                              .order_by(Vlans.vlan_id))
+    for row in rows:
+        digest.update(repr(tuple(row)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def table_version():
+    '''
+    Version of the vlans table, a single row read instead of a scan
+    :return: The change counter of the table, the checksum of its rows if the
+             database has no counter
+    '''
+    version = db.session.query(TableVersion.version).filter(TableVersion.name == Vlans.__tablename__).scalar()
+    return table_checksum() if version is None else version
+
+
+def vlans_etag(query):
+    '''
+    ETag of the vlans table for the query, computed before the page is read
+    so that a concurrent write at worst makes the next poll a full response.
+    :param query: VlanQuery object
+    :return: ETag value, without quotes
+    '''
+    digest = hashlib.sha1(f"{table_version()}?{urlencode(sorted(query.args().items()))}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def not_modified(header, etag):
+    '''
+    :param header: Value of If-None-Match header, None if not sent
+    :param etag: Current ETag value
+    :return: True if the client has the current response
+    '''
+    return header is not None and parse_etags(header).contains_weak(etag)
+
+
+def next_link(path, query, after):
+    # Link header to the next page
+    return f'<{path}?{urlencode(query.args(after=after))}>; rel="next"'
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: In-process counters and histograms exposed in Prometheus text
+         format on /metrics endpoint of the app and the synchronizer.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+class Metric(object):
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        '''
+        :param name: Name of the metric
+        :param documentation: Help text of the metric
+        :param labels: tuple of label names
+        '''
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise Exception(f"metric {self.name} expects labels {', '.join(self.labels)}, got {', '.join(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}"]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # per bucket count, the cumulative count is computed on render
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        '''
+        Observe the duration of the block in seconds, also when it raises
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        value = self._values.get(self._key(labels))
+        return sum(value[0]) if value else 0
+
+    def _render_value(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', bound))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'configurator_http_request_seconds', 'Time to serve REST requests', ('method', 'endpoint', 'status')))
+DEVICE_SECONDS = REGISTRY.register(Histogram(
+    'configurator_device_seconds', 'Time of device round trips', ('host', 'action')))
+DB_SECONDS = REGISTRY.register(Histogram(
+    'configurator_db_seconds', 'Time of database statements', ('component', 'operation')))
+DIFF_SECONDS = REGISTRY.register(Histogram(
+    'configurator_diff_seconds', 'Time to compute the delta of a resource', ('resource',)))
+SYNC_CYCLE_SECONDS = REGISTRY.register(Histogram(
+    'configurator_sync_cycle_seconds', 'Time of synchronizer cycles', ('outcome',)))
+DEVICE_CHANGES = REGISTRY.register(Counter(
+    'configurator_device_changes_total', 'Edits that changed config on device', ('host', 'action')))
+DEVICE_FAILURES = REGISTRY.register(Counter(
+    'configurator_device_failures_total', 'Failed device operations', ('host', 'action')))
+DRIFT_CORRECTIONS = REGISTRY.register(Counter(
+    'configurator_drift_corrections_total', 'Config drift corrected on device or in database',
+    ('source', 'host')))
+
+
+def instrument_engine(engine, component):
+    '''
+    Observe the time of each statement executed by a sqlalchemy engine
+    :param engine: sqlalchemy engine
+    :param component: Name of the component that owns the engine, for example app
+    '''
+    from sqlalchemy import event
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info['metrics_start'].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'UNKNOWN'
+        DB_SECONDS.observe(time.perf_counter() - start, component=component, operation=operation)
+
+    def handle_error(exception_context):
+        # the statement failed, drop its start time
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('metrics_start'):
+            connection.info['metrics_start'].pop()
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
+
+
+def record_result(result, action):
+    '''
+    Count the changed and failed hosts of a fan out result
+    :param result: FanoutResult object
+    :param action: Name of the action, for example merged
+    '''
+    for host, host_result in result.results.items():
+        if host_result.failed:
+            DEVICE_FAILURES.inc(host=host, action=action)
+        elif host_result.changed:
+            DEVICE_CHANGES.inc(host=host, action=action)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+
+def start_http_server(port, address='0.0.0.0'):
+    '''
+    Serve /metrics in a background thread, for programs without the Flask app
+    :param port: TCP port
+    :param address: Listen address
+    :return: ThreadingHTTPServer object
+    '''
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    log.info(f"serving metrics on port {port}")
+    return server
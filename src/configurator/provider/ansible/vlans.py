@@ -4,81 +4,243 @@
 Author: Ganesh Nalawade
 Purpose: Manage editing configuration using ansible.
 """
+import logging
 import os
+import shutil
+import time
+import uuid
 
 import ansible_runner
 
-from database import app
+from config.base import get_option
+from configurator.provider.diff import compute_deltas, to_state
+from configurator.provider.inventory import parse_inventory
+from configurator.provider.resources import get_resource
+from metrics import DEVICE_SECONDS
+
+log = logging.getLogger(__name__)
+
+
+class RunEvents(object):
+    """
+    Outcome of each host of a playbook run, collected from the runner
+    events in memory instead of the artifact directory and fact cache.
+    """
+    def __init__(self, hosts):
+        self.facts = {host: {} for host in hosts}
+        self.seen = set()
+        self.changed = set()
+        self.failed = {}
+
+    def __call__(self, event):
+        data = event.get('event_data') or {}
+        host = data.get('host')
+        if host in self.facts:
+            self.seen.add(host)
+            res = data.get('res') or {}
+            if event.get('event') == 'runner_on_ok':
+                self.facts[host].update((res.get('ansible_facts') or {}).get('ansible_network_resources') or {})
+                if res.get('changed'):
+                    self.changed.add(host)
+            elif event.get('event') in ('runner_on_failed', 'runner_on_unreachable') and not data.get('ignore_errors'):
+                self.failed.setdefault(host, res.get('msg') or event['event'])
+
+        # the event is not written to artifact directory
+        return False
+
+    def error(self, host, runner):
+        '''
+        :return: error message of host, None if the run succeeded on host
+        '''
+        if host in self.failed:
+            return self.failed[host]
+        if host not in self.seen:
+            return f"no result for host, status: {runner.status}"
+        return None
 
 
 class AnsibleManageVlans(object):
     def __init__(self, private_data_dir=None):
         self.private_data_dir = private_data_dir
+        # last known resource state on device keyed on host and resource name
+        self.device_state = {}
 
         if not self.private_data_dir:
             dir_path = os.path.dirname(os.path.realpath(__file__))
             self.private_data_dir = os.path.join(dir_path, '../../../../meta/ansible')
 
-    def get_vlans(self):
+        self.hosts = parse_inventory(os.path.join(self.private_data_dir, 'inventory', 'hosts'))
+
+        # run a playbook once for all the hosts of an operation
+        multi_host = get_option('multi_host', 'ansible')
+        self.multi_host = True if multi_host is None else bool(multi_host)
+        self.forks = get_option('forks', 'ansible') or 16
+        self.strategy = get_option('strategy', 'ansible') or 'free'
+        # the artifacts of a run are removed after the run unless
+        # keep_artifacts is set, then the last runs are kept.
+        self.artifact_dir = get_option('artifact_dir', 'ansible') or os.path.join(self.private_data_dir, 'artifacts')
+        self.keep_artifacts = get_option('keep_artifacts', 'ansible') or 0
 
+    def _run(self, playbook, hosts, extravars, action):
+        '''
+        Run playbook on hosts in a single ansible run
+        :return: tuple of runner object and RunEvents object
+        '''
+        events = RunEvents(hosts)
+        ident = uuid.uuid4().hex
         kwargs = {
-            "playbook": "get_vlans.yaml",
+            "playbook": playbook,
             "json_mode" : False,
-            "extravars": {
-                "resources": ['vlans']
-            }
+            "quiet": True,
+            "limit": ','.join(hosts),
+            "extravars": extravars,
+            "forks": min(self.forks, len(hosts)),
+            "envvars": {"ANSIBLE_STRATEGY": self.strategy},
+            "ident": ident,
+            "artifact_dir": self.artifact_dir,
+            "rotate_artifacts": self.keep_artifacts,
+            # facts are read from the events, not from a fact cache on disk
+            "fact_cache_type": "memory",
+            "event_handler": events,
         }
-        r = ansible_runner.run(private_data_dir=self.private_data_dir, **kwargs)
-        #pdb.set_trace()
-        if r.rc != 0:
-            msg = f"failed to gather vlan facts status: {r.status}\nStats: {r.stats}"
-            raise Exception(msg)
+        start = time.perf_counter()
+        try:
+            r = ansible_runner.run(private_data_dir=self.private_data_dir, **kwargs)
+        finally:
+            for host in hosts:
+                DEVICE_SECONDS.observe(time.perf_counter() - start, host=host, action=action)
+            if not self.keep_artifacts:
+                shutil.rmtree(os.path.join(self.artifact_dir, ident), ignore_errors=True)
+
+        log.info("{}: {}".format(r.status, r.rc))
+        log.debug(f"ansible-runner stats: f{r.stats}")
+        return r, events
+
+    def get_resources(self, hosts, names):
+        '''
+        Gather the facts of several resources from many hosts in a single run
+        :param hosts: list of host names in inventory
+        :param names: list of resource names
+        :return: dict of host name to dict of resource name to list of dict of
+                 config, or to the exception if gathering failed on host
+        '''
+        r, events = self._run("get_vlans.yaml", hosts, {"resources": list(names)}, 'gather')
+        config = {}
+        for host in hosts:
+            error = events.error(host, r)
+            if error:
+                config[host] = Exception(f"failed to gather {', '.join(names)} facts on host {host} "
+                                         f"status: {r.status}\nError: {error}")
+                continue
+
+            config[host] = {name: events.facts[host].get(name) or [] for name in names}
+            for name in names:
+                self.device_state[(host, name)] = to_state(config[host][name], resource=get_resource(name))
+            log.debug(f"fetched {', '.join(names)} facts on host {host}: {config[host]}")
 
-        app.logger.info("{}: {}".format(r.status, r.rc))
-        app.logger.debug(f"ansible-runner stats: f{r.stats}")
-        # successful: 0
-        result = {}
-        for host in r.stats.get('ok', {}).keys():
-            facts = r.get_fact_cache(host)
-            result[host] = facts.get('ansible_network_resources', {}).get('vlans')
+        return config
 
-        app.logger.debug(f"fetched vlans facts: {result}")
+    def get_host_resources(self, host, names):
+        '''
+        Gather the facts of several resources from host in a single run
+        :param host: Name of the host in inventory
+        :param names: list of resource names
+        :return: dict of resource name to list of dict of config
+        '''
+        config = self.get_resources([host], names)[host]
+        if isinstance(config, Exception):
+            raise config
+        return config
 
-        return result
+    def get_host_vlans(self, host):
+        return self.get_host_resources(host, ['vlans'])['vlans']
 
-    def edit_vlans(self, config, action='merged'):
+    def notification_sources(self):
+        raise Exception("config change notifications are not supported by ansible provider")
+
+    def get_host_fingerprint(self, host):
+        # there is no cheap way to read commit id with a playbook run
+        return None
+
+    def edit_host_vlans(self, host, config, action='merged'):
 
         if not isinstance(config, list):
             config = [config]
 
-        kwargs = {
-            "playbook": "edit_vlans.yaml",
-            "json_mode" : False,
-            "extravars": {
-                "vlans_config": config,
-                "vlans_action": action
+        return self.apply_host_changes(host, [(config, action)])
 
-            }
-        }
-        r = ansible_runner.run(private_data_dir=self.private_data_dir, **kwargs)
-        #pdb.set_trace()
-        if r.rc != 0:
-            msg = f"edit vlans failed with action {action} and status {r.status}\nStats: {r.stats}"
-            raise Exception(msg)
+    def apply_host_changes(self, host, changes, resource='vlans'):
+        '''
+        Apply list of (config, action) changes of resource in order on host in a single run
+        '''
+        return self.apply_host_resource_changes(host, [(resource, config, action) for config, action in changes])
 
-        app.logger.info("{}: {}".format(r.status, r.rc))
-        app.logger.debug(f"ansible-runner stats: f{r.stats}")
+    def apply_host_resource_changes(self, host, changes):
+        '''
+        Apply list of (resource name, config, action) changes in order on host in a single run
+        '''
+        outcome = self.apply_resource_changes([host], changes)[host]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
 
-        # successful: 0
-        changed = r.stats.get('changed', {})
-        for host in changed.keys():
-            if changed[host]:
-                app.logger.debug(f"vlans config updated with action f{action}: {config}")
-                return True
+    def apply_resource_changes(self, hosts, changes):
+        '''
+        Apply list of (resource name, config, action) changes in order on many
+        hosts in a single run, each host gets its own delta.
+        :return: dict of host name to True if config is changed on host, or to
+                 the exception if the edit failed on host
+        '''
+        names = list(dict.fromkeys(name for name, _, _ in changes))
+        action = ', '.join(f"{name} {action}" for name, _, action in changes)
+        outcome = {}
+        missing = [host for host in hosts if any((host, name) not in self.device_state for name in names)]
+        if missing:
+            for host, config in self.get_resources(missing, names).items():
+                if isinstance(config, Exception):
+                    outcome[host] = config
 
-        app.loggerupdated.debug(f"no change required for vlan running config")
+        # compute the delta from the last known device state and
+        # run the playbook only on the hosts that need a change.
+        deltas = {}
+        for host in hosts:
+            if host in outcome:
+                continue
+            current = {name: self.device_state[(host, name)] for name in names}
+            deltas[host] = compute_deltas(current, changes)
+            if not deltas[host]:
+                log.debug(f"no change required for running config on host {host} with action {action}")
+                outcome[host] = False
+                del deltas[host]
 
-        return False
+        if not deltas:
+            return outcome
+
+        extravars = {
+            "resources_delta": {host: {name: delta.operations() for name, _, delta in host_deltas}
+                                for host, host_deltas in deltas.items()}
+        }
+        r, events = self._run("edit_resources.yaml", list(deltas), extravars, 'edit')
+        for host, host_deltas in deltas.items():
+            error = events.error(host, r)
+            if error:
+                # device state is unknown after a failed run, gather it again on next edit
+                for name in names:
+                    self.device_state.pop((host, name), None)
+                outcome[host] = Exception(f"edit failed on host {host} with action {action} and status {r.status}"
+                                          f"\nError: {error}")
+                continue
+
+            for name, desired, _ in host_deltas:
+                self.device_state[(host, name)] = desired
+
+            outcome[host] = host in events.changed
+            if outcome[host]:
+                log.debug(f"config updated on host {host} with action {action}: {host_deltas}")
+            else:
+                log.debug(f"no change required for running config on host {host}")
+
+        return outcome
 
 
 # vl = AnsibleManageVlans()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: In-process cache of device state keyed on host and resource.
+"""
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+
+class CacheEntry(object):
+    def __init__(self, value):
+        self.value = value
+        self.updated = time.monotonic()
+
+
+class DeviceStateCache(object):
+    def __init__(self, ttl=30, max_entries=4096, stale_while_revalidate=False, refresh_workers=2):
+        '''
+        :param ttl: Time in seconds after which an entry is stale
+        :param max_entries: Maximum number of entries, least recently used entry is evicted
+        :param stale_while_revalidate: If True a stale entry is returned immediately and
+                                       refreshed in background, else it is refreshed inline
+        :param refresh_workers: Number of threads for background refresh
+        '''
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_while_revalidate = stale_while_revalidate
+        self.refresh_workers = refresh_workers
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        # bumped on invalidate of all the resources of a host or of a single
+        # one, a load of a key started before its invalidate is not stored
+        self._host_generations = {}
+        self._key_generations = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, host, resources, loader):
+        '''
+        Get value of several resources of host, the loader is called once
+        with all the resources that are missing or stale. With stale while
+        revalidate the stale values are returned and refreshed in background.
+        :param host: Name of the host
+        :param resources: list of resource names
+        :param loader: Callable with list of resource names as argument that fetches
+                       the values from device in one round trip, returns dict of
+                       resource name to value
+        :return: dict of resource name to value
+        '''
+        values = {}
+        with self._lock:
+            now = time.monotonic()
+            stale = []
+            for resource in resources:
+                entry = self._entries.get((host, resource))
+                if entry is None:
+                    continue
+                if now - entry.updated < self.ttl or self.stale_while_revalidate:
+                    self._entries.move_to_end((host, resource))
+                    values[resource] = entry.value
+                    if now - entry.updated >= self.ttl:
+                        stale.append((host, resource))
+            if stale:
+                self._refresh(stale, lambda keys: {(host, resource): value for resource, value
+                                                   in loader([resource for _, resource in keys]).items()})
+
+        missing = [resource for resource in resources if resource not in values]
+        if missing:
+            generations = self._generations([(host, resource) for resource in missing])
+            loaded = loader(missing)
+            for resource in missing:
+                values[resource] = loaded[resource]
+            self._store(generations, {(host, resource): loaded[resource] for resource in missing})
+        return values
+
+    def get_hosts(self, hosts, resources, loader):
+        '''
+        Get value of several resources of many hosts, the loader is called
+        once with the hosts that miss any of the resources. With stale while
+        revalidate the hosts with stale values are refreshed in background.
+        :param hosts: list of host names
+        :param resources: list of resource names
+        :param loader: Callable with list of host names and list of resource names as
+                       arguments that fetches the values from devices in one run, returns
+                       dict of host name to dict of resource name to value or to exception
+        :return: dict of host name to dict of resource name to value or to exception
+        '''
+        values = {}
+        with self._lock:
+            now = time.monotonic()
+            stale = []
+            for host in hosts:
+                entries = [self._entries.get((host, resource)) for resource in resources]
+                if any(entry is None for entry in entries):
+                    continue
+                expired = any(now - entry.updated >= self.ttl for entry in entries)
+                if not expired or self.stale_while_revalidate:
+                    for resource in resources:
+                        self._entries.move_to_end((host, resource))
+                    values[host] = {resource: entry.value for resource, entry in zip(resources, entries)}
+                    if expired:
+                        stale.extend((host, resource) for resource in resources)
+            if stale:
+                self._refresh(stale, lambda keys: self._load_hosts(keys, resources, loader))
+
+        missing = [host for host in hosts if host not in values]
+        if missing:
+            generations = self._generations([(host, resource) for host in missing for resource in resources])
+            loaded = loader(missing, resources)
+            stored = {}
+            for host in missing:
+                values[host] = loaded.get(host, Exception(f"no result for host {host}"))
+                if not isinstance(values[host], Exception):
+                    stored.update({(host, resource): values[host][resource] for resource in resources})
+            self._store(generations, stored)
+        return values
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        # called with lock held
+        self._entries[key] = CacheEntry(value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _generation(self, key):
+        # called with lock held
+        return self._host_generations.get(key[0], 0), self._key_generations.get(key, 0)
+
+    def _generations(self, keys):
+        # generation of each key before its load starts
+        with self._lock:
+            return {key: self._generation(key) for key in keys}
+
+    def _store(self, generations, values):
+        # store the loaded values of the keys not invalidated during the load
+        with self._lock:
+            for key, value in values.items():
+                if key in generations and generations[key] == self._generation(key):
+                    self._set(key, value)
+
+    def invalidate(self, host, resource=None):
+        '''
+        Drop the entries of host
+        :param host: Name of the host
+        :param resource: Name of the resource, defaults to all resources of host
+        '''
+        with self._lock:
+            if resource is None:
+                self._host_generations[host] = self._host_generations.get(host, 0) + 1
+            else:
+                self._key_generations[(host, resource)] = self._key_generations.get((host, resource), 0) + 1
+            for key in list(self._entries):
+                if key[0] == host and (resource is None or key[1] == resource):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _load_hosts(keys, resources, loader):
+        # all the resources of the hosts of keys in one loader call
+        loaded = loader(sorted(set(host for host, _ in keys)), resources)
+        return {(host, resource): value if isinstance(value, Exception) else value[resource]
+                for host, value in loaded.items() for resource in resources}
+
+    def _refresh(self, keys, load):
+        # called with lock held, at most one refresh is in flight per key.
+        # load is called with the list of keys and returns dict of key to
+        # value or to exception
+        keys = [key for key in keys if key not in self._refreshing]
+        if not keys:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix='cache-refresh')
+        self._refreshing.update(keys)
+        self._executor.submit(self._run_refresh, keys, load)
+
+    def _run_refresh(self, keys, load):
+        try:
+            generations = self._generations(keys)
+            loaded = load(keys)
+            self._store(generations, {key: value for key, value in loaded.items() if not isinstance(value, Exception)})
+        except Exception as e:
+            log.error(f"failed to refresh {keys} in device state cache with error {e}")
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(keys)
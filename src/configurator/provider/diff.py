@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Compute the minimal delta between the known device state and
+         the desired state of a resource.
+"""
+from configurator.provider.resources import VLANS, get_resource
+from metrics import DIFF_SECONDS
+
+VLAN_KEYS = VLANS.fields
+VALID_ACTIONS = ('merged', 'replaced', 'overridden', 'deleted')
+
+
+def normalize(item, resource=VLANS):
+    '''
+    Strip the config dict to known fields of resource with a value
+    :param item: dict of resource config, for example vlan config
+    :param resource: Resource object, defaults to vlans
+    :return: normalized dict of config
+    '''
+    return {key: item[key] for key in resource.fields if item.get(key) is not None}
+
+
+def to_state(items, resource=VLANS):
+    '''
+    Convert list of config to state keyed on resource key, for example vlan_id
+    :param items: list of dict of resource config
+    :param resource: Resource object, defaults to vlans
+    :return: dict of key to normalized config
+    '''
+    return {item[resource.key]: normalize(item, resource) for item in items or []}
+
+
+def desired_state(current, config, action='merged', resource=VLANS):
+    '''
+    Compute the state expected on device after applying config with action
+    :param current: dict of key to config currently on device
+    :param config: list of dict of resource config
+    :param action: The value of action can be merged, replaced, deleted, overridden.
+    :param resource: Resource object, defaults to vlans
+    :return: dict of key to config
+    '''
+    if action not in VALID_ACTIONS:
+        raise Exception("Invalid %s action %s. Supported actions %s"
+                        % (resource.name, action, ', '.join(VALID_ACTIONS)))
+
+    desired = {} if action == 'overridden' else dict(current)
+    for item in config:
+        item = normalize(item, resource)
+        key = item[resource.key]
+        if action == 'merged':
+            merged = dict(desired.get(key, {}))
+            merged.update(item)
+            desired[key] = merged
+        elif action == 'deleted':
+            desired.pop(key, None)
+        else:
+            desired[key] = item
+    return desired
+
+
+def validate_changes(changes):
+    '''
+    Check that the changes can be applied, without the device state
+    :param changes: list of tuple of resource name, list of dict of config and action
+    :raises Exception: if a resource or action is invalid or an item has no key
+    '''
+    for name, config, action in changes:
+        resource = get_resource(name)
+        for item in config:
+            if item.get(resource.key) is None:
+                raise Exception(f"{resource.key} missing in {resource.name} config {item}")
+        desired_state({}, config, action=action, resource=resource)
+
+
+def change_keys(changes):
+    '''
+    :param changes: list of tuple of resource name, list of dict of config and action
+    :return: set of tuple of resource name and key of the items changed
+    '''
+    return set((name, item[get_resource(name).key]) for name, config, _ in changes for item in config)
+
+
+class ResourceDelta(object):
+    def __init__(self, merged=None, replaced=None, deleted=None):
+        self.merged = merged or []
+        self.replaced = replaced or []
+        self.deleted = deleted or []
+
+    def __bool__(self):
+        return bool(self.merged or self.replaced or self.deleted)
+
+    def __repr__(self):
+        return "<%s(merged=%s, replaced=%s, deleted=%s)>" % (type(self).__name__, self.merged,
+                                                             self.replaced, self.deleted)
+
+    def operations(self):
+        '''
+        Ordered list of non empty operations to apply on device
+        :return: list of dict with keys 'action' and 'config'
+        '''
+        operations = []
+        for action in ('deleted', 'replaced', 'merged'):
+            config = getattr(self, action)
+            if config:
+                operations.append({'action': action, 'config': config})
+        return operations
+
+
+def compute_delta(current, desired, resource=VLANS):
+    '''
+    Compute the minimal set of operations that moves device from current
+    to desired state. New items are merged, items that lost an attribute
+    are replaced and items not in desired state are deleted.
+    :param current: dict of key to config currently on device
+    :param desired: dict of key to config expected on device
+    :param resource: Resource object, defaults to vlans
+    :return: ResourceDelta object
+    '''
+    delta = ResourceDelta()
+    for key in sorted(desired):
+        want = desired[key]
+        have = current.get(key)
+        if have == want:
+            continue
+        if have and set(have) - set(want):
+            delta.replaced.append(want)
+        else:
+            delta.merged.append(want)
+
+    for key in sorted(current):
+        if key not in desired:
+            delta.deleted.append(current[key])
+
+    return delta
+
+
+def compute_deltas(current, changes):
+    '''
+    Fold the ordered changes of one or more resources and compute the
+    delta of each resource
+    :param current: dict of resource name to state currently on device
+    :param changes: list of tuple of resource name, list of dict of config and action
+    :return: list of tuple of resource name, desired state and ResourceDelta object
+             of each resource that needs a change
+    '''
+    desired = {}
+    for name, config, action in changes:
+        desired[name] = desired_state(desired.get(name, current[name]), config,
+                                      action=action, resource=get_resource(name))
+
+    deltas = []
+    for name, state in desired.items():
+        with DIFF_SECONDS.time(resource=name):
+            delta = compute_delta(current[name], state, resource=get_resource(name))
+        if delta:
+            deltas.append((name, state, delta))
+    return deltas
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: In-memory fake devices with configurable latency and failure
+         rate, to run and benchmark the app without network devices.
+"""
+import asyncio
+import random
+import threading
+import time
+
+from config.base import get_option
+from configurator.provider.diff import compute_deltas, desired_state, to_state
+from configurator.provider.netconf.notifications import FakeNotificationSource
+from configurator.provider.resources import get_resource
+from metrics import DEVICE_SECONDS
+
+
+def commit_event(names):
+    # RFC 6470 config change notification with an edit of each resource
+    edits = ''.join(f'<edit><target>/{name}</target><operation>replace</operation></edit>' for name in names)
+    return f'<notification><netconf-config-change>{edits}</netconf-config-change></notification>'
+
+
+class FakeManageVlans(object):
+    def __init__(self, private_data_dir=None, hosts=None, latency_ms=None, failure_rate=None, vlans=None, seed=None):
+        '''
+        :param private_data_dir: Not used, same signature as other providers
+        :param hosts: Number of fake devices or list of host names
+        :param latency_ms: Latency in milliseconds added to every device round trip
+        :param failure_rate: Probability between 0 and 1 of a device round trip to fail
+        :param vlans: Number of vlans initially configured on every device,
+                      vlan_id 1 to vlans with name 'vlan<id>'
+        :param seed: Seed of the failure generator for repeatable runs
+        '''
+        if hosts is None:
+            hosts = get_option('hosts', 'fake') or 1
+        if isinstance(hosts, int):
+            hosts = [f"fake{index}" for index in range(1, hosts + 1)]
+        if latency_ms is None:
+            latency_ms = get_option('latency_ms', 'fake') or 0
+        if failure_rate is None:
+            failure_rate = get_option('failure_rate', 'fake') or 0
+        if vlans is None:
+            vlans = get_option('vlans', 'fake') or 0
+
+        self.hosts = {host: {} for host in hosts}
+        self.latency = latency_ms / 1000.0
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # config on device keyed on host and resource name
+        # the state is never mutated in place, all the devices share the initial state
+        initial = to_state([{'vlan_id': vlan_id, 'name': f'vlan{vlan_id}'} for vlan_id in range(1, vlans + 1)])
+        self.config = {(host, 'vlans'): initial for host in self.hosts}
+        self.commits = {host: 0 for host in self.hosts}
+        self.round_trips = 0
+        # last known resource state on device keyed on host and resource name
+        self.device_state = {}
+        self.sources = {host: FakeNotificationSource() for host in self.hosts}
+
+    def configure(self, host, config, action='merged', resource='vlans'):
+        '''
+        Change config on device outside the app, without latency and failure
+        :param host: Name of the host
+        :param config: list of dict of resource config
+        :param action: The value of action can be merged, replaced, deleted, overridden.
+        :param resource: Name of the resource
+        '''
+        self._commit(host, {resource: desired_state(self.config.get((host, resource), {}), config,
+                                                    action=action, resource=get_resource(resource))})
+
+    def _commit(self, host, states):
+        for name, state in states.items():
+            self.config[(host, name)] = state
+        self.commits[host] += 1
+        if self.sources[host].opened:
+            self.sources[host].push(commit_event(states))
+
+    def _start_round_trip(self, host):
+        # count the round trip and draw its failure
+        if host not in self.hosts:
+            raise Exception(f"host {host} not found in inventory")
+        with self._lock:
+            self.round_trips += 1
+            return self.failure_rate and self._random.random() < self.failure_rate
+
+    def _round_trip(self, host, action):
+        failed = self._start_round_trip(host)
+        with DEVICE_SECONDS.time(host=host, action=action):
+            if self.latency:
+                time.sleep(self.latency)
+            if failed:
+                raise Exception(f"simulated failure on host {host}")
+
+    async def _round_trip_async(self, host, action):
+        failed = self._start_round_trip(host)
+        with DEVICE_SECONDS.time(host=host, action=action):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if failed:
+                raise Exception(f"simulated failure on host {host}")
+
+    def _read_state(self, host, names):
+        config = {}
+        for name in names:
+            state = self.config.get((host, get_resource(name).name), {})
+            config[name] = list(state.values())
+            self.device_state[(host, name)] = state
+        return config
+
+    def get_host_resources(self, host, names):
+        self._round_trip(host, 'gather')
+        return self._read_state(host, names)
+
+    async def get_host_resources_async(self, host, names):
+        await self._round_trip_async(host, 'gather')
+        return self._read_state(host, names)
+
+    def get_host_vlans(self, host):
+        return self.get_host_resources(host, ['vlans'])['vlans']
+
+    def notification_sources(self):
+        return self.sources
+
+    def get_host_fingerprint(self, host):
+        self._round_trip(host, 'fingerprint')
+        return str(self.commits[host])
+
+    def edit_host_vlans(self, host, config, action='merged'):
+        return self.apply_host_changes(host, [(config, action)])
+
+    def apply_host_changes(self, host, changes, resource='vlans'):
+        return self.apply_host_resource_changes(host, [(resource, config, action) for config, action in changes])
+
+    def _pending_deltas(self, host, names, changes):
+        current = {name: self.device_state[(host, name)] for name in names}
+        return compute_deltas(current, changes)
+
+    def _apply_deltas(self, host, deltas):
+        for name, desired, _ in deltas:
+            self.device_state[(host, name)] = desired
+        self._commit(host, {name: desired for name, desired, _ in deltas})
+
+    def apply_host_resource_changes(self, host, changes):
+        names = list(dict.fromkeys(name for name, _, _ in changes))
+        missing = [name for name in names if (host, name) not in self.device_state]
+        if missing:
+            self.get_host_resources(host, missing)
+
+        deltas = self._pending_deltas(host, names, changes)
+        if not deltas:
+            return False
+
+        try:
+            self._round_trip(host, 'edit')
+        except Exception:
+            for name in names:
+                self.device_state.pop((host, name), None)
+            raise
+
+        self._apply_deltas(host, deltas)
+        return True
+
+    async def apply_host_resource_changes_async(self, host, changes):
+        # same as apply_host_resource_changes with the latency awaited on the event loop
+        names = list(dict.fromkeys(name for name, _, _ in changes))
+        missing = [name for name in names if (host, name) not in self.device_state]
+        if missing:
+            await self.get_host_resources_async(host, missing)
+
+        deltas = self._pending_deltas(host, names, changes)
+        if not deltas:
+            return False
+
+        try:
+            await self._round_trip_async(host, 'edit')
+        except Exception:
+            for name in names:
+                self.device_state.pop((host, name), None)
+            raise
+
+        self._apply_deltas(host, deltas)
+        return True
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Run a provider operation on many hosts concurrently and
+         collect the result of each host.
+"""
+import asyncio
+import functools
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class HostResult(object):
+    def __init__(self, host, changed=False, failed=False, latency=0.0, data=None, error=None):
+        self.host = host
+        self.changed = changed
+        self.failed = failed
+        self.latency = latency
+        self.data = data
+        self.error = error
+
+    def __repr__(self):
+        return "<HostResult(host='%s', changed=%s, failed=%s, latency=%.3f, error=%s)>" % (
+            self.host, self.changed, self.failed, self.latency, self.error)
+
+    def to_dict(self):
+        return {'changed': self.changed, 'failed': self.failed,
+                'latency': round(self.latency, 3), 'error': self.error}
+
+
+class FanoutResult(object):
+    def __init__(self, results):
+        # dict of host name to HostResult
+        self.results = results
+
+    def __repr__(self):
+        return "<FanoutResult(%s)>" % list(self.results.values())
+
+    @property
+    def changed(self):
+        '''
+        True if config is changed on any of the hosts
+        '''
+        return any(result.changed for result in self.results.values())
+
+    @property
+    def failed(self):
+        '''
+        dict of host name to error for the hosts on which the operation failed
+        '''
+        return {host: result.error for host, result in self.results.items() if result.failed}
+
+    @property
+    def data(self):
+        '''
+        dict of host name to data returned by the operation on successful hosts
+        '''
+        return {host: result.data for host, result in self.results.items() if not result.failed}
+
+    @property
+    def all_failed(self):
+        return bool(self.results) and len(self.failed) == len(self.results)
+
+    def to_dict(self):
+        return {host: result.to_dict() for host, result in self.results.items()}
+
+
+def _run_on_host(host, func, *args, **kwargs):
+    start = time.monotonic()
+    try:
+        data = func(host, *args, **kwargs)
+        return HostResult(host, changed=data is True, data=data, latency=time.monotonic() - start)
+    except Exception as e:
+        log.error(f"operation {func.__name__} failed on host {host} with error {e}")
+        return HostResult(host, failed=True, error=str(e), latency=time.monotonic() - start)
+
+
+async def _run_on_host_async(host, func, *args, **kwargs):
+    start = time.monotonic()
+    try:
+        data = await func(host, *args, **kwargs)
+        return HostResult(host, changed=data is True, data=data, latency=time.monotonic() - start)
+    except Exception as e:
+        log.error(f"operation {func.__name__} failed on host {host} with error {e}")
+        return HostResult(host, failed=True, error=str(e), latency=time.monotonic() - start)
+
+
+def run_batch(hosts, func, *args, **kwargs):
+    '''
+    Run func once for all the hosts, for providers that operate on many
+    hosts in a single run.
+    :param hosts: list of host names
+    :param func: Callable with list of host names as first argument, returns
+                 dict of host name to data or to the exception raised on the host
+    :return: FanoutResult object
+    '''
+    start = time.monotonic()
+    try:
+        outcome = func(hosts, *args, **kwargs)
+    except Exception as e:
+        log.error(f"operation {func.__name__} failed on hosts {', '.join(hosts)} with error {e}")
+        outcome = {host: e for host in hosts}
+
+    latency = time.monotonic() - start
+    results = {}
+    for host in hosts:
+        data = outcome.get(host, Exception(f"no result for host {host}"))
+        if isinstance(data, Exception):
+            log.error(f"operation {func.__name__} failed on host {host} with error {data}")
+            results[host] = HostResult(host, failed=True, error=str(data), latency=latency)
+        else:
+            results[host] = HostResult(host, changed=data is True, data=data, latency=latency)
+    return FanoutResult(results)
+
+
+def fan_out(executor, hosts, func, *args, **kwargs):
+    '''
+    Run func on each host concurrently, a failure on one host
+    does not stop the operation on other hosts.
+    :param executor: Executor that bounds the number of in-flight operations
+    :param hosts: list of host names
+    :param func: Callable with host name as first argument
+    :return: FanoutResult object
+    '''
+    futures = {host: executor.submit(_run_on_host, host, func, *args, **kwargs) for host in hosts}
+    return FanoutResult({host: future.result() for host, future in futures.items()})
+
+
+async def async_fan_out(executor, hosts, func, *args, **kwargs):
+    '''
+    Awaitable fan_out, the caller does not hold a thread while the hosts
+    are busy. A coroutine func is awaited on the event loop, any other
+    func runs on the executor.
+    :param executor: Executor that bounds the number of in-flight operations
+    :param hosts: list of host names
+    :param func: Callable or coroutine function with host name as first argument
+    :return: FanoutResult object
+    '''
+    if asyncio.iscoroutinefunction(func):
+        awaitables = [_run_on_host_async(host, func, *args, **kwargs) for host in hosts]
+    else:
+        loop = asyncio.get_running_loop()
+        awaitables = [loop.run_in_executor(executor, functools.partial(_run_on_host, host, func, *args, **kwargs))
+                      for host in hosts]
+    results = await asyncio.gather(*awaitables)
+    return FanoutResult({result.host: result for result in results})
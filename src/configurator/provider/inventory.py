@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Read network device details from ansible ini inventory file.
+"""
+import shlex
+
+
+def _parse_vars(items):
+    variables = {}
+    for item in items:
+        if '=' in item:
+            key, value = item.split('=', 1)
+            variables[key] = value
+    return variables
+
+
+def parse_inventory(path, group='network'):
+    '''
+    Parse ansible ini inventory and return the hosts in group
+    :param path: Path of the inventory file
+    :param group: Name of the group, child groups are resolved recursively
+    :return: dict of host name to dict of host variables
+    '''
+    groups = {}
+    section = None
+    kind = 'hosts'
+    with open(path) as fp:
+        for line in fp:
+            line = line.strip()
+            if not line or line.startswith(('#', ';')):
+                continue
+
+            if line.startswith('[') and line.endswith(']'):
+                section, _, kind = line[1:-1].partition(':')
+                kind = kind or 'hosts'
+                groups.setdefault(section, {'hosts': {}, 'children': [], 'vars': {}})
+                continue
+
+            if section is None:
+                section = 'ungrouped'
+                groups.setdefault(section, {'hosts': {}, 'children': [], 'vars': {}})
+
+            if kind == 'children':
+                groups[section]['children'].append(line)
+            elif kind == 'vars':
+                groups[section]['vars'].update(_parse_vars([line]))
+            else:
+                parts = shlex.split(line)
+                groups[section]['hosts'][parts[0]] = _parse_vars(parts[1:])
+
+    def resolve(name, inherited, seen):
+        if name not in groups or name in seen:
+            return {}
+        seen.add(name)
+        group_vars = dict(inherited)
+        group_vars.update(groups[name]['vars'])
+        hosts = {}
+        for child in groups[name]['children']:
+            hosts.update(resolve(child, group_vars, seen))
+        for host, host_vars in groups[name]['hosts'].items():
+            variables = dict(group_vars)
+            variables.update(host_vars)
+            hosts[host] = variables
+        return hosts
+
+    return resolve(group, {}, set())
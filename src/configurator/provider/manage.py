@@ -4,41 +4,414 @@
 Author: Ganesh Nalawade
 Purpose: Manage providers for the app.
 """
+import asyncio
+import copy
+import threading
+import time
+
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+
 from config.base import get_option
-try:
-    from configurator.provider.ansible.vlans import AnsibleManageVlans
-    HAS_ANSIBLE_PROVIDER = True
-except ImportError:
-    HAS_ANSIBLE_PROVIDER = False
+from configurator.provider.cache import DeviceStateCache
+from configurator.provider.diff import change_keys, compute_deltas, validate_changes
+from configurator.provider.fanout import FanoutResult, HostResult, async_fan_out, fan_out, run_batch
+from configurator.provider.resources import get_resource
+from metrics import DEVICE_FAILURES, record_result
+
+VALID_PROVIDERS = ['ansible', 'netconf', 'fake']
+
+
+def load_provider(provider):
+    '''
+    Import the provider class on first use, the ansible and netconf
+    libraries are not loaded unless the provider is selected.
+    :param provider: Name of the provider
+    :return: provider class
+    '''
+    if provider not in VALID_PROVIDERS:
+        raise Exception("Invalid provider value %s. Supported providers %s"
+                        % (provider, ', '.join(VALID_PROVIDERS)))
+    try:
+        if provider == 'ansible':
+            from configurator.provider.ansible.vlans import AnsibleManageVlans
+            return AnsibleManageVlans
+        if provider == 'netconf':
+            from configurator.provider.netconf.vlans import NetconfManageVlans
+            return NetconfManageVlans
+        from configurator.provider.fake.vlans import FakeManageVlans
+        return FakeManageVlans
+    except ImportError as e:
+        raise Exception(f"provider {provider} not supported: {e}")
+
+
+class EditBatch(object):
+    """
+    Edits that arrive within the batching window for the same hosts,
+    applied on device in a single transaction.
+    """
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.changes = []
+        # resource name and key of the items changed by the batch
+        self.keys = set()
+        # known state of the changed resources on each host before the batch
+        self.states = {}
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class HostLocks(object):
+    """
+    Lock of each host created on first use. The device commits on a host
+    run one at a time, the commits on different hosts run concurrently.
+    """
+    def __init__(self):
+        self._locks = {}
+        self._async_locks = {}
+        self._lock = threading.Lock()
 
-provider = get_option('provider')
+    def get(self, host):
+        with self._lock:
+            if host not in self._locks:
+                self._locks[host] = threading.Lock()
+            return self._locks[host]
 
-VALID_PROVIDERS = ['ansible']
-if provider not in VALID_PROVIDERS:
-    raise Exception("Invalid provider value %s. Supported providers %s"
-                    % (provider, ', '.join(VALID_PROVIDERS)))
+    def get_async(self, host):
+        # queue of the coroutines of a host, used on the event loop only
+        if host not in self._async_locks:
+            self._async_locks[host] = asyncio.Lock()
+        return self._async_locks[host]
 
 
 class ManageVlans(object):
-    def __init__(self,  private_data_dir=None):
-        if HAS_ANSIBLE_PROVIDER:
-            self.obj = AnsibleManageVlans(private_data_dir)
+    def __init__(self,  private_data_dir=None, max_in_flight=None, batch_window_ms=None, obj=None):
+        if obj is not None:
+            # provider object given by the caller, for example a benchmark
+            self.obj = obj
         else:
-            raise Exception(f"provider {provider} not supported")
+            self.obj = load_provider(get_option('provider'))(private_data_dir)
 
-    def get_vlans(self):
+        self.max_in_flight = max_in_flight or get_option('max_in_flight', 'fanout') or 16
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='fanout')
+
+        # edits arriving within batch window are merged in one device transaction
+        if batch_window_ms is None:
+            batch_window_ms = get_option('batch_window_ms', 'fanout') or 0
+        self.batch_window = batch_window_ms / 1000.0
+        self._batches = {}
+        self._batch_lock = threading.Lock()
+
+        # device commits are serialized per host, no retries on commit lock collisions
+        self.host_locks = HostLocks()
+
+        ttl = get_option('ttl', 'cache')
+        self.cache = DeviceStateCache(ttl=30 if ttl is None else ttl,
+                                      max_entries=get_option('max_entries', 'cache') or 4096,
+                                      stale_while_revalidate=bool(get_option('stale_while_revalidate', 'cache')))
+
+    @property
+    def hosts(self):
+        return list(self.obj.hosts)
+
+    @property
+    def multi_host(self):
+        # the provider runs an operation on many hosts in a single run
+        return bool(getattr(self.obj, 'multi_host', False))
+
+    def get_vlans(self, hosts=None, cached=True):
         '''
-        Get list of vlans
-        :return: list of vlans
+        Get list of vlans from each host concurrently
+        :param hosts: list of host names, defaults to all hosts in inventory
+        :param cached: If True return the vlans from device state cache when
+                       available, else always fetch from device.
+        :return: FanoutResult object, the data of each host is list of vlans
         '''
-        return self.obj.get_vlans()
+        if self.multi_host:
+            result = self.get_resources(['vlans'], hosts=hosts, cached=cached)
+            for host_result in result.results.values():
+                if not host_result.failed:
+                    host_result.data = host_result.data['vlans']
+            return result
 
-    def edit_vlans(self, config, action='merged'):
+        return self._record_failures(fan_out(self.executor, hosts or self.hosts, self._get_host_resource,
+                                             'vlans', cached=cached), 'gather')
+
+    def get_resources(self, names, hosts=None, cached=True):
+        '''
+        Get config of several resources from each host concurrently, the
+        resources of a host are fetched in a single device round trip.
+        :param names: list of resource names, for example ['vlans', 'interfaces']
+        :param hosts: list of host names, defaults to all hosts in inventory
+        :param cached: If True return the config from device state cache when
+                       available, else always fetch from device.
+        :return: FanoutResult object, the data of each host is dict of resource
+                 name to list of config
         '''
-        Edit vlans on device
+        names = [get_resource(name).name for name in names]
+        if self.multi_host:
+            return self._record_failures(run_batch(hosts or self.hosts, self._get_resources_batch,
+                                                   names, cached=cached), 'gather')
+        return self._record_failures(fan_out(self.executor, hosts or self.hosts, self._get_host_resources,
+                                             names, cached=cached), 'gather')
+
+    def _get_host_resources(self, host, names, cached=True):
+        if cached:
+            return self.cache.get_many(host, names, lambda missing: self.obj.get_host_resources(host, missing))
+
+        config = self.obj.get_host_resources(host, names)
+        for name in names:
+            self.cache.set((host, name), config[name])
+        return config
+
+    def _get_resources_batch(self, hosts, names, cached=True):
+        if cached:
+            return self.cache.get_hosts(hosts, names, self.obj.get_resources)
+
+        config = self.obj.get_resources(hosts, names)
+        for host, host_config in config.items():
+            if not isinstance(host_config, Exception):
+                for name in names:
+                    self.cache.set((host, name), host_config[name])
+        return config
+
+    def _get_host_resource(self, host, name, cached=True):
+        return self._get_host_resources(host, [name], cached=cached)[name]
+
+    @staticmethod
+    def _record_failures(result, action):
+        for host in result.failed:
+            DEVICE_FAILURES.inc(host=host, action=action)
+        return result
+
+    def _invalidate(self, result):
+        # device state is changed or unknown after the edit
+        for host, host_result in result.results.items():
+            if host_result.changed or host_result.failed:
+                self.cache.invalidate(host)
+        return result
+
+    def get_fingerprints(self, hosts=None):
+        '''
+        Get a cheap fingerprint of config from each host concurrently, the
+        fingerprint changes whenever config is committed on the host.
+        :param hosts: list of host names, defaults to all hosts in inventory
+        :return: FanoutResult object, the data of each host is fingerprint or
+                 None if not supported by provider
+        '''
+        return fan_out(self.executor, hosts or self.hosts, self.obj.get_host_fingerprint)
+
+    def notification_sources(self):
+        '''
+        Get the config change notification source of each host
+        :return: dict of host name to notification source
+        '''
+        return self.obj.notification_sources()
+
+    def edit_vlans(self, config, action='merged', hosts=None):
+        '''
+        Edit vlans on each host concurrently
         :param config: list of dict of vlan config, Each dict can have
                         keys 'vlan_id' (mandatory), 'name' and 'description'.
         :param action: Tha value of action can be merged, replaced, deleted, overridden.
-        :return: True or False based on if vlan config is changed on device or not.
+        :param hosts: list of host names, defaults to all hosts in inventory
+        :return: FanoutResult object with per host changed, failed and latency result.
         '''
-        return self.obj.edit_vlans(config, action=action)
+        return self.edit_resource('vlans', config, action=action, hosts=hosts)
+
+    def edit_resource(self, name, config, action='merged', hosts=None):
+        '''
+        Edit a resource on each host concurrently
+        :param name: Name of the resource
+        :param config: list of dict of resource config, Each dict must have the
+                       key of resource, for example 'vlan_id' for vlans.
+        :param action: Tha value of action can be merged, replaced, deleted, overridden.
+        :param hosts: list of host names, defaults to all hosts in inventory
+        :return: FanoutResult object with per host changed, failed and latency result.
+        '''
+        if not isinstance(config, list):
+            config = [config]
+
+        changes = [(get_resource(name).name, config, action)]
+        # overridden sets the complete state, it is not merged with other edits
+        if not self.batch_window or action == 'overridden':
+            return self.edit_resources(changes, hosts=hosts)
+
+        return self._batched_edit(tuple(hosts or self.hosts), changes)
+
+    def edit_resources(self, changes, hosts=None):
+        '''
+        Apply changes of several resources on each host concurrently, the
+        changes of a host are applied in a single device transaction.
+        :param changes: list of tuple of resource name, list of dict of config and action
+        :param hosts: list of host names, defaults to all hosts in inventory
+        :return: FanoutResult object with per host changed, failed and latency result.
+        '''
+        if self.multi_host:
+            result = run_batch(hosts or self.hosts, self._apply_changes_batch, changes)
+        else:
+            result = fan_out(self.executor, hosts or self.hosts, self._apply_host_changes, changes)
+        self._invalidate(result)
+        actions = set(action for _, _, action in changes)
+        record_result(result, actions.pop() if len(actions) == 1 else 'batch')
+        return result
+
+    async def edit_vlans_async(self, config, action='merged', hosts=None):
+        '''
+        Awaitable edit_vlans, the caller does not hold a thread while
+        the hosts are busy.
+        :return: FanoutResult object with per host changed, failed and latency result.
+        '''
+        return await self.edit_resource_async('vlans', config, action=action, hosts=hosts)
+
+    async def edit_resource_async(self, name, config, action='merged', hosts=None):
+        '''
+        Awaitable edit_resource, the edit joins the batch of the sync edits
+        when batching is enabled.
+        :return: FanoutResult object with per host changed, failed and latency result.
+        '''
+        if not isinstance(config, list):
+            config = [config]
+
+        changes = [(get_resource(name).name, config, action)]
+        if not self.batch_window or action == 'overridden':
+            return await self.edit_resources_async(changes, hosts=hosts)
+
+        # the batch leader sleeps for the window, wait for it off the loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._batched_edit, tuple(hosts or self.hosts), changes)
+
+    async def edit_resources_async(self, changes, hosts=None):
+        '''
+        Awaitable edit_resources, a provider with a coroutine
+        apply_host_resource_changes_async is awaited on the event loop,
+        the calls of other providers run on the fan out executor.
+        :return: FanoutResult object with per host changed, failed and latency result.
+        '''
+        if self.multi_host:
+            # a single run for all the hosts, wait for it off the loop
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.edit_resources, changes, hosts)
+
+        result = self._invalidate(await async_fan_out(self.executor, hosts or self.hosts,
+                                                      self._apply_host_changes_async, changes))
+        actions = set(action for _, _, action in changes)
+        record_result(result, actions.pop() if len(actions) == 1 else 'batch')
+        return result
+
+    def _apply_host_changes(self, host, changes):
+        with self.host_locks.get(host):
+            return self.obj.apply_host_resource_changes(host, changes)
+
+    def _apply_changes_batch(self, hosts, changes):
+        # the locks are taken in order of host name, concurrent batches
+        # of overlapping hosts do not deadlock.
+        with ExitStack() as stack:
+            for host in sorted(hosts):
+                stack.enter_context(self.host_locks.get(host))
+            return self.obj.apply_resource_changes(hosts, changes)
+
+    async def _apply_host_changes_async(self, host, changes):
+        loop = asyncio.get_running_loop()
+        lock = self.host_locks.get(host)
+        async with self.host_locks.get_async(host):
+            # the waiters of a host queue on the event loop, only the first
+            # one may wait in a thread for an edit of the sync callers.
+            if not lock.acquire(blocking=False):
+                acquire = loop.run_in_executor(None, lock.acquire)
+                try:
+                    await asyncio.shield(acquire)
+                except asyncio.CancelledError:
+                    # the thread still waits for the lock, release it
+                    # once taken so the host is not locked forever
+                    acquire.add_done_callback(lambda _: lock.release())
+                    raise
+            try:
+                apply = getattr(self.obj, 'apply_host_resource_changes_async', None)
+                if apply:
+                    return await apply(host, changes)
+                return await loop.run_in_executor(self.executor, self.obj.apply_host_resource_changes, host, changes)
+            finally:
+                lock.release()
+
+    def _read_states(self, hosts, changes):
+        # known state of the changed resources on each host before the batch,
+        # an unknown state is fetched now instead of by the provider on edit
+        states = getattr(self.obj, 'device_state', None)
+        if states is None:
+            return {}
+        names = list(dict.fromkeys(name for name, _, _ in changes))
+        missing = [host for host in hosts if any((host, name) not in states for name in names)]
+        if missing:
+            self.get_resources(names, hosts=missing, cached=False)
+        return {(host, name): states[(host, name)] for host in hosts for name in names if (host, name) in states}
+
+    @staticmethod
+    def _changed_by(states, host, changes):
+        # no other edit of the batch changes the keys of a caller, its own
+        # delta from the state before the batch tells if it changed the host,
+        # None if the state of the host is unknown
+        current = {}
+        for name, _, _ in changes:
+            if (host, name) not in states:
+                return None
+            current[name] = states[(host, name)]
+        return bool(compute_deltas(current, changes))
+
+    def _batched_edit(self, hosts, changes):
+        '''
+        Apply the changes with the other edits of the same hosts that arrive
+        within the batching window, in a single device transaction. The first
+        edit opens a batch and waits for the window to close, the edits that
+        arrive meanwhile join it. An edit of an item already changed in the
+        batch is not merged with it, last writer wins is not applied: the edit
+        waits for the batch to complete and joins the next one, so the edits
+        of a key are applied in arrival order. An invalid change fails its own
+        caller before joining the batch.
+        :param hosts: tuple of host names
+        :param changes: list of tuple of resource name, list of dict of config and action
+        :return: FanoutResult object, the host is changed for the caller only
+                 if its own changes modified the host
+        '''
+        validate_changes(changes)
+        keys = change_keys(changes)
+        while True:
+            with self._batch_lock:
+                batch = self._batches.get(hosts)
+                leader = batch is None
+                if leader:
+                    batch = self._batches[hosts] = EditBatch(hosts)
+                if leader or not batch.keys & keys:
+                    batch.changes.extend(changes)
+                    batch.keys |= keys
+                    break
+            batch.done.wait()
+
+        if not leader:
+            batch.done.wait()
+        else:
+            time.sleep(self.batch_window)
+            with self._batch_lock:
+                del self._batches[hosts]
+            try:
+                batch.states = self._read_states(hosts, batch.changes)
+                batch.result = self.edit_resources(batch.changes, hosts=list(hosts))
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+
+        # every caller gets its own copy of the outcome of the shared
+        # device transaction
+        if batch.error:
+            raise copy.copy(batch.error)
+        results = {}
+        for host, result in batch.result.results.items():
+            changed = result.changed
+            if changed:
+                own = self._changed_by(batch.states, host, changes)
+                changed = changed if own is None else own
+            results[host] = HostResult(host, changed=changed, failed=result.failed, latency=result.latency,
+                                       data=result.data, error=result.error)
+        return FanoutResult(results)
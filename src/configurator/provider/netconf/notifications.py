@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Listen to config change notifications of network devices
+         over NETCONF.
+"""
+import logging
+import queue
+import re
+import threading
+
+from xml.etree import ElementTree
+
+log = logging.getLogger(__name__)
+
+# notifications sent on commit by RFC 6470 and junos
+CONFIG_CHANGE_EVENTS = frozenset(['netconf-config-change', 'commit-complete', 'UI_COMMIT_COMPLETED'])
+
+
+def is_config_change(notification_xml):
+    '''
+    Check if notification is sent for a config change on device
+    :param notification_xml: xml string of notification
+    :return: True or False
+    '''
+    try:
+        root = ElementTree.fromstring(notification_xml)
+    except ElementTree.ParseError:
+        return False
+    for element in root.iter():
+        if element.tag.rsplit('}', 1)[-1] in CONFIG_CHANGE_EVENTS:
+            return True
+        if element.text and element.text.strip() in CONFIG_CHANGE_EVENTS:
+            return True
+    return False
+
+
+def changed_resources(notification_xml, resources):
+    '''
+    Resources changed on device by a config change notification, read from
+    the edit targets of RFC 6470 netconf-config-change notification
+    :param notification_xml: xml string of notification
+    :param resources: list of resource names
+    :return: list of names of the changed resources, all the resources if the
+             notification has no edit target, for example the junos commit
+             notification, empty if it is not a config change
+    '''
+    if not is_config_change(notification_xml):
+        return []
+    targets = [element.text or '' for element in ElementTree.fromstring(notification_xml).iter()
+               if element.tag.rsplit('}', 1)[-1] == 'target']
+    if not targets:
+        return list(resources)
+
+    # the target is an instance identifier, for example
+    # /nc:configuration/vlans/vlan[name='v10'], match its node names
+    nodes = set()
+    for target in targets:
+        for node in re.sub(r"\[[^\]]*\]", '', target).split('/'):
+            nodes.add(node.rsplit(':', 1)[-1].strip())
+    return [resource for resource in resources if resource in nodes]
+
+
+class NetconfNotificationSource(object):
+    """
+    Notification subscription of a host on a dedicated NETCONF session,
+    a session with subscription can not be shared with the pool.
+    """
+    def __init__(self, pool, host, stream=None):
+        self.pool = pool
+        self.host = host
+        self.stream = stream
+        self.session = None
+
+    def open(self):
+        self.session = self.pool.open_session(self.host)
+        self.session.create_subscription(stream_name=self.stream)
+
+    def take_notification(self, timeout):
+        notification = self.session.take_notification(block=True, timeout=timeout)
+        return notification.notification_xml if notification else None
+
+    def close(self):
+        if self.session is not None:
+            try:
+                self.session.close_session()
+            except Exception:
+                pass
+            self.session = None
+
+
+class FakeNotificationSource(object):
+    """
+    In memory notification source to run the listener without a device
+    """
+    def __init__(self):
+        self.notifications = queue.Queue()
+        self.opened = 0
+
+    def push(self, notification_xml):
+        self.notifications.put(notification_xml)
+
+    def open(self):
+        self.opened += 1
+
+    def take_notification(self, timeout):
+        try:
+            return self.notifications.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        pass
+
+
+class NotificationListener(object):
+    def __init__(self, sources, on_change, resources=('vlans',), reconnect_interval=10, poll_timeout=1):
+        '''
+        :param sources: dict of host name to notification source
+        :param on_change: Callable with host name and resource name as arguments,
+                          called for each resource when config is changed on host
+        :param resources: list of names of the resources reported as changed, all
+                          of them on a notification without the edited paths
+        :param reconnect_interval: Interval in seconds to retry a failed subscription
+        :param poll_timeout: Timeout in seconds to wait for a notification
+        '''
+        self.sources = sources
+        self.on_change = on_change
+        self.resources = list(resources)
+        self.reconnect_interval = reconnect_interval
+        self.poll_timeout = poll_timeout
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _listen(self, host, source):
+        while not self._stop.is_set():
+            try:
+                source.open()
+                log.info(f"subscribed to notifications of host {host}")
+                while not self._stop.is_set():
+                    notification_xml = source.take_notification(self.poll_timeout)
+                    changed = changed_resources(notification_xml, self.resources) if notification_xml else []
+                    if changed:
+                        log.debug(f"config change notification of {', '.join(changed)} from host {host}")
+                        for resource in changed:
+                            self.on_change(host, resource)
+            except Exception as e:
+                log.error(f"notification subscription of host {host} failed with error {e}")
+                self._stop.wait(self.reconnect_interval)
+            finally:
+                source.close()
+
+    def start(self):
+        for host, source in self.sources.items():
+            thread = threading.Thread(target=self._listen, args=(host, source),
+                                      name=f'notifications-{host}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Pool of long lived NETCONF sessions per host.
+"""
+import logging
+import threading
+import time
+
+from collections import deque
+from contextlib import contextmanager
+
+from ncclient import manager
+
+log = logging.getLogger(__name__)
+
+KEEPALIVE_FILTER = ('subtree', '<configuration><version/></configuration>')
+
+
+class NetconfSessionPool(object):
+    def __init__(self, hosts, max_size=2, timeout=30, keepalive_interval=60, connect=None):
+        '''
+        :param hosts: dict of host name to dict of connection variables
+                      (ansible_host, ansible_port, ansible_user, ansible_ssh_pass)
+        :param max_size: Maximum number of sessions opened per host
+        :param timeout: Timeout in seconds to connect or wait for a free session
+        :param keepalive_interval: Interval in seconds to probe idle sessions, 0 disables keepalive
+        :param connect: Callable to open a session, defaults to ncclient manager.connect
+        '''
+        self.hosts = hosts
+        self.max_size = max_size
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+        self.connect = connect or manager.connect
+        self._idle = {host: deque() for host in hosts}
+        self._count = {host: 0 for host in hosts}
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _connect(self, host):
+        host_vars = self.hosts[host]
+        log.debug(f"opening netconf session to host {host}")
+        return self.connect(host=host_vars.get('ansible_host', host),
+                            port=int(host_vars.get('ansible_port', 830)),
+                            username=host_vars.get('ansible_user'),
+                            password=host_vars.get('ansible_ssh_pass', host_vars.get('ansible_password')),
+                            hostkey_verify=False,
+                            device_params={'name': host_vars.get('ansible_network_os', 'junos')},
+                            timeout=self.timeout)
+
+    def open_session(self, host):
+        '''
+        Open a dedicated session to host that is not managed by the pool
+        '''
+        if host not in self.hosts:
+            raise Exception(f"host {host} not found in inventory")
+        return self._connect(host)
+
+    @staticmethod
+    def _close(session):
+        try:
+            session.close_session()
+        except Exception:
+            pass
+
+    def _acquire(self, host):
+        if host not in self.hosts:
+            raise Exception(f"host {host} not found in inventory")
+
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                while self._idle[host]:
+                    session = self._idle[host].pop()
+                    if session.connected:
+                        return session
+                    self._count[host] -= 1
+
+                if self._count[host] < self.max_size:
+                    self._count[host] += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception(f"timed out waiting for free netconf session to host {host}")
+                self._cond.wait(remaining)
+
+        # connect outside the lock, reconnect is implicit as broken
+        # sessions are dropped from the pool on release
+        try:
+            return self._connect(host)
+        except Exception:
+            with self._cond:
+                self._count[host] -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, host, session, broken=False):
+        with self._cond:
+            if broken or not session.connected or self._stop.is_set():
+                self._count[host] -= 1
+                self._close(session)
+            else:
+                self._idle[host].append(session)
+            self._cond.notify()
+
+    @contextmanager
+    def session(self, host):
+        '''
+        Borrow a session for host from the pool
+        :param host: Name of the host in inventory
+        '''
+        session = self._acquire(host)
+        broken = False
+        try:
+            yield session
+        except Exception:
+            broken = not session.connected
+            raise
+        finally:
+            self._release(host, session, broken=broken)
+
+    def keepalive(self):
+        '''
+        Probe the idle sessions and drop the ones that are not alive
+        '''
+        for host in self.hosts:
+            with self._cond:
+                sessions = list(self._idle[host])
+                self._idle[host].clear()
+
+            for session in sessions:
+                broken = False
+                try:
+                    session.get_config(source='running', filter=KEEPALIVE_FILTER)
+                except Exception as e:
+                    log.info(f"dropping netconf session to host {host} with error {e}")
+                    broken = True
+                self._release(host, session, broken=broken)
+
+    def _run_keepalive(self):
+        while not self._stop.wait(self.keepalive_interval):
+            self.keepalive()
+
+    def start(self):
+        if self.keepalive_interval and self._thread is None:
+            self._thread = threading.Thread(target=self._run_keepalive, name='netconf-keepalive', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        with self._cond:
+            for host, sessions in self._idle.items():
+                while sessions:
+                    self._close(sessions.pop())
+                    self._count[host] -= 1
+            self._cond.notify_all()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Map the resources to junos configuration xml, each resource
+         has a parser of get-config reply and a renderer of edit-config
+         payload.
+"""
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _children(element, name):
+    return [child for child in element if local_name(child.tag) == name]
+
+
+def parse_vlans(element):
+    '''
+    Parse vlans from junos vlans configuration
+    :param element: vlans element of configuration
+    :return: list of dict of vlan config
+    '''
+    vlans = []
+    for node in _children(element, 'vlan'):
+        vlan = {}
+        for child in node:
+            tag = local_name(child.tag)
+            if tag == 'name':
+                vlan['name'] = child.text
+            elif tag == 'vlan-id':
+                vlan['vlan_id'] = int(child.text)
+            elif tag == 'description':
+                vlan['description'] = child.text
+        if 'vlan_id' in vlan:
+            vlans.append(vlan)
+    return vlans
+
+
+def _vlan_xml(vlan, operation=None):
+    attr = f' operation="{operation}"' if operation else ''
+    xml = f"<vlan{attr}><name>{escape(vlan['name'])}</name>"
+    if operation != 'delete':
+        xml += f"<vlan-id>{vlan['vlan_id']}</vlan-id>"
+        if vlan.get('description'):
+            xml += f"<description>{escape(vlan['description'])}</description>"
+    return xml + "</vlan>"
+
+
+def render_vlans(current, delta):
+    '''
+    Render vlan delta as junos vlans configuration. Junos keys vlans on
+    name, a vlan_id with a new name deletes the vlan with the old name.
+    :param current: dict of vlan_id to vlan config currently on device
+    :param delta: ResourceDelta object
+    :return: xml string
+    '''
+    items = [_vlan_xml(vlan, operation='delete') for vlan in delta.deleted]
+    for operation, vlans in (('replace', delta.replaced), (None, delta.merged)):
+        for vlan in vlans:
+            have = current.get(vlan['vlan_id'])
+            if have and have.get('name') != vlan.get('name'):
+                items.append(_vlan_xml(have, operation='delete'))
+            items.append(_vlan_xml(vlan, operation=operation))
+    return "<vlans>%s</vlans>" % ''.join(items)
+
+
+def parse_interfaces(element):
+    '''
+    Parse physical interface attributes from junos interfaces configuration,
+    the logical units are not managed.
+    :param element: interfaces element of configuration
+    :return: list of dict of interface config
+    '''
+    interfaces = []
+    for node in _children(element, 'interface'):
+        interface = {'enabled': True}
+        for child in node:
+            tag = local_name(child.tag)
+            if tag == 'name':
+                interface['name'] = child.text
+            elif tag == 'description':
+                interface['description'] = child.text
+            elif tag == 'disable':
+                interface['enabled'] = False
+            elif tag == 'mtu':
+                interface['mtu'] = int(child.text)
+            elif tag == 'speed':
+                interface['speed'] = child.text
+        if 'name' in interface:
+            interfaces.append(interface)
+    return interfaces
+
+
+def _interface_xml(want, have):
+    # interface is edited attribute by attribute, replacing or deleting
+    # the interface element would drop the logical units as well
+    xml = f"<interface><name>{escape(want['name'])}</name>"
+    for field, tag in (('description', 'description'), ('mtu', 'mtu'), ('speed', 'speed')):
+        value = want.get(field)
+        if value is not None:
+            if value != have.get(field):
+                xml += f"<{tag}>{escape(str(value))}</{tag}>"
+        elif have.get(field) is not None:
+            xml += f'<{tag} operation="delete"/>'
+    if want.get('enabled') is False and have.get('enabled') is not False:
+        xml += "<disable/>"
+    elif want.get('enabled') is not False and have.get('enabled') is False:
+        xml += '<disable operation="delete"/>'
+    return xml + "</interface>"
+
+
+def render_interfaces(current, delta):
+    '''
+    Render interface delta as junos interfaces configuration, a deleted
+    interface has its managed attributes reset to default.
+    :param current: dict of interface name to interface config currently on device
+    :param delta: ResourceDelta object
+    :return: xml string
+    '''
+    items = [_interface_xml({'name': interface['name']}, interface) for interface in delta.deleted]
+    for interface in delta.replaced + delta.merged:
+        items.append(_interface_xml(interface, current.get(interface['name'], {})))
+    return "<interfaces>%s</interfaces>" % ''.join(items)
+
+
+# resource name to junos configuration element, parser and renderer
+NETCONF_RESOURCES = {
+    'vlans': ('vlans', parse_vlans, render_vlans),
+    'interfaces': ('interfaces', parse_interfaces, render_interfaces),
+}
+
+
+def _get(name):
+    try:
+        return NETCONF_RESOURCES[name]
+    except KeyError:
+        raise Exception(f"resource {name} is not supported by netconf provider")
+
+
+def config_filter(names):
+    '''
+    Subtree filter that fetches the configuration of all resources in one get-config
+    :param names: list of resource names
+    :return: tuple of filter type and filter xml
+    '''
+    return ('subtree', "<configuration>%s</configuration>" % ''.join(f"<{_get(name)[0]}/>" for name in names))
+
+
+def parse_config(data_xml, names):
+    '''
+    Parse resources from junos configuration xml
+    :param data_xml: xml string of get-config reply data
+    :param names: list of resource names
+    :return: dict of resource name to list of dict of config
+    '''
+    root = ElementTree.fromstring(data_xml)
+    configuration = next((element for element in root.iter() if local_name(element.tag) == 'configuration'), root)
+    elements = {local_name(element.tag): element for element in configuration}
+
+    config = {}
+    for name in names:
+        tag, parse, _ = _get(name)
+        element = elements.get(tag)
+        config[name] = parse(element) if element is not None else []
+    return config
+
+
+def delta_to_xml(deltas):
+    '''
+    Render deltas of resources as a single junos edit-config payload
+    :param deltas: list of tuple of resource name, current state and ResourceDelta object
+    :return: xml string
+    '''
+    items = [_get(name)[2](current, delta) for name, current, delta in deltas if delta]
+    return "<config><configuration>%s</configuration></config>" % ''.join(items)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Manage resource configuration over persistent NETCONF sessions.
+"""
+import hashlib
+import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from xml.etree import ElementTree
+
+from config.base import get_option
+from configurator.provider.diff import compute_deltas, to_state
+from configurator.provider.inventory import parse_inventory
+from configurator.provider.netconf.notifications import NetconfNotificationSource
+from configurator.provider.netconf.pool import NetconfSessionPool
+from configurator.provider.netconf.resources import config_filter, delta_to_xml, local_name, parse_config
+from configurator.provider.resources import get_resource
+from metrics import DEVICE_SECONDS
+
+log = logging.getLogger(__name__)
+
+
+def _collect(futures):
+    # dict of host name to result or exception of the future
+    results = {}
+    for host, future in futures.items():
+        try:
+            results[host] = future.result()
+        except Exception as e:
+            results[host] = e
+    return results
+
+
+class HostTransaction(object):
+    """
+    Host side of a multi host transaction, the session and the candidate
+    lock of the host are held from load until the transaction is closed.
+    """
+    def __init__(self, pool, host, payload):
+        self.pool = pool
+        self.host = host
+        self.payload = payload
+        self.session = None
+        self.locked = False
+        self.committed = False
+        self._stack = ExitStack()
+
+    def load(self):
+        self.session = self._stack.enter_context(self.pool.session(self.host))
+        self.session.lock('candidate')
+        self.locked = True
+        self.session.edit_config(target='candidate', config=self.payload)
+        self.session.validate(source='candidate')
+
+    def commit(self, confirm_timeout):
+        # the device rolls back by itself if the commit is not confirmed in time
+        self.session.commit(confirmed=True, timeout=str(confirm_timeout))
+        self.committed = True
+
+    def confirm(self):
+        self.session.commit()
+
+    def rollback(self):
+        # only the steps that ran are undone, the candidate is discarded
+        # only if this transaction holds its lock
+        if not self.locked:
+            return
+        try:
+            if self.committed:
+                self.session.cancel_commit()
+            else:
+                self.session.discard_changes()
+        except Exception as e:
+            # a confirmed commit is still rolled back when the confirm timeout expires
+            log.error(f"rollback failed on host {self.host} with error {e}")
+
+    def close(self):
+        try:
+            if self.locked:
+                self.session.unlock('candidate')
+        except Exception as e:
+            log.error(f"unlock of candidate failed on host {self.host} with error {e}")
+        finally:
+            self._stack.close()
+
+
+class NetconfManageVlans(object):
+    def __init__(self, private_data_dir=None, pool=None):
+        self.private_data_dir = private_data_dir
+        # last known resource state on device keyed on host and resource name
+        self.device_state = {}
+
+        if not self.private_data_dir:
+            dir_path = os.path.dirname(os.path.realpath(__file__))
+            self.private_data_dir = os.path.join(dir_path, '../../../../meta/ansible')
+
+        self.hosts = parse_inventory(os.path.join(self.private_data_dir, 'inventory', 'hosts'))
+        self.pool = pool or NetconfSessionPool(self.hosts,
+                                               max_size=get_option('pool_size', 'netconf') or 2,
+                                               timeout=get_option('timeout', 'netconf') or 30,
+                                               keepalive_interval=get_option('keepalive_interval', 'netconf') or 60)
+        self.pool.start()
+
+        # with transactional apply an edit on many hosts is committed on all of
+        # them or on none, with a confirmed commit that rolls back by itself.
+        transactional = get_option('transactional', 'netconf')
+        self.multi_host = True if transactional is None else bool(transactional)
+        self.confirm_timeout = get_option('confirm_timeout', 'netconf') or 60
+        self.executor = ThreadPoolExecutor(max_workers=get_option('max_in_flight', 'fanout') or 16,
+                                           thread_name_prefix='netconf')
+
+    def get_host_resources(self, host, names):
+        '''
+        Fetch the config of several resources from host with a single get-config
+        :param host: Name of the host in inventory
+        :param names: list of resource names
+        :return: dict of resource name to list of dict of config
+        '''
+        with self.pool.session(host) as session, DEVICE_SECONDS.time(host=host, action='gather'):
+            reply = session.get_config(source='running', filter=config_filter(names))
+        config = parse_config(reply.data_xml, names)
+        for name in names:
+            self.device_state[(host, name)] = to_state(config[name], resource=get_resource(name))
+        return config
+
+    def get_resources(self, hosts, names):
+        '''
+        Fetch the config of several resources from many hosts in parallel
+        :return: dict of host name to dict of resource name to list of dict of
+                 config, or to the exception if get-config failed on host
+        '''
+        return _collect({host: self.executor.submit(self.get_host_resources, host, names) for host in hosts})
+
+    def get_host_vlans(self, host):
+        return self.get_host_resources(host, ['vlans'])['vlans']
+
+    def notification_sources(self):
+        stream = get_option('notification_stream', 'netconf')
+        return {host: NetconfNotificationSource(self.pool, host, stream=stream) for host in self.hosts}
+
+    def get_host_fingerprint(self, host):
+        with self.pool.session(host) as session, DEVICE_SECONDS.time(host=host, action='fingerprint'):
+            reply = session.dispatch('get-commit-information')
+
+        # the latest commit is the first entry of commit history
+        for element in ElementTree.fromstring(reply.xml).iter():
+            if local_name(element.tag) == 'commit-history':
+                return hashlib.sha1(ElementTree.tostring(element)).hexdigest()
+        return None
+
+    def edit_host_vlans(self, host, config, action='merged'):
+        return self.apply_host_changes(host, [(config, action)])
+
+    def apply_host_changes(self, host, changes, resource='vlans'):
+        '''
+        Apply list of (config, action) changes of resource in order on host in a single commit
+        '''
+        return self.apply_host_resource_changes(host, [(resource, config, action) for config, action in changes])
+
+    def apply_host_resource_changes(self, host, changes):
+        '''
+        Apply list of (resource name, config, action) changes in order on host in a single commit
+        '''
+        names = list(dict.fromkeys(name for name, _, _ in changes))
+        missing = [name for name in names if (host, name) not in self.device_state]
+        if missing:
+            self.get_host_resources(host, missing)
+
+        action = ', '.join(f"{name} {action}" for name, _, action in changes)
+        current = {name: self.device_state[(host, name)] for name in names}
+        deltas = compute_deltas(current, changes)
+        if not deltas:
+            return False
+
+        payload = delta_to_xml([(name, current[name], delta) for name, _, delta in deltas])
+        with self.pool.session(host) as session, DEVICE_SECONDS.time(host=host, action='edit'):
+            try:
+                with session.locked('candidate'):
+                    try:
+                        session.edit_config(target='candidate', config=payload)
+                        session.commit()
+                    except Exception:
+                        session.discard_changes()
+                        raise
+            except Exception:
+                # device state is unknown after a failed edit, fetch it again on next edit
+                for name in names:
+                    self.device_state.pop((host, name), None)
+                raise
+
+        for name, desired, delta in deltas:
+            self.device_state[(host, name)] = desired
+            log.debug(f"{name} config updated on host {host} with action {action}: {delta}")
+        return True
+
+    def _each(self, transactions, method, *args):
+        # run a phase on all the hosts in parallel, return the errors
+        results = _collect({txn.host: self.executor.submit(getattr(txn, method), *args) for txn in transactions})
+        return {host: result for host, result in results.items() if isinstance(result, Exception)}
+
+    def apply_resource_changes(self, hosts, changes):
+        '''
+        Apply list of (resource name, config, action) changes on many hosts in a
+        two phase transaction. The candidate of each host is locked and loaded
+        in parallel, then committed in parallel with confirmed commit and the
+        commits are confirmed once all the hosts have committed. If any host
+        fails before confirm the change is rolled back on all the hosts.
+        :return: dict of host name to True if config is changed on host, or to
+                 the exception if the change is not applied on host
+        '''
+        names = list(dict.fromkeys(name for name, _, _ in changes))
+        action = ', '.join(f"{name} {action}" for name, _, action in changes)
+        missing = [host for host in hosts if any((host, name) not in self.device_state for name in names)]
+        failed = {host: config for host, config in self.get_resources(missing, names).items()
+                  if isinstance(config, Exception)} if missing else {}
+        if failed:
+            return {host: failed.get(host, Exception(f"not applied on host {host}, failed to read config "
+                                                     f"on hosts {', '.join(failed)}")) for host in hosts}
+
+        outcome = {}
+        deltas = {}
+        for host in hosts:
+            current = {name: self.device_state[(host, name)] for name in names}
+            deltas[host] = compute_deltas(current, changes)
+            if not deltas[host]:
+                outcome[host] = False
+                del deltas[host]
+        if not deltas:
+            return outcome
+
+        transactions = [HostTransaction(self.pool, host, delta_to_xml([
+            (name, self.device_state[(host, name)], delta) for name, _, delta in host_deltas]))
+            for host, host_deltas in deltas.items()]
+        start = time.perf_counter()
+        try:
+            errors = self._each(transactions, 'load')
+            if not errors:
+                errors = self._each(transactions, 'commit', self.confirm_timeout)
+            if errors:
+                self._each(transactions, 'rollback')
+                failed_hosts = ', '.join(errors)
+                for host in deltas:
+                    errors.setdefault(host, Exception(f"rolled back on host {host}, transaction failed on hosts "
+                                                      f"{failed_hosts}"))
+            else:
+                # a host that fails to confirm rolls back when the confirm timeout expires
+                errors = self._each(transactions, 'confirm')
+        finally:
+            self._each(transactions, 'close')
+            for host in deltas:
+                DEVICE_SECONDS.observe(time.perf_counter() - start, host=host, action='edit')
+
+        for host, host_deltas in deltas.items():
+            if host in errors:
+                # device state is unknown after a failed edit, fetch it again on next edit
+                for name in names:
+                    self.device_state.pop((host, name), None)
+                outcome[host] = errors[host]
+                continue
+
+            for name, desired, delta in host_deltas:
+                self.device_state[(host, name)] = desired
+                log.debug(f"{name} config updated on host {host} with action {action}: {delta}")
+            outcome[host] = True
+        return outcome
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Registry of the network resources managed by the app. A resource
+         ties together the config schema, the database table that stores
+         the intended config and the name of the device resource.
+"""
+from collections import OrderedDict
+
+
+class Resource(object):
+    def __init__(self, name, key, fields, table=None):
+        '''
+        :param name: Name of the resource, same as the ansible network resource name
+        :param key: Field that uniquely identifies an item of the resource
+        :param fields: tuple of fields of an item, the key is the first field
+        :param table: Name of the database table of the resource, None if
+                      the resource is gathered from device but not stored
+        '''
+        if fields[0] != key:
+            raise Exception(f"key {key} should be the first field of resource {name}")
+        self.name = name
+        self.key = key
+        self.fields = tuple(fields)
+        self.table = table
+
+    def __repr__(self):
+        return f"<Resource(name={self.name}, key={self.key}, table={self.table})>"
+
+
+RESOURCES = OrderedDict()
+
+
+def register_resource(resource):
+    '''
+    Register a resource, a resource with the same name is replaced
+    :param resource: Resource object
+    :return: Resource object
+    '''
+    RESOURCES[resource.name] = resource
+    return resource
+
+
+def get_resource(name):
+    try:
+        return RESOURCES[name]
+    except KeyError:
+        raise Exception("Invalid resource %s. Supported resources %s" % (name, ', '.join(RESOURCES)))
+
+
+def stored_resources(names=None):
+    '''
+    Get the resources that are stored in database
+    :param names: list of resource names, defaults to all registered resources
+    :return: list of Resource objects
+    '''
+    resources = [get_resource(name) for name in names] if names else list(RESOURCES.values())
+    return [resource for resource in resources if resource.table]
+
+
+VLANS = register_resource(Resource('vlans', 'vlan_id', ('vlan_id', 'name', 'description'), table='vlans'))
+INTERFACES = register_resource(Resource('interfaces', 'name', ('name', 'description', 'enabled', 'mtu', 'speed'),
+                                        table='interfaces'))
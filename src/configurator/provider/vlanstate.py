@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Compact per-device vlan state for fleet scale diffing. The
+         membership is a bitmap over the 4096 vlan_id slots, the names and
+         descriptions are interned and each vlan carries a hash, so the
+         vlans added or removed between two devices are bitwise operations.
+"""
+import functools
+import sys
+import threading
+import weakref
+
+from array import array
+
+VLAN_SLOTS = 4096
+# distinct (name, description) records kept for sharing, the least recently
+# used are dropped beyond, the states holding them keep their own reference
+MAX_RECORDS = 65536
+
+# digest to the shared VlanState, see VlanState.intern
+_states = weakref.WeakValueDictionary()
+_states_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=MAX_RECORDS)
+def _shared_record(name, description):
+    # devices with the same vlan config hold the same record object, a
+    # tuple can not be weakly referenced so the records are in a bounded LRU
+    return (sys.intern(name) if isinstance(name, str) else name,
+            sys.intern(description) if isinstance(description, str) else description)
+
+
+def intern_record(name, description):
+    '''
+    :param name: Name of the vlan, None if not set
+    :param description: Description of the vlan, None if not set
+    :return: The shared tuple of name and description
+    '''
+    return _shared_record(name, description)
+
+
+def vlan_ids(bitmap):
+    '''
+    :param bitmap: int with a bit set for each vlan_id
+    :return: list of vlan_id in ascending order
+    '''
+    ids = []
+    while bitmap:
+        low = bitmap & -bitmap
+        ids.append(low.bit_length() - 1)
+        bitmap ^= low
+    return ids
+
+
+class VlanState(object):
+    """
+    Vlans of a device as a vlan_id bitmap, with the interned record and
+    the hash of each vlan in vlan_id order. It has the same diff interface
+    as the RecordSnapshot of the synchronizer.
+    """
+    __slots__ = ('bitmap', 'ids', 'records', 'hashes', 'digest', '__weakref__')
+
+    def __init__(self, records=()):
+        '''
+        :param records: iterable of tuple of vlan_id, name and description
+        :raises ValueError: if a vlan_id is out of the 4096 slots
+        '''
+        vlans = {}
+        for vlan_id, name, description in records:
+            if not isinstance(vlan_id, int) or not 0 <= vlan_id < VLAN_SLOTS:
+                raise ValueError(f"invalid vlan_id {vlan_id}, vlan_id should be in range 0-{VLAN_SLOTS - 1}")
+            vlans[vlan_id] = intern_record(name, description)
+
+        bitmap = 0
+        for vlan_id in vlans:
+            bitmap |= 1 << vlan_id
+        self.bitmap = bitmap
+        self.ids = array('H', sorted(vlans))
+        self.records = tuple(vlans[vlan_id] for vlan_id in self.ids)
+        self.hashes = array('q', (hash(record) for record in self.records))
+        self.digest = hash((bitmap, self.hashes.tobytes()))
+
+    @classmethod
+    def from_config(cls, items):
+        '''
+        :param items: list of dict of vlan config
+        :return: VlanState object
+        '''
+        return cls((item['vlan_id'], item.get('name'), item.get('description')) for item in items or [])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def to_config(self):
+        '''
+        :return: list of dict of vlan config in vlan_id order
+        '''
+        return [{'vlan_id': vlan_id, 'name': name, 'description': description}
+                for vlan_id, (name, description) in zip(self.ids, self.records)]
+
+    def __eq__(self, other):
+        if not isinstance(other, VlanState):
+            return NotImplemented
+        return self is other or (self.digest == other.digest and self.bitmap == other.bitmap
+                                 and self.records == other.records)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return self.digest
+
+    def intern(self):
+        '''
+        Devices with the same vlans share a single state, a fleet with a
+        few distinct configs holds a few states
+        :return: The shared VlanState object equal to this one
+        '''
+        with _states_lock:
+            shared = _states.get(self.digest)
+            if shared is None or shared != self:
+                _states[self.digest] = shared = self
+        return shared
+
+    def record(self, index):
+        # full record of the vlan at index
+        return (self.ids[index],) + self.records[index]
+
+    def index(self, vlan_id):
+        # position of vlan_id in ids, the number of lower bits set
+        return bin(self.bitmap & ((1 << vlan_id) - 1)).count('1')
+
+    def get(self, vlan_id):
+        '''
+        :param vlan_id: Id of the vlan
+        :return: tuple of vlan_id, name and description, None if not present
+        '''
+        if not 0 <= vlan_id < VLAN_SLOTS or not self.bitmap >> vlan_id & 1:
+            return None
+        return self.record(self.index(vlan_id))
+
+    def added(self, other):
+        # bitmap of vlans in other and not in this state
+        return other.bitmap & ~self.bitmap
+
+    def removed(self, other):
+        # bitmap of vlans in this state and not in other
+        return self.bitmap & ~other.bitmap
+
+    def changed(self, other):
+        '''
+        :param other: VlanState object
+        :return: bitmap of vlans in both states with a different record
+        '''
+        if self is other or self.digest == other.digest and self == other:
+            return 0
+        if self.bitmap == other.bitmap:
+            # same membership, the vlans are at the same positions
+            pairs = zip(self.ids, self.hashes, other.hashes, self.records, other.records)
+        else:
+            # one character per vlan_id slot, '1' if the vlan is in both states
+            common = format(self.bitmap & other.bitmap, f'0{VLAN_SLOTS}b')[::-1]
+            mine = [i for i, vlan_id in enumerate(self.ids) if common[vlan_id] == '1']
+            theirs = [j for j, vlan_id in enumerate(other.ids) if common[vlan_id] == '1']
+            pairs = ((self.ids[i], self.hashes[i], other.hashes[j], self.records[i], other.records[j])
+                     for i, j in zip(mine, theirs))
+        bitmap = 0
+        for vlan_id, digest, other_digest, record, other_record in pairs:
+            if digest != other_digest or record is not other_record and record != other_record:
+                bitmap |= 1 << vlan_id
+        return bitmap
+
+    def diff(self, other):
+        '''
+        Compute the vlans to be changed to move from this state to other
+        :param other: VlanState object
+        :return: tuple of list of records to be created, updated and deleted
+        '''
+        if self is other or self == other:
+            return [], [], []
+        create = [other.get(vlan_id) for vlan_id in vlan_ids(self.added(other))]
+        update = [other.get(vlan_id) for vlan_id in vlan_ids(self.changed(other))]
+        delete = [self.get(vlan_id) for vlan_id in vlan_ids(self.removed(other))]
+        return create, update, delete
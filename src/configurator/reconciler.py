@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Reconcile vlan config on network devices with the database in the
+         background. The device is touched only if the database state differs
+         from the state that was last applied on it.
+"""
+import hashlib
+import json
+import logging
+import threading
+
+from config.base import get_option, setup_logging
+from database import db, get_app, Vlans
+from configurator.provider import manage
+from metrics import DRIFT_CORRECTIONS
+
+log = logging.getLogger(__name__)
+
+
+def config_digest(config):
+    '''
+    Compute a stable digest of vlan config
+    :param config: list of dict of vlan config
+    :return: hex digest string
+    '''
+    data = json.dumps(sorted(config, key=lambda item: item['vlan_id']), sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def read_db_config():
+    '''
+    Read the vlan config stored in database with the session of the caller
+    :return: list of dict of vlan config
+    '''
+    return [{"vlan_id": vlan.vlan_id, "name": vlan.name, "description": vlan.description}
+            for vlan in Vlans.query.all()]
+
+
+def get_db_config(app=None):
+    '''
+    Read the vlan config stored in database in an app context of its own
+    :param app: Flask app, defaults to the app of the process
+    :return: list of dict of vlan config
+    '''
+    with (app or get_app()).app_context():
+        try:
+            return read_db_config()
+        finally:
+            db.session.remove()
+
+
+class DriftReconciler(object):
+    def __init__(self, manage_vlans=None, interval=None, app=None, replayer=None):
+        '''
+        :param manage_vlans: ManageVlans object used to push the config on device
+        :param interval: Seconds between the reconcile cycles
+        :param app: Flask app of the database, defaults to the app of the process
+        :param replayer: ChangeReplayer object of the change log, the hosts behind
+                         the log are left to the replayer
+        '''
+        self.manage_vlans = manage_vlans or manage.ManageVlans()
+        self.app = app
+        self.replayer = replayer
+        self.interval = interval or get_option('interval', 'reconciler') or 30
+        self.applied_digest = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def mark_applied(self, config=None):
+        '''
+        Record the current database state as applied on device. Called after
+        a successful REST write, which already pushed the change to the device.
+        :param config: list of dict of vlan config read by the caller after its
+                       commit, defaults to the config read in a new app context
+        '''
+        with self._lock:
+            self.applied_digest = config_digest(get_db_config(self.app) if config is None else config)
+
+    def reconcile(self):
+        '''
+        Push the database state to the device if it differs from the
+        state that was last applied.
+        :return: True if device was touched, else False
+        '''
+        with self._lock:
+            config = get_db_config(self.app)
+            digest = config_digest(config)
+            if digest == self.applied_digest:
+                log.debug("vlan config in database same as last applied, skip device push")
+                return False
+
+            hosts = None
+            if self.replayer:
+                # a host behind the change log is brought to the database
+                # state by the replayer, an override would push the state
+                # out of the order of the logged changes
+                behind = set(self.replayer.behind())
+                hosts = [host for host in self.manage_vlans.hosts if host not in behind]
+                if not hosts:
+                    log.debug("all hosts are behind the change log, skip device push")
+                    return False
+
+            result = self.manage_vlans.edit_vlans(config, action="overridden", hosts=hosts)
+            if result.changed:
+                for host, host_result in result.results.items():
+                    if host_result.changed:
+                        DRIFT_CORRECTIONS.inc(source='reconciler', host=host)
+                log.info("reconciled vlan config drift on device from database")
+            else:
+                log.info("vlan config on device same as that of database")
+
+            # retry on next cycle if any of the hosts failed or was left
+            # to the replayer
+            if result.failed:
+                log.error(f"failed to reconcile vlan config on hosts {result.failed}")
+            elif hosts is None or len(hosts) == len(self.manage_vlans.hosts):
+                self.applied_digest = digest
+            return True
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.reconcile()
+            except Exception as e:
+                log.error(f"failed to reconcile vlan config on device with error {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='drift-reconciler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == '__main__':
+    setup_logging()
+    DriftReconciler().run()
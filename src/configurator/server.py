@@ -4,112 +4,333 @@
 Author: Ganesh Nalawade
 Purpose: A simple Flask app that manages vlan configuration on network device.
 """
+import json
+import threading
+import time
 
-from flask import abort, jsonify, make_response, request
+from flask import Blueprint, Response, abort, current_app, g, jsonify, make_response, request, stream_with_context
 from sqlalchemy.exc import IntegrityError
-from database import db, app, Vlans, update_vlans_db
+from werkzeug.http import parse_etags
+import database
+from database import db, Vlans, VersionConflict, update_vlans_db
 from configurator.provider import manage
-
-manage_vlans = manage.ManageVlans()
-
-
-@app.route('/')
+from config.base import get_option, setup_logging
+import changelog
+from reconciler import DriftReconciler, read_db_config
+from drift import drift_report
+from jobs import JobQueue
+from bulk import chunked, expand_range, iter_ndjson, validate_vlan
+from listing import VlanQuery, list_vlans, next_link, not_modified, vlans_etag
+from metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, REGISTRY
+
+api = Blueprint('api', __name__)
+_lock = threading.RLock()
+
+
+def create_app(manage_vlans=None):
+    '''
+    Create the app with the REST API
+    :param manage_vlans: ManageVlans object, defaults to the configured
+                         provider created on first request
+    :return: Flask app object
+    '''
+    app = database.create_app()
+    app.register_blueprint(api)
+    if manage_vlans is not None:
+        app.extensions['manage_vlans'] = manage_vlans
+    return app
+
+
+def get_manage_vlans():
+    # the provider is created on first use, not at import
+    with _lock:
+        if 'manage_vlans' not in current_app.extensions:
+            current_app.extensions['manage_vlans'] = manage.ManageVlans()
+        return current_app.extensions['manage_vlans']
+
+
+def get_job_queue():
+    # job queue of async mode, None if async mode is disabled
+    with _lock:
+        if 'job_queue' not in current_app.extensions:
+            job_queue = None
+            if get_option('enabled', 'jobs'):
+                job_queue = JobQueue(get_manage_vlans(), workers=get_option('workers', 'jobs') or 4,
+                                     app=current_app._get_current_object())
+            current_app.extensions['job_queue'] = job_queue
+        return current_app.extensions['job_queue']
+
+
+def get_replayer():
+    # replayer of the change log, None if the change log is disabled
+    with _lock:
+        if 'replayer' not in current_app.extensions:
+            replayer = None
+            if get_option('enabled', 'changelog'):
+                replayer = changelog.ChangeReplayer(get_manage_vlans(), app=current_app._get_current_object())
+            current_app.extensions['replayer'] = replayer
+        return current_app.extensions['replayer']
+
+
+def replay_change(body, config, action, status):
+    # log the change in the transaction of the database update and bring
+    # the devices to the logged state, the hosts that fail catch up from
+    # the log on a later replay.
+    seq = changelog.append(config, action)
+    db.session.commit()
+    result = get_replayer().replay(until=seq)
+    mark_applied(result)
+    if result.all_failed:
+        current_app.logger.info(f"change {seq} logged, device request failed on all hosts")
+        return jsonify({'config': body, 'seq': seq, 'hosts': result.to_dict()}), 202
+    return device_response(body, result, status)
+
+
+def submit_job(config, action):
+    # commit the change in database and apply it on device in background
+    db.session.commit()
+    job = get_job_queue().submit(config, action)
+    current_app.logger.info(f"queued job {job.id} for vlan config {config} with action {action}")
+    response = jsonify({'job_id': job.id, 'status': job.status})
+    response.headers['Location'] = f"/jobs/{job.id}"
+    return response, 202
+
+
+def mark_applied(result):
+    # the write already pushed the change to the device, record the
+    # database state as applied to avoid a redundant reconcile push.
+    # On partial failure the reconciler retries the failed hosts. The
+    # state is read in the session of the request, a nested app context
+    # would tear the session down.
+    reconciler = current_app.extensions.get('reconciler')
+    if reconciler and not result.failed:
+        reconciler.mark_applied(read_db_config())
+
+
+def device_response(body, result, status):
+    # the database is committed if at least one host succeeded, report
+    # the result of each host if the edit failed on some of them.
+    if result.failed:
+        current_app.logger.info(f"device request failed on hosts {', '.join(result.failed)}")
+        return jsonify({'config': body, 'hosts': result.to_dict()}), 207
+    return jsonify(body), status
+
+
+def if_match_versions(header, vlan_id, vlan):
+    '''
+    Version of the vlan required by If-Match header of the request
+    :param header: Value of If-Match header, None if not sent
+    :param vlan_id: vlan_id in url
+    :param vlan: Vlans object, None if the vlan does not exist
+    :return: dict of vlan_id to version for update_vlans_db, None if header not sent
+    '''
+    if header is None:
+        return None
+    etags = parse_etags(header)
+    if vlan is None or not (etags.star_tag or etags.contains(str(vlan.version))):
+        raise VersionConflict(f"vlan_id {vlan_id} does not match If-Match {header}")
+    return {vlan_id: vlan.version}
+
+
+@api.before_app_request
+def start_timer():
+    g.start = time.perf_counter()
+
+
+@api.after_app_request
+def observe_request(response):
+    # the time of a streamed response covers only the start of the stream
+    if 'start' in g:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.start, method=request.method,
+                                     endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+
+@api.route('/')
 def index():
     return "Welcome to configurator!"
 
 
-@app.route('/config/vlans/<int:vlan_id>', methods=['GET'])
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+@api.route('/config/vlans/<int:vlan_id>', methods=['GET'])
 def get_vlan(vlan_id):
     vlan = Vlans.query.get(vlan_id)
     if vlan:
+        # reads are served from database only, drift on the device
+        # is corrected in background by the reconciler.
         config = [{"vlan_id": vlan.vlan_id, "name": vlan.name, "description": vlan.description}]
-
-        # TODO: Clarify if updating vlan config on device allowed
-        # by other means (like manually login), if not remove below
-        # edit on device.
-        # ensure the vlan config stored in database is also
-        # on the device. This is an idempotent call
-        result = manage_vlans.edit_vlans(config, action="replaced")
-        if result:
-            app.logger.info("updated vlan config on device from database")
-        else:
-            app.logger.info("vlan config on device same as that of database")
-        return jsonify(config)
+        response = jsonify(config)
+        response.set_etag(str(vlan.version))
+        return response
     else:
         abort(404, f"vlan resource {vlan_id} not found")
 
 
-@app.route("/config/vlans", methods=["GET"])
+@api.route("/config/vlans", methods=["GET"])
 def get_vlans():
     """
     This is a view function which responds to requests to get the vlan
-    details from database
+    details from database, a page of vlans is returned with limit and the
+    Link header has the url of the next page.
     """
-    config = []
-    vlan_records = Vlans.query.all()
-    app.logger.info("fetched vlan record %s" % vlan_records)
-    if vlan_records:
-        for vlan_record in vlan_records:
-            config.append({"vlan_id": vlan_record.vlan_id, "name": vlan_record.name, "description": vlan_record.description})
-
-        # TODO: Clarify if updating vlan config on device allowed
-        # by other means (like manually login), if not remove below
-        # edit on device.
-        # ensure the vlan config stored in database is also
-        # on the device. This is an idempotent call
-        try:
-            result = manage_vlans.edit_vlans(config, action="overridden")
-            if result:
-                app.logger.info("updated vlans config on device from database")
-            else:
-                app.logger.info("vlans config on device same as that of database")
-            return jsonify(config)
-        except Exception as e:
-            abort(400, f"Failed to get vlan config from device with error\n{e}")
-    else:
-        return jsonify([])
-
-
-@app.route('/config/vlans', methods=['POST'])
+    try:
+        query = VlanQuery.from_args(request.args)
+    except ValueError as e:
+        abort(400, str(e))
+
+    # reads are served from database only, drift on the device
+    # is corrected in background by the reconciler.
+    etag = vlans_etag(query)
+    if not_modified(request.headers.get('If-None-Match'), etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    config, after = list_vlans(query)
+    current_app.logger.debug("fetched %d vlan records" % len(config))
+    response = jsonify(config)
+    response.set_etag(etag)
+    if after is not None:
+        response.headers['Link'] = next_link(request.path, query, after)
+    return response
+
+
+@api.route('/config/vlans', methods=['POST'])
 def create_vlans():
     if not request.json or not isinstance(request.json, list):
         abort(400, f'invalid json body {request.json}, json body should be of type list')
 
     config = request.json
     for vlan in config:
-        for key in vlan.keys():
-            if key not in ['name', 'vlan_id', 'description']:
-                abort(400, "invalid key '%s' in config dict %s" % (key, vlan))
-            if key == 'vlan_id' and not (0 < vlan[key] <= 1024):
-                abort(400, "invalid vlan_id value %s in config dict %s" % (vlan[key], vlan))
+        error = validate_vlan(vlan)
+        if error:
+            abort(400, error)
 
     # update the vlan config in database
     try:
         update_vlans_db(config)
-        app.logger.info(f"Updated db with vlan config {config}")
+        current_app.logger.info(f"Updated db with vlan config {config}")
     except IntegrityError as e:
         abort(400, f"Failed to update config {config} in db with error\n{e.orig}")
 
+    if get_replayer():
+        return replay_change(config, config, "merged", 201)
+
+    if get_job_queue():
+        return submit_job(config, "merged")
+
     # update the vlan config on device.
     # This is an idempotent call
     try:
-        result = manage_vlans.edit_vlans(config, action="overridden")
-        if result:
-            app.logger.info("overriden vlan config on device")
+        result = get_manage_vlans().edit_vlans(config, action="merged")
+        if result.all_failed:
+            raise Exception(result.failed)
+        if result.changed:
+            current_app.logger.info("merged vlan config on device")
         else:
-            app.logger.info("vlan config same as post request body")
+            current_app.logger.info("vlan config same as post request body")
         db.session.commit()
     except Exception as e:
         db.session.rollback()
-        app.logger.info(f"device post request failed, rollback database items {config}")
+        current_app.logger.info(f"device post request failed, rollback database items {config}")
         abort(400, "Failed to update config {config} on device with error\n%s" % str(e))
     # finally:
     #     db.session.close()
+    mark_applied(result)
+
+    return device_response(config, result, 201)
+
+
+def apply_bulk_chunk(chunk):
+    # validate and apply a chunk of bulk items in one database transaction
+    # and one device edit, return the result of each item in input order.
+    results = {}
+    items = {}
+    for index, vlan in chunk:
+        error = vlan if isinstance(vlan, str) else validate_vlan(vlan)
+        if error:
+            results[index] = {'item': index, 'status': 'invalid', 'error': error}
+        else:
+            # the last item wins for a duplicate vlan_id in chunk
+            items[vlan['vlan_id']] = (index, vlan)
 
-    return jsonify(config), 201
+    if not items:
+        return [results[index] for index, _ in chunk]
+
+    config = [vlan for _, vlan in items.values()]
+    outcome = {}
+    try:
+        update_vlans_db(config, action='update')
+        replayer = get_replayer()
+        job_queue = get_job_queue()
+        if replayer:
+            seq = changelog.append(config, "merged")
+            db.session.commit()
+            result = replayer.replay(until=seq)
+            mark_applied(result)
+            if result.all_failed:
+                outcome = {'status': 'queued', 'seq': seq}
+            else:
+                outcome = {'status': 'partial', 'failed': result.failed} if result.failed else {'status': 'applied'}
+        elif job_queue:
+            db.session.commit()
+            job = job_queue.submit(config, "merged")
+            outcome = {'status': 'queued', 'job_id': job.id}
+        else:
+            result = get_manage_vlans().edit_vlans(config, action="merged")
+            if result.all_failed:
+                raise Exception(result.failed)
+            db.session.commit()
+            mark_applied(result)
+            outcome = {'status': 'partial', 'failed': result.failed} if result.failed else {'status': 'applied'}
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.info(f"bulk request failed, rollback database items {config}")
+        outcome = {'status': 'failed', 'error': str(e)}
 
+    for index, vlan in items.values():
+        results[index] = dict({'item': index, 'vlan_id': vlan['vlan_id']}, **outcome)
+    for index, vlan in chunk:
+        if index not in results:
+            # replaced by a later item of the same vlan_id
+            results[index] = {'item': index, 'vlan_id': vlan['vlan_id'], 'status': 'superseded',
+                              'by': items[vlan['vlan_id']][0]}
+    return [results[index] for index, _ in chunk]
 
-@app.route('/config/vlans/<int:vlan_id>', methods=['PUT'])
+
+@api.route('/config/vlans/bulk', methods=['POST'])
+def bulk_vlans():
+    """
+    Create or update vlans given as range request or as newline delimited
+    json stream. The items are applied in chunks and the result of each item
+    is streamed back as newline delimited json once its chunk is applied.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        items = iter_ndjson(request.stream)
+    else:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(400, f'invalid json body {body}, json body should be of type dict')
+        try:
+            items = enumerate(expand_range(body), start=1)
+        except ValueError as e:
+            abort(400, str(e))
+
+    chunk_size = get_option('chunk_size', 'bulk') or 128
+
+    def generate():
+        for chunk in chunked(items, chunk_size):
+            for result in apply_bulk_chunk(chunk):
+                yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@api.route('/config/vlans/<int:vlan_id>', methods=['PUT'])
 def update_task(vlan_id):
     #pdb.set_trace()
     if not request.json or not isinstance(request.json, dict):
@@ -126,81 +347,194 @@ def update_task(vlan_id):
     if vlan_id != config.get('vlan_id'):
         abort(400, "vlan_id in url %s should be same as that in body %s" % (vlan_id, config.get('vlan_id')))
 
-    update = True if Vlans.query.get(vlan_id) else False
+    error = validate_vlan(config)
+    if error:
+        abort(400, error)
 
-    # update the vlan config in database
+    vlan = Vlans.query.get(vlan_id)
+    update = True if vlan else False
+
+    # update the vlan config in database, the update is conditional
+    # on the version of If-Match header and holds the row until commit
     try:
+        versions = if_match_versions(request.headers.get('If-Match'), vlan_id, vlan)
         if update:
-            update_vlans_db([config], action='update')
-            app.logger.info(f"Updated db with vlan config {config}")
+            update_vlans_db([config], action='update', versions=versions)
+            current_app.logger.info(f"Updated db with vlan config {config}")
         else:
              update_vlans_db([config], action='add')
-             app.logger.info(f"Added vlan config to db{config}")
+             current_app.logger.info(f"Added vlan config to db{config}")
+    except VersionConflict as e:
+        db.session.rollback()
+        abort(412, str(e))
     except IntegrityError as e:
         abort(400, f"Failed to update config {config} in db with error\n{e.orig}")
 
+    if get_replayer():
+        response, status = replay_change(config, [config], "replaced", 201)
+        response.set_etag(str(Vlans.query.get(vlan_id).version))
+        return response, status
+
+    if get_job_queue():
+        return submit_job([config], "replaced")
+
     # update the vlan config on device.
     # This is an idempotent call
     try:
-        result = manage_vlans.edit_vlans(config, action="replaced")
-        if result:
-            app.logger.info("replaced vlan config on device")
+        result = get_manage_vlans().edit_vlans(config, action="replaced")
+        if result.all_failed:
+            raise Exception(result.failed)
+        if result.changed:
+            current_app.logger.info("replaced vlan config on device")
         else:
-            app.logger.info("vlan config same as post request body")
+            current_app.logger.info("vlan config same as post request body")
         db.session.commit()
     except Exception as e:
         db.session.rollback()
-        app.logger.info(f"device post request failed, rollback database items {config}")
+        current_app.logger.info(f"device post request failed, rollback database items {config}")
         abort(400, "Failed to update config {config} on device with error\n%s" % str(e))
     # finally:
     #     db.session.close()
+    mark_applied(result)
 
-    return jsonify(config), 201
+    response, status = device_response(config, result, 201)
+    response.set_etag(str(Vlans.query.get(vlan_id).version))
+    return response, status
 
 
-@app.route('/config/vlans/<int:vlan_id>/<string:name>', methods=['DELETE'])
+@api.route('/config/vlans/<int:vlan_id>/<string:name>', methods=['DELETE'])
 def delete_task(vlan_id, name):
     if not (0 < vlan_id <= 1024):
         abort(400, "invalid vlan_id value %s" % vlan_id)
 
-    delete = True if Vlans.query.get(vlan_id) else False
+    vlan = Vlans.query.get(vlan_id)
+    delete = True if vlan else False
 
     # update the vlan config in database
     try:
         if delete:
-            update_vlans_db([{'vlan_id': vlan_id}], action='delete')
-            app.logger.info(f"deleted vlan config with id {vlan_id} from db")
+            versions = if_match_versions(request.headers.get('If-Match'), vlan_id, vlan)
+            update_vlans_db([{'vlan_id': vlan_id}], action='delete', versions=versions)
+            current_app.logger.info(f"deleted vlan config with id {vlan_id} from db")
         else:
-            app.logger.info(f"vlan_id {vlan_id} record do not exist in db")
+            current_app.logger.info(f"vlan_id {vlan_id} record do not exist in db")
             abort(404, f"vlan_id {vlan_id} does not exist")
+    except VersionConflict as e:
+        db.session.rollback()
+        abort(412, str(e))
     except IntegrityError as e:
         abort(400, f"Failed to delete vlan_id {vlan_id} in db with error\n{e.orig}")
 
+    if get_replayer():
+        return replay_change({'result': True}, [{'vlan_id': vlan_id, 'name': name}], "deleted", 200)
+
+    if get_job_queue():
+        return submit_job([{'vlan_id': vlan_id, 'name': name}], "deleted")
+
     # update the vlan config on device.
     # This is an idempotent call
     try:
-        result = manage_vlans.edit_vlans([{'vlan_id': vlan_id, 'name': name}], action="deleted")
-        if result:
-            app.logger.info(f"deleted vlan_id {vlan_id} on device")
+        result = get_manage_vlans().edit_vlans([{'vlan_id': vlan_id, 'name': name}], action="deleted")
+        if result.all_failed:
+            raise Exception(result.failed)
+        if result.changed:
+            current_app.logger.info(f"deleted vlan_id {vlan_id} on device")
         else:
-            app.logger.info("vlan_id {vlan_id} record do not exit in db")
+            current_app.logger.info("vlan_id {vlan_id} record do not exit in db")
         db.session.commit()
     except Exception as e:
         db.session.rollback()
-        app.logger.info(f"device delete request failed, rollback database items")
+        current_app.logger.info(f"device delete request failed, rollback database items")
         abort(400, "Failed to delete vlan config on device with error\n%s" % str(e))
     # finally:
     #     db.session.close()
+    mark_applied(result)
+
+    return device_response({'result': True}, result, 200)
+
+
+def drift_hosts(manage_vlans, value):
+    '''
+    :param manage_vlans: ManageVlans object
+    :param value: Value of hosts argument, comma separated host names
+    :return: list of host names, None for all the hosts in inventory
+    :raises ValueError: if a host is not in inventory
+    '''
+    if not value:
+        return None
+    hosts = [host.strip() for host in value.split(',') if host.strip()]
+    inventory = set(manage_vlans.hosts)
+    unknown = [host for host in hosts if host not in inventory]
+    if unknown or not hosts:
+        raise ValueError(f"invalid hosts {value}, hosts not in inventory {', '.join(unknown)}")
+    return hosts
+
+
+@api.route('/drift', methods=['GET'])
+def get_drift():
+    # divergence of each device from database, the devices are always
+    # read unless cached argument is set
+    manage_vlans = get_manage_vlans()
+    try:
+        hosts = drift_hosts(manage_vlans, request.args.get('hosts'))
+    except ValueError as e:
+        abort(400, str(e))
+    cached = request.args.get('cached', '').lower() in ('1', 'true', 'yes')
+    return jsonify(drift_report(manage_vlans, app=current_app._get_current_object(), hosts=hosts, cached=cached))
 
-    return jsonify({'result': True})
 
+@api.route('/jobs/<string:job_id>', methods=['GET'])
+def get_job(job_id):
+    job_queue = get_job_queue()
+    job = job_queue.get(job_id) if job_queue else None
+    if not job:
+        abort(404, f"job {job_id} not found")
+    return jsonify(job.to_dict())
 
-@app.errorhandler(400)
+
+@api.app_errorhandler(400)
 def not_found(error):
     return make_response(jsonify({'error': error.get_description()}), 400)
 
 
+@api.app_errorhandler(412)
+def precondition_failed(error):
+    return make_response(jsonify({'error': error.get_description()}), 412)
+
+
+def start_background(app, reconciler=None):
+    '''
+    Start the background threads of the app, the drift reconciler and the
+    replayer of the change log that catches up the hosts behind the log.
+    :param app: Flask app object
+    :param reconciler: If True start the drift reconciler, defaults to
+                       reconciler enabled option
+    '''
+    if reconciler is None:
+        reconciler = get_option('enabled', 'reconciler')
+    with app.app_context():
+        replayer = get_replayer()
+        if reconciler and 'reconciler' not in app.extensions:
+            app.extensions['reconciler'] = DriftReconciler(get_manage_vlans(), app=app, replayer=replayer)
+            app.extensions['reconciler'].start()
+    if replayer:
+        replayer.start()
+
+
+def stop_background(app):
+    '''
+    Stop the background threads started by start_background
+    :param app: Flask app object
+    '''
+    for name in ('reconciler', 'replayer'):
+        if app.extensions.get(name):
+            app.extensions[name].stop()
+
+
 if __name__ == "__main__":
+    setup_logging()
+    app = create_app()
+    start_background(app)
 
     # Start Flask app. The "host" and "debug" options are both security
     # concerns, but for testing, we ignore them with the "nosec comment"
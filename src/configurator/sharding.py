@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""
+Author: Ganesh Nalawade
+Purpose: Coordinate multiple synchronizer workers through the database.
+         The inventory is split between live workers by consistent hashing
+         and a lease in an advisory lock table elects the leader.
+"""
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import time
+
+import sqlalchemy as db
+
+from sqlalchemy.exc import IntegrityError
+
+log = logging.getLogger(__name__)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    def __init__(self, members, replicas=64):
+        '''
+        :param members: list of worker ids
+        :param replicas: Number of points of each member on the ring
+        '''
+        self.members = sorted(members)
+        self._ring = sorted((_hash(f"{member}:{index}"), member)
+                            for member in self.members for index in range(replicas))
+        self._keys = [point for point, _ in self._ring]
+
+    def owner(self, key):
+        '''
+        Get the member that owns key
+        :param key: string key, for example host name
+        :return: worker id, None if ring is empty
+        '''
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+class WorkerRegistry(object):
+    def __init__(self, engine, metadata, worker_id=None, ttl=30):
+        '''
+        :param engine: sqlalchemy engine
+        :param metadata: sqlalchemy metadata
+        :param worker_id: Unique id of this worker
+        :param ttl: Time in seconds after which a worker without heartbeat is dead
+        '''
+        self.engine = engine
+        self.worker_id = worker_id or default_worker_id()
+        self.ttl = ttl
+        self.workers = db.Table('sync_workers', metadata,
+                                db.Column('worker_id', db.String(255), primary_key=True),
+                                db.Column('heartbeat', db.Float, nullable=False),
+                                extend_existing=True)
+        self.workers.create(engine, checkfirst=True)
+
+    def heartbeat(self):
+        now = time.time()
+        with self.engine.begin() as connection:
+            query = db.update(self.workers).where(self.workers.columns.worker_id == self.worker_id)
+            if connection.execute(query.values(heartbeat=now)).rowcount == 0:
+                connection.execute(db.insert(self.workers).values(worker_id=self.worker_id, heartbeat=now))
+
+    def live_workers(self):
+        query = db.select([self.workers.columns.worker_id])
+        query = query.where(self.workers.columns.heartbeat > time.time() - self.ttl)
+        with self.engine.connect() as connection:
+            return [row[0] for row in connection.execute(query)]
+
+    def leave(self):
+        with self.engine.begin() as connection:
+            connection.execute(db.delete(self.workers).where(self.workers.columns.worker_id == self.worker_id))
+
+
+class AdvisoryLock(object):
+    def __init__(self, engine, metadata, name, owner, ttl=30):
+        '''
+        Lease based lock stored as a row in sync_locks table, the lease
+        expires if the owner does not renew it within ttl seconds.
+        :param engine: sqlalchemy engine
+        :param metadata: sqlalchemy metadata
+        :param name: Name of the lock
+        :param owner: Id of the lock owner
+        :param ttl: Lease time in seconds
+        '''
+        self.engine = engine
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+        self.locks = db.Table('sync_locks', metadata,
+                              db.Column('name', db.String(255), primary_key=True),
+                              db.Column('owner', db.String(255)),
+                              db.Column('expires', db.Float, nullable=False),
+                              extend_existing=True)
+        self.locks.create(engine, checkfirst=True)
+
+    def acquire(self):
+        '''
+        Acquire or renew the lease, a single conditional UPDATE makes it
+        atomic across workers. The row of the lock is created on the first
+        acquire only.
+        :return: True if lock is held by owner, else False
+        '''
+        now = time.time()
+        columns = self.locks.columns
+        query = db.update(self.locks).values(owner=self.owner, expires=now + self.ttl)
+        query = query.where(db.and_(columns.name == self.name,
+                                    db.or_(columns.owner == self.owner, columns.expires < now)))
+        with self.engine.begin() as connection:
+            if connection.execute(query).rowcount == 1:
+                return True
+
+        # held by another owner, or the row does not exist yet
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(db.insert(self.locks).values(name=self.name, owner=self.owner,
+                                                                expires=now + self.ttl))
+        except IntegrityError:
+            return False
+        return True
+
+    def release(self):
+        columns = self.locks.columns
+        query = db.update(self.locks).values(owner=None, expires=0)
+        query = query.where(db.and_(columns.name == self.name, columns.owner == self.owner))
+        with self.engine.begin() as connection:
+            connection.execute(query)
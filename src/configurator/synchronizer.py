@@ -2,132 +2,558 @@
 
 """
 Author: Ganesh Nalawade
-Purpose: A python program to read vlan config from network device
-         and update it in local database if the records differs.
+Purpose: A python program to read resource config, for example vlans,
+         from network device and update it in local database if the
+         records differs.
 """
+import hashlib
+import json
 import logging
-import os
+import queue
+import threading
 import time
 import sqlalchemy as db
 
-from copy import deepcopy
+from contextlib import contextmanager
+from sqlalchemy.dialects import mysql
 
-from config.base import get_option
+from config.base import get_db_url, get_option, setup_logging
 from configurator.provider import manage
+from configurator.provider.diff import normalize
+from configurator.provider.netconf.notifications import NotificationListener
+from configurator.provider.resources import VLANS, stored_resources
+from configurator.provider.vlanstate import VlanState
+from metrics import DRIFT_CORRECTIONS, SYNC_CYCLE_SECONDS, instrument_engine, start_http_server
+from sharding import AdvisoryLock, HashRing, WorkerRegistry
 
 log = logging.getLogger(__name__)
-logging.basicConfig(level=os.environ.get("LOGLEVEL", "DEBUG"),
-                    format='%(process)d-%(levelname)s-%(message)s')
 
-dialect = get_option('dialect', 'database')
-user = get_option('user', 'database')
-password = get_option('password', 'database')
-host = get_option('host', 'database')
-db_name = get_option('name', 'database')
-db_url = f'{dialect}://{user}:{password}@{host}/{db_name}'
+engine = None
+_engine_lock = threading.Lock()
+metadata = db.MetaData()
 
 
-engine = db.create_engine(db_url)
-connection = engine.connect()
-metadata = db.MetaData()
+def create_engine():
+    # pooled engine, the connections are checked on checkout and
+    # recycled before the database server closes them.
+    db_url = get_db_url()
+    options = {
+        'pool_pre_ping': True,
+        'pool_recycle': get_option('pool_recycle', 'database') or 3600,
+    }
+    if not db_url.startswith('sqlite'):
+        options['pool_size'] = get_option('pool_size', 'database') or 5
+        options['max_overflow'] = get_option('max_overflow', 'database') or 10
+    return db.create_engine(db_url, **options)
+
 
+def get_engine():
+    '''
+    Get the engine of the process, created on first use
+    :return: sqlalchemy engine
+    '''
+    global engine
+    with _engine_lock:
+        if engine is None:
+            engine = create_engine()
+            instrument_engine(engine, 'synchronizer')
+    return engine
 
-class VlansDb(object):
-    def __init__(self, engine, connection, metadata):
+
+class ResourceDb(object):
+    def __init__(self, engine, connection, metadata, resource=VLANS):
+        '''
+        :param engine: sqlalchemy engine
+        :param connection: sqlalchemy connection checked out for the cycle
+        :param metadata: sqlalchemy metadata
+        :param resource: Resource object stored in the table
+        '''
         self.engine = engine
         self.connection = connection
         self.metadata = metadata
-        self.vlans_db = db.Table('vlans', self.metadata,
-                                 autoload=True, autoload_with=engine)
+        self.resource = resource
+        # the table is reflected once and cached in metadata
+        if resource.table in self.metadata.tables:
+            self.table = self.metadata.tables[resource.table]
+        else:
+            self.table = db.Table(resource.table, self.metadata,
+                                  autoload=True, autoload_with=engine)
+        self.columns = [self.table.columns[field] for field in resource.fields]
+        self.key = self.columns[0]
+        # version of the record seen by REST clients, bumped on every update
+        self.version = self.table.columns.get('version')
+        # change counter of the tables, None if the database has none
+        self.table_versions = self.metadata.tables.get('table_versions')
+        if self.table_versions is None and engine.dialect.has_table(connection, 'table_versions'):
+            self.table_versions = db.Table('table_versions', self.metadata, autoload=True, autoload_with=engine)
 
-    def get_vlans(self):
-        query = db.select([self.vlans_db])
-        return connection.execute(query).fetchall()
+    def _bump_version(self):
+        return {} if self.version is None else {'version': self.version + 1}
 
-    def update_db_vlans(self, vlans):
-        for item in vlans:
-            try:
-                query = db.update(self.vlans_db).values(name=item[1], description=item[2])
-                query = query.where(self.vlans_db.columns.vlan_id == item[0])
-                results = connection.execute(query)
-                log.info(f"updated vlan record {item} in db")
-            except Exception as e:
-                raise Exception(f"failed to update vlan record {item} in db with error {e}")
+    def bump_table_version(self):
+        # the ETag of the REST listing changes with the records synced
+        if self.table_versions is not None:
+            columns = self.table_versions.columns
+            self.connection.execute(db.update(self.table_versions).where(columns.name == self.resource.table)
+                                    .values(version=columns.version + 1))
+
+    def get_records(self):
+        '''
+        :return: list of tuples of record values in order of resource fields
+        '''
+        query = db.select(self.columns)
+        return self.connection.execute(query).fetchall()
+
+    def get_config(self):
+        return [dict(zip(self.resource.fields, row)) for row in self.get_records()]
 
-    def create_db_vlans(self, vlans):
-        vlans_list = []
-        for item in vlans:
-            query = db.insert(self.vlans_db)
-            vlans_list.append({'vlan_id': item[0], 'name': item[1], 'description': item[2]})
+    def checksum(self):
+        '''
+        Cheap checksum of table to detect change in database
+        :return: checksum value, None if not supported by database dialect
+        '''
+        if self.engine.dialect.name != 'mysql':
+            return None
+        return self.connection.execute(db.text(f"CHECKSUM TABLE {self.resource.table}")).fetchone()[1]
 
+    def _mappings(self, records, prefix=''):
+        return [{prefix + field: value for field, value in zip(self.resource.fields, record)} for record in records]
+
+    def update_records(self, records):
+        # single executemany round trip for all records
+        query = db.update(self.table).values(**{field: db.bindparam('b_' + field)
+                                                for field in self.resource.fields[1:]}, **self._bump_version())
+        query = query.where(self.key == db.bindparam('b_' + self.resource.key))
         try:
-            self.connection.execute(query,vlans_list)
-            log.info(f"created vlan record {vlans_list} in db")
+            self.connection.execute(query, self._mappings(records, prefix='b_'))
+            log.info(f"updated {self.resource.name} record {records} in db")
         except Exception as e:
-            raise Exception(f"failed to create vlan record {vlans} in db with error {e}")
+            raise Exception(f"failed to update {self.resource.name} record {records} in db with error {e}")
 
-    def delete_db_vlans(self, vlans):
-        for item in vlans:
-            try:
-                query = db.delete(self.vlans_db)
-                query = query.where(self.vlans_db.columns.vlan_id == item[0])
-                results = connection.execute(query)
-                log.info(f"deleted vlan record {item} in db")
-            except Exception as e:
-                raise Exception(f"failed to delete vlan record {item} in db with error {e}")
+    def create_records(self, records):
+        query = db.insert(self.table)
+        records_list = self._mappings(records)
+
+        try:
+            self.connection.execute(query, records_list)
+            log.info(f"created {self.resource.name} record {records_list} in db")
+        except Exception as e:
+            raise Exception(f"failed to create {self.resource.name} record {records} in db with error {e}")
+
+    def upsert_records(self, records):
+        '''
+        Create or update records, with MySql it is a single
+        INSERT ... ON DUPLICATE KEY UPDATE statement.
+        '''
+        if self.engine.dialect.name != 'mysql':
+            keys = [record[0] for record in records]
+            query = db.select([self.key]).where(self.key.in_(keys))
+            existing = {row[0] for row in self.connection.execute(query)}
+            update = [record for record in records if record[0] in existing]
+            create = [record for record in records if record[0] not in existing]
+            if update:
+                self.update_records(update)
+            if create:
+                self.create_records(create)
+            return
+
+        query = mysql.insert(self.table)
+        query = query.on_duplicate_key_update(**{field: query.inserted[field] for field in self.resource.fields[1:]},
+                                              **self._bump_version())
+        records_list = self._mappings(records)
+        try:
+            self.connection.execute(query, records_list)
+            log.info(f"upserted {self.resource.name} record {records_list} in db")
+        except Exception as e:
+            raise Exception(f"failed to upsert {self.resource.name} record {records} in db with error {e}")
+
+    def delete_records(self, records):
+        query = db.delete(self.table)
+        query = query.where(self.key.in_([record[0] for record in records]))
+        try:
+            self.connection.execute(query)
+            log.info(f"deleted {self.resource.name} record {records} in db")
+        except Exception as e:
+            raise Exception(f"failed to delete {self.resource.name} record {records} in db with error {e}")
+
+
+def synced_resources():
+    # the resources synced from device to database, vlans by default
+    return stored_resources(get_option('resources', 'synchronizer') or ['vlans'])
+
+
+@contextmanager
+def resources_db(resources=None):
+    # check out a pooled connection for the duration of a cycle, the
+    # writes of all the resources run in a short transaction on it.
+    engine = get_engine()
+    with engine.connect() as connection:
+        yield [ResourceDb(engine, connection, metadata, resource) for resource in resources or synced_resources()]
 
 
 def sort_on_first(elem):
     return elem[0]
 
 
+class RecordSnapshot(object):
+    """
+    Records of a resource keyed on the first field with a hash of
+    each record, two snapshots are compared in linear time.
+    """
+    def __init__(self, records=()):
+        self.records = {}
+        self.hashes = {}
+        for record in records:
+            record = tuple(record)
+            self.records[record[0]] = record
+            self.hashes[record[0]] = hash(record[1:])
+
+    def __len__(self):
+        return len(self.records)
+
+    def diff(self, other):
+        '''
+        Compute the records to be changed to move from this snapshot to other
+        :param other: RecordSnapshot object
+        :return: tuple of list of records to be created, updated and deleted
+        '''
+        create = [other.records[key] for key in other.hashes if key not in self.hashes]
+        update = [other.records[key] for key, digest in other.hashes.items()
+                  if key in self.hashes and self.hashes[key] != digest]
+        delete = [self.records[key] for key in self.hashes if key not in other.hashes]
+        return sorted(create, key=sort_on_first), sorted(update, key=sort_on_first), sorted(delete, key=sort_on_first)
+
+
+def snapshot(resource, records):
+    '''
+    :param resource: Resource object
+    :param records: iterable of tuple of field values of the resource
+    :return: VlanState object for vlans, else RecordSnapshot object
+    '''
+    if resource.name == VLANS.name:
+        return VlanState(records)
+    return RecordSnapshot(records)
+
+
+class SyncState(object):
+    """
+    State carried across sync cycles, in incremental mode the cycle is
+    skipped if both the database checksum and the fingerprint of the
+    reference device are same as that of last cycle.
+    """
+    def __init__(self, incremental=True):
+        self.incremental = incremental
+        self.checksum = None
+        self.fingerprint = None
+        # resource name to RecordSnapshot or VlanState of database
+        self.db_snapshots = None
+
+
+def tables_checksum(resource_dbs):
+    checksums = tuple(resource_db.checksum() for resource_db in resource_dbs)
+    return None if None in checksums else checksums
+
+
+def reference_host(manage_vlans):
+    std_dev = get_option('reference_host', 'synchronizer')
+    if std_dev not in manage_vlans.hosts:
+        std_dev = sorted(manage_vlans.hosts)[0]
+    return std_dev
+
+
+def sync_resources(resource_dbs, manage_vlans, state, lease=None):
+    '''
+    Sync the database tables of the resources from the reference host
+    :param resource_dbs: list of ResourceDb objects
+    :param manage_vlans: ManageVlans object
+    :param state: SyncState object
+    :param lease: Callable that renews the lease of the leader, the database
+                  is not updated if it returns False
+    '''
+    start = time.perf_counter()
+    outcome = 'failed'
+    try:
+        outcome = _sync_resources(resource_dbs, manage_vlans, state, lease)
+    finally:
+        SYNC_CYCLE_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+
+
+def _sync_resources(resource_dbs, manage_vlans, state, lease=None):
+    # assuming the reference host (first device in the list
+    # by default) has the final config
+    std_dev = reference_host(manage_vlans)
+    names = [resource_db.resource.name for resource_db in resource_dbs]
+
+    checksum = None
+    fingerprint = None
+    if state.incremental:
+        checksum = tables_checksum(resource_dbs)
+        fingerprint = manage_vlans.get_fingerprints([std_dev]).data.get(std_dev)
+        if (state.db_snapshots is not None and set(state.db_snapshots) == set(names) and checksum is not None
+                and fingerprint is not None and checksum == state.checksum and fingerprint == state.fingerprint):
+            log.debug("no change in db and device since last sync, skip cycle")
+            return 'skipped'
+
+    # a sync of some of the resources, on a change notification, keeps
+    # the snapshots of those resources only
+    if (state.db_snapshots is None or set(state.db_snapshots) != set(names) or checksum is None
+            or checksum != state.checksum):
+        state.db_snapshots = {resource_db.resource.name: snapshot(resource_db.resource, resource_db.get_records())
+                              for resource_db in resource_dbs}
+
+    # the config in cache is valid if device config is not committed since
+    # last cycle, all the resources are fetched in a single device round trip
+    cached = fingerprint is not None and fingerprint == state.fingerprint
+    result = manage_vlans.get_resources(names, hosts=[std_dev], cached=cached)
+    if std_dev not in result.data:
+        # fallback to the first reachable device
+        result = manage_vlans.get_resources(names, cached=False)
+        if not result.data:
+            log.error(f"failed to fetch {', '.join(names)} from all hosts {result.failed}")
+            return 'failed'
+        std_dev = sorted(result.data)[0]
+        fingerprint = None
+
+    dev_snapshots = {}
+    changes = {}
+    for resource_db in resource_dbs:
+        resource = resource_db.resource
+        dev_snapshots[resource.name] = snapshot(resource, (tuple(item.get(field) for field in resource.fields)
+                                                           for item in result.data[std_dev][resource.name] or []))
+        log.debug(f"{len(dev_snapshots[resource.name])} {resource.name} fetched from device {std_dev}, "
+                  f"{len(state.db_snapshots[resource.name])} from db")
+
+        changes[resource.name] = state.db_snapshots[resource.name].diff(dev_snapshots[resource.name])
+        db_create, db_update, db_delete = changes[resource.name]
+        log.info(f"{resource.name} to be update in db {db_update}")
+        log.info(f"{resource.name} to be created in db {db_create}")
+        log.info(f"{resource.name} to be deleted in db {db_delete}")
+
+    # the device round trips may outlast the lease, renew it before the
+    # write, another worker may have taken over meanwhile
+    if lease is not None and not lease():
+        log.warning("lost the leader lease during sync cycle, skip database update")
+        return 'aborted'
+
+    # apply the changes of all the resources in a single transaction
+    with resource_dbs[0].connection.begin():
+        for resource_db in resource_dbs:
+            db_create, db_update, db_delete = changes[resource_db.resource.name]
+            if db_update or db_create:
+                resource_db.upsert_records(db_update + db_create)
+
+            if db_delete:
+                resource_db.delete_records(db_delete)
+
+            if db_update or db_create or db_delete:
+                resource_db.bump_table_version()
+
+    # database now has the same config as that of device
+    state.db_snapshots = dev_snapshots
+    synced = any(any(change) for change in changes.values())
+    if synced:
+        DRIFT_CORRECTIONS.inc(source='database', host=std_dev)
+    if state.incremental and synced:
+        checksum = tables_checksum(resource_dbs)
+    state.checksum = checksum
+    state.fingerprint = fingerprint
+    return 'synced' if synced else 'unchanged'
+
+
+def reconcile_hosts(resource_dbs, manage_vlans, hosts):
+    # config on hosts is changed outside the app, push database state on
+    # them, the resources of a host are overridden in a single transaction
+    names = [resource_db.resource.name for resource_db in resource_dbs]
+    changes = [(resource_db.resource.name, resource_db.get_config(), 'overridden') for resource_db in resource_dbs]
+    manage_vlans.get_resources(names, hosts=hosts, cached=False)
+    result = manage_vlans.edit_resources(changes, hosts=hosts)
+    for host, host_result in result.results.items():
+        if host_result.failed:
+            log.error(f"failed to reconcile {', '.join(names)} on host {host} with error {host_result.error}")
+        elif host_result.changed:
+            DRIFT_CORRECTIONS.inc(source='synchronizer', host=host)
+            log.info(f"reconciled {', '.join(names)} drift on host {host} from db")
+    return result
+
+
+def content_digest(resources, data):
+    '''
+    Digest of config independent of the order of items, an empty value
+    is same as a missing one
+    :param resources: list of Resource objects
+    :param data: dict of resource name to list of dict of config
+    :return: hex digest string
+    '''
+    content = {}
+    for resource in resources:
+        items = ({key: value for key, value in normalize(item, resource).items() if value != ''}
+                 for item in data.get(resource.name) or [])
+        content[resource.name] = sorted(items, key=lambda item: str(item[resource.key]))
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def drifted_hosts(resource_dbs, manage_vlans, hosts):
+    '''
+    Compare the digest of the config of each host with that of database,
+    used for the hosts without a commit fingerprint
+    :param resource_dbs: list of ResourceDb objects
+    :param manage_vlans: ManageVlans object
+    :param hosts: list of host names
+    :return: list of the hosts that differ from database or failed
+    '''
+    resources = [resource_db.resource for resource_db in resource_dbs]
+    db_digest = content_digest(resources, {resource_db.resource.name: resource_db.get_config()
+                                           for resource_db in resource_dbs})
+    result = manage_vlans.get_resources([resource.name for resource in resources], hosts=hosts, cached=False)
+    return sorted(set(result.failed) | set(host for host, data in result.data.items()
+                                           if content_digest(resources, data) != db_digest))
+
+
+def run_poll(manage_vlans, state, stop=None):
+    interval = get_option('interval', 'synchronizer') or 10
+    stop = stop or threading.Event()
+    while not stop.wait(interval):
+        # a failed cycle, for example database unreachable, is retried on next one
+        try:
+            with resources_db() as resource_dbs:
+                sync_resources(resource_dbs, manage_vlans, state)
+        except Exception as e:
+            log.error(f"sync cycle failed with error {e}")
+
+
+def sync_changes(manage_vlans, state, resources, changed):
+    # changed is dict of host name to the names of the resources notified
+    # as changed on the host
+    std_dev = reference_host(manage_vlans)
+    changed = dict(changed)
+    if std_dev in changed:
+        # reference config changed, fetch it from device
+        names = changed.pop(std_dev)
+        with resources_db([resource for resource in resources if resource.name in names]) as resource_dbs:
+            state.fingerprint = None
+            sync_resources(resource_dbs, manage_vlans, state)
+
+    # the hosts with the same changed resources are reconciled together
+    groups = {}
+    for host, names in changed.items():
+        groups.setdefault(frozenset(names), []).append(host)
+    for names, hosts in groups.items():
+        with resources_db([resource for resource in resources if resource.name in names]) as resource_dbs:
+            reconcile_hosts(resource_dbs, manage_vlans, sorted(hosts))
+
+
+def run_events(manage_vlans, state, stop=None):
+    # sync only the host and the resources that notified a config change,
+    # a full sync runs at slow interval as fallback for lost notifications.
+    fallback_interval = get_option('fallback_interval', 'synchronizer') or 300
+    stop = stop or threading.Event()
+    resources = synced_resources()
+    events = queue.Queue()
+    listener = NotificationListener(manage_vlans.notification_sources(),
+                                    lambda host, resource: events.put((host, resource)),
+                                    resources=[resource.name for resource in resources])
+    listener.start()
+
+    next_full_sync = 0
+    try:
+        while not stop.is_set():
+            try:
+                # wake up every second to check for stop
+                event = events.get(timeout=min(max(0, next_full_sync - time.monotonic()), 1))
+            except queue.Empty:
+                if time.monotonic() >= next_full_sync:
+                    log.debug("running fallback full sync")
+                    try:
+                        with resources_db(resources) as resource_dbs:
+                            sync_resources(resource_dbs, manage_vlans, state)
+                    except Exception as e:
+                        log.error(f"fallback full sync failed with error {e}")
+                    next_full_sync = time.monotonic() + fallback_interval
+                continue
+
+            # coalesce the burst of notifications, host to the changed resources
+            changed = {}
+            while event:
+                host, resource = event
+                changed.setdefault(host, set()).add(resource)
+                event = None if events.empty() else events.get_nowait()
+
+            try:
+                sync_changes(manage_vlans, state, resources, changed)
+            except Exception as e:
+                # the changes missed are covered by the fallback full sync
+                log.error(f"sync of changes on hosts {', '.join(sorted(changed))} failed with error {e}")
+    finally:
+        listener.stop()
+
+
+def run_sharded(manage_vlans, state, stop=None):
+    # Each worker reconciles the hosts it owns on the hash ring of live
+    # workers, the hosts of a dead worker move to others once its heartbeat
+    # expires. Only the leader writes the tables from reference device.
+    interval = get_option('interval', 'synchronizer') or 10
+    ttl = get_option('heartbeat_ttl', 'sharding') or 3 * interval
+    engine = get_engine()
+    registry = WorkerRegistry(engine, metadata, worker_id=get_option('worker_id', 'sharding'), ttl=ttl)
+    leader = AdvisoryLock(engine, metadata, 'synchronizer-leader', registry.worker_id, ttl=ttl)
+    fingerprints = {}
+    stop = stop or threading.Event()
+    log.info(f"starting synchronizer worker {registry.worker_id}")
+    try:
+        while not stop.is_set():
+            registry.heartbeat()
+            ring = HashRing(registry.live_workers())
+            std_dev = reference_host(manage_vlans)
+
+            with resources_db() as resource_dbs:
+                if leader.acquire():
+                    sync_resources(resource_dbs, manage_vlans, state, lease=leader.acquire)
+                    # the sync may have taken a good part of the ttl
+                    registry.heartbeat()
+
+                hosts = [host for host in manage_vlans.hosts
+                         if host != std_dev and ring.owner(host) == registry.worker_id]
+                if hosts:
+                    # reconcile only the hosts with a new commit since last cycle
+                    result = manage_vlans.get_fingerprints(hosts)
+                    changed = [host for host in hosts if host in result.failed
+                               or result.data[host] is not None and result.data[host] != fingerprints.get(host)]
+                    # the provider has no fingerprint, for example ansible,
+                    # reconcile the hosts whose config differs from database
+                    unknown = [host for host, fingerprint in result.data.items() if fingerprint is None]
+                    if unknown:
+                        changed = sorted(set(changed) | set(drifted_hosts(resource_dbs, manage_vlans, unknown)))
+                    fingerprints = {host: result.data.get(host) for host in hosts}
+                    if changed:
+                        reconciled = reconcile_hosts(resource_dbs, manage_vlans, changed)
+                        # the reconcile commits on the hosts, keep the fingerprint
+                        # after it, a host that failed is retried on next cycle
+                        succeeded = [host for host in changed if host not in reconciled.failed]
+                        after = manage_vlans.get_fingerprints(succeeded) if succeeded else None
+                        for host in changed:
+                            fingerprints[host] = after.data.get(host) if host in succeeded else None
+
+            stop.wait(interval)
+    finally:
+        leader.release()
+        registry.leave()
+
+
 def run():
-    while True:
-        interval = get_option('interval', 'synchronizer')
-        time.sleep(10)
-
-        vlans_obj = VlansDb(engine, connection, metadata)
-        vlans_in_db = deepcopy(vlans_obj.get_vlans())
-        vlans_in_db = sorted(vlans_in_db, key=sort_on_first)
-        log.debug(f"vlans fetched from db {vlans_in_db}")
-        db_vlan_update = []
-        db_vlan_delete = deepcopy(vlans_in_db)
-
-        manage_vlans = manage.ManageVlans()
-        result = manage_vlans.get_vlans()
-
-        # assuming first device in the list has the final config
-        std_dev = list(result.keys())[0]
-
-        vlans_result = result[std_dev]
-        vlans_in_dev = []
-        for vlans in vlans_result:
-            vlans_in_dev.append((vlans['vlan_id'], vlans.get('name'), vlans.get('description')))
-
-        vlans_in_dev = sorted(vlans_in_dev, key=sort_on_first)
-        db_vlan_create = deepcopy(vlans_in_dev)
-        log.debug(f"vlans fetched from device {vlans_in_dev}")
-
-        for db_item in vlans_in_db:
-            for dev_item in vlans_in_dev:
-                if db_item[0] == dev_item[0]:
-                    if db_item[1] != dev_item[1] or db_item[2] != dev_item[2]:
-                        db_vlan_update.append((dev_item[0], dev_item[1], dev_item[2]))
-                    db_vlan_create.remove(dev_item)
-                    db_vlan_delete.remove(db_item)
-
-        log.info(f"vlans to be update in db {db_vlan_update}")
-        log.info(f"vlans to be created in db {db_vlan_create}")
-        log.info(f"vlans to be deleted in db {db_vlan_delete}")
-
-        if db_vlan_update:
-            vlans_obj.update_db_vlans(db_vlan_update)
-
-        if db_vlan_create:
-            vlans_obj.create_db_vlans(db_vlan_create)
-
-        if db_vlan_delete:
-            vlans_obj.delete_db_vlans(db_vlan_delete)
+    setup_logging()
+    metrics_port = get_option('metrics_port', 'synchronizer')
+    if metrics_port:
+        start_http_server(metrics_port)
+
+    incremental = get_option('incremental', 'synchronizer')
+    state = SyncState(incremental=incremental is not False)
+    manage_vlans = manage.ManageVlans()
+    if get_option('enabled', 'sharding'):
+        run_sharded(manage_vlans, state)
+    elif get_option('mode', 'synchronizer') == 'events':
+        run_events(manage_vlans, state)
+    else:
+        run_poll(manage_vlans, state)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from config import base
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, os.pardir, os.pardir)
+
+
+@pytest.fixture
+def config_dir(tmp_path, monkeypatch):
+    # directory of the config file, read on first use
+    monkeypatch.setattr(base, 'CONFIG_DATA', None)
+    monkeypatch.setenv('CONFIGURATOR_CFG', str(tmp_path))
+    return tmp_path
+
+
+def test_load_config_once(config_dir):
+    (config_dir / 'configurator.cfg').write_text('defaults:\n  provider: fake\n')
+    assert base.CONFIG_DATA is None
+    assert base.get_option('provider') == 'fake'
+
+    # the config is cached for the lifetime of the process
+    (config_dir / 'configurator.cfg').write_text('defaults:\n  provider: netconf\n')
+    assert base.load_config() == {'defaults': {'provider': 'fake'}}
+
+
+def test_empty_config(config_dir):
+    (config_dir / 'configurator.cfg').write_text('')
+    assert base.load_config() == {}
+    assert base.get_option('provider') is None
+
+
+def test_missing_config(config_dir):
+    with pytest.raises(IOError):
+        base.load_config()
+
+
+def test_db_url(config_dir):
+    (config_dir / 'configurator.cfg').write_text('database:\n  dialect: mysql\n  user: root\n  password: pw\n'
+                                                 '  host: db\n  name: configurator\n')
+    assert base.get_db_url() == 'mysql://root:pw@db/configurator'
+    base.CONFIG_DATA['database']['url'] = 'sqlite:///configurator.db'
+    assert base.get_db_url() == 'sqlite:///configurator.db'
+
+
+@pytest.mark.parametrize('module', ['database', 'server', 'synchronizer', 'asgi'])
+def test_import_reads_nothing(tmp_path, module):
+    # the modules import without config file, database and provider
+    env = dict(os.environ, CONFIGURATOR_CFG=str(tmp_path / 'missing'), LOGLEVEL='WARNING',
+               PYTHONPATH=os.pathsep.join([os.path.join(ROOT, 'src', 'configurator'), os.path.join(ROOT, 'src')]))
+    code = f"import {module}; from config import base; assert base.CONFIG_DATA is None"
+    subprocess.run([sys.executable, '-c', code], env=env, check=True)
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import sys
+
+from json import dumps
+
+import pytest
+
+# the programs of the app import their modules from src/configurator
+SRC = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, os.pardir, 'src')
+for path in (os.path.join(SRC, 'configurator'), SRC):
+    if os.path.realpath(path) not in map(os.path.realpath, sys.path):
+        sys.path.insert(0, os.path.realpath(path))
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    '''
+    Config of the process with a SQLite database in a temporary directory and
+    two fake devices, a test changes the sections before the app is created
+    '''
+    from config import base
+
+    data = {
+        'database': {'url': f"sqlite:///{tmp_path / 'configurator.db'}"},
+        'defaults': {'provider': 'fake'},
+        'fake': {'hosts': 2},
+        'reconciler': {'enabled': False},
+    }
+    monkeypatch.setattr(base, 'CONFIG_DATA', data)
+    return data
+
+
+@pytest.fixture
+def fake(config):
+    from configurator.provider.fake.vlans import FakeManageVlans
+    return FakeManageVlans()
+
+
+@pytest.fixture
+def manage_vlans(fake):
+    from configurator.provider import manage
+    return manage.ManageVlans(obj=fake)
+
+
+@pytest.fixture
+def down(fake, monkeypatch):
+    '''
+    Set of the host names that fail every device round trip
+    '''
+    hosts = set()
+    round_trip = fake._round_trip
+    round_trip_async = fake._round_trip_async
+
+    def fail(host):
+        if host in hosts:
+            raise Exception(f"host {host} unreachable")
+
+    def _round_trip(host, action):
+        fail(host)
+        return round_trip(host, action)
+
+    async def _round_trip_async(host, action):
+        fail(host)
+        return await round_trip_async(host, action)
+
+    monkeypatch.setattr(fake, '_round_trip', _round_trip)
+    monkeypatch.setattr(fake, '_round_trip_async', _round_trip_async)
+    return hosts
+
+
+@pytest.fixture
+def app(manage_vlans):
+    import server
+    from database import db
+
+    app = server.create_app(manage_vlans)
+    with app.app_context():
+        db.create_all()
+    yield app
+    server.stop_background(app)
+
+
+class Response(object):
+    def __init__(self, status, headers, body):
+        self.status = status
+        # header names in lower case
+        self.headers = headers
+        self.body = body
+
+    @property
+    def json(self):
+        return json.loads(self.body)
+
+    def lines(self):
+        return [json.loads(line) for line in self.body.splitlines() if line.strip()]
+
+
+class WsgiClient(object):
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json=None, data=None, headers=None, content_type=None):
+        response = self.client.open(path, method=method, json=json, data=data, headers=headers,
+                                    content_type=content_type)
+        return Response(response.status_code, {name.lower(): value for name, value in response.headers.items()},
+                        response.get_data())
+
+
+class AsgiClient(object):
+    def __init__(self, app):
+        import asgi
+        self.app = asgi.AsgiApp(app, workers=4)
+
+    def request(self, method, path, json=None, data=None, headers=None, content_type=None):
+        if json is not None:
+            data = dumps(json)
+            content_type = 'application/json'
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        data = data or b''
+        path, _, query = path.partition('?')
+        header_list = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                       for name, value in (headers or {}).items()]
+        if content_type:
+            header_list.append((b'content-type', content_type.encode('latin-1')))
+        header_list.append((b'content-length', str(len(data)).encode('latin-1')))
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode('latin-1'),
+                 'headers': header_list, 'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+                 'server': ('testserver', 80), 'client': ('127.0.0.1', 40000)}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': data, 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.app(scope, receive, send))
+        start = messages[0]
+        return Response(start['status'], {name.decode('latin-1'): value.decode('latin-1')
+                                          for name, value in start['headers']},
+                        b''.join(message.get('body', b'') for message in messages[1:]))
+
+
+@pytest.fixture(params=['wsgi', 'asgi'])
+def client(request, app):
+    '''
+    Client of the REST API served by the Flask app and by the ASGI adapter
+    '''
+    client = WsgiClient(app) if request.param == 'wsgi' else AsgiClient(app)
+    yield client
+    if request.param == 'asgi':
+        client.app.executor.shutdown(wait=True)
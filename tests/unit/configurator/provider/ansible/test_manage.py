@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from configurator.provider import manage
+
+
+@pytest.fixture
+def batched(fake):
+    return manage.ManageVlans(obj=fake, batch_window_ms=200)
+
+
+def run_edits(manage_vlans, edits, delay=0):
+    '''
+    Run each (config, action) edit in its own thread, delay seconds apart
+    :return: list of FanoutResult object or exception of each edit
+    '''
+    results = [None] * len(edits)
+
+    def run(index, config, action):
+        try:
+            results[index] = manage_vlans.edit_vlans(config, action=action)
+        except Exception as e:
+            results[index] = e
+
+    threads = []
+    for index, (config, action) in enumerate(edits):
+        thread = threading.Thread(target=run, args=(index, config, action))
+        thread.start()
+        threads.append(thread)
+        time.sleep(delay)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def changed_hosts(result):
+    return sorted(host for host, host_result in result.results.items() if host_result.changed)
+
+
+def test_edit_without_batching(manage_vlans, fake):
+    result = manage_vlans.edit_vlans({'vlan_id': 10, 'name': 'ten'})
+    assert changed_hosts(result) == ['fake1', 'fake2']
+    assert manage_vlans.edit_vlans({'vlan_id': 10, 'name': 'ten'}).changed is False
+    assert fake.commits == {'fake1': 1, 'fake2': 1}
+
+
+def test_concurrent_edits_coalesced(batched, fake):
+    # vlan 5 is already on the devices, its edit changes nothing
+    fake.configure('fake1', [{'vlan_id': 5, 'name': 'five'}])
+    fake.configure('fake2', [{'vlan_id': 5, 'name': 'five'}])
+    results = run_edits(batched, [([{'vlan_id': vlan_id, 'name': f'v{vlan_id}'}], 'merged') for vlan_id in (10, 11)] +
+                        [([{'vlan_id': 5, 'name': 'five'}], 'merged')])
+
+    # a single device transaction per host
+    assert fake.commits == {'fake1': 2, 'fake2': 2}
+    assert sorted(fake.config[('fake1', 'vlans')]) == [5, 10, 11]
+    # changed is computed from the own changes of each caller
+    assert [changed_hosts(result) for result in results] == [['fake1', 'fake2'], ['fake1', 'fake2'], []]
+    # each caller gets its own result objects
+    assert results[0].results['fake1'] is not results[1].results['fake1']
+
+
+def test_invalid_edit_isolated(batched, fake):
+    results = run_edits(batched, [([{'vlan_id': 10, 'name': 'ten'}], 'merged'),
+                                  ([{'name': 'no id'}], 'merged'),
+                                  ([{'vlan_id': 11, 'name': 'eleven'}], 'gathered')])
+    assert changed_hosts(results[0]) == ['fake1', 'fake2']
+    assert str(results[1]) == "vlan_id missing in vlans config {'name': 'no id'}"
+    assert isinstance(results[2], Exception)
+    assert sorted(fake.config[('fake2', 'vlans')]) == [10]
+    assert fake.commits == {'fake1': 1, 'fake2': 1}
+
+
+def test_conflicting_keys_applied_in_order(batched, fake):
+    results = run_edits(batched, [([{'vlan_id': 10, 'name': 'first'}], 'merged'),
+                                  ([{'vlan_id': 10, 'name': 'second'}], 'merged'),
+                                  ([{'vlan_id': 11, 'name': 'eleven'}], 'merged')], delay=0.05)
+
+    # the second edit of vlan 10 waits for the next batch instead of
+    # overwriting the first one, the edit of vlan 11 joins the first batch
+    assert fake.commits == {'fake1': 2, 'fake2': 2}
+    assert fake.config[('fake1', 'vlans')][10] == {'vlan_id': 10, 'name': 'second'}
+    assert [changed_hosts(result) for result in results] == [['fake1', 'fake2']] * 3
+
+
+def test_batch_failure_shared(batched, fake, down):
+    down.add('fake2')
+    results = run_edits(batched, [([{'vlan_id': 10, 'name': 'ten'}], 'merged'),
+                                  ([{'vlan_id': 11, 'name': 'eleven'}], 'merged')])
+    for result in results:
+        assert changed_hosts(result) == ['fake1']
+        assert list(result.failed) == ['fake2']
@@ -0,0 +1,124 @@
+import os
+
+from types import SimpleNamespace
+
+import pytest
+
+from configurator.provider.ansible import vlans
+from configurator.provider.ansible.vlans import AnsibleManageVlans, RunEvents
+
+VLAN_FACTS = {'ansible_facts': {'ansible_network_resources': {'vlans': [{'vlan_id': 10, 'name': 'ten'}]}}}
+
+
+def event(name, host, **data):
+    return {'event': name, 'event_data': dict(data, host=host)}
+
+
+class StubRunner(object):
+    '''
+    ansible_runner.run that sends the events given by the test to the
+    event handler and writes the artifact directory of the run
+    '''
+    def __init__(self):
+        self.runs = []
+        self.events = []
+
+    def __call__(self, private_data_dir, **kwargs):
+        self.runs.append(kwargs)
+        os.makedirs(os.path.join(kwargs['artifact_dir'], kwargs['ident']))
+        for item in self.events:
+            # the handler keeps the events in memory, none is written to disk
+            assert kwargs['event_handler'](item) is False
+        return SimpleNamespace(status='successful', rc=0, stats={})
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    runner = StubRunner()
+    monkeypatch.setattr(vlans.ansible_runner, 'run', runner)
+    return runner
+
+
+@pytest.fixture
+def provider(config, tmp_path):
+    os.makedirs(tmp_path / 'inventory')
+    (tmp_path / 'inventory' / 'hosts').write_text('[junos]\nsw1\nsw2\nsw3\n\n[network:children]\njunos\n')
+    config['ansible'] = {'artifact_dir': str(tmp_path / 'artifacts')}
+    return lambda: AnsibleManageVlans(private_data_dir=str(tmp_path))
+
+
+def test_run_events():
+    events = RunEvents(['sw1', 'sw2', 'sw3'])
+    assert events(event('runner_on_ok', 'sw1', res=dict(VLAN_FACTS, changed=True))) is False
+    events(event('runner_on_ok', 'sw2', res={'changed': False}))
+    events(event('runner_on_failed', 'sw2', res={'msg': 'commit failed'}))
+    events(event('runner_on_failed', 'sw2', res={'msg': 'second error'}))
+    # an ignored error and the events of other hosts are not failures
+    events(event('runner_on_failed', 'sw1', res={'msg': 'ignored'}, ignore_errors=True))
+    events(event('runner_on_ok', 'other', res=VLAN_FACTS))
+    events({'event': 'playbook_on_start'})
+
+    runner = SimpleNamespace(status='failed')
+    assert events.facts['sw1'] == {'vlans': [{'vlan_id': 10, 'name': 'ten'}]}
+    assert events.changed == {'sw1'}
+    assert events.error('sw1', runner) is None
+    # the first error of the host
+    assert events.error('sw2', runner) == 'commit failed'
+    assert events.error('sw3', runner) == 'no result for host, status: failed'
+
+
+def test_unreachable_host():
+    events = RunEvents(['sw1'])
+    events(event('runner_on_unreachable', 'sw1', res={}))
+    assert events.error('sw1', None) == 'runner_on_unreachable'
+
+
+def test_get_resources_in_one_run(provider, runner, tmp_path):
+    runner.events = [event('runner_on_ok', 'sw1', res=VLAN_FACTS), event('runner_on_ok', 'sw2', res={}),
+                     event('runner_on_failed', 'sw3', res={'msg': 'timeout'})]
+    config = provider().get_resources(['sw1', 'sw2', 'sw3'], ['vlans'])
+
+    assert len(runner.runs) == 1
+    assert runner.runs[0]['limit'] == 'sw1,sw2,sw3'
+    assert runner.runs[0]['fact_cache_type'] == 'memory'
+    assert config['sw1'] == {'vlans': [{'vlan_id': 10, 'name': 'ten'}]}
+    assert config['sw2'] == {'vlans': []}
+    assert 'timeout' in str(config['sw3'])
+    # the artifacts of the run are removed
+    assert os.listdir(tmp_path / 'artifacts') == []
+
+
+def test_keep_artifacts(provider, runner, config, tmp_path):
+    config['ansible']['keep_artifacts'] = 3
+    runner.events = [event('runner_on_ok', 'sw1', res=VLAN_FACTS)]
+    manage = provider()
+    manage.get_resources(['sw1'], ['vlans'])
+    manage.get_resources(['sw1'], ['vlans'])
+
+    # the runner rotates the artifacts of the last runs
+    assert [run['rotate_artifacts'] for run in runner.runs] == [3, 3]
+    assert sorted(os.listdir(tmp_path / 'artifacts')) == sorted(run['ident'] for run in runner.runs)
+
+
+def test_edit_in_one_run(provider, runner):
+    manage = provider()
+    runner.events = [event('runner_on_ok', host, res=VLAN_FACTS) for host in ('sw1', 'sw2', 'sw3')]
+    manage.get_resources(['sw1', 'sw2', 'sw3'], ['vlans'])
+
+    # no run if the devices already have the config
+    assert manage.apply_resource_changes(['sw1', 'sw2'], [('vlans', [{'vlan_id': 10, 'name': 'ten'}], 'merged')]) == {
+        'sw1': False, 'sw2': False}
+    assert len(runner.runs) == 1
+
+    # sw1 sends no event
+    runner.events = [event('runner_on_ok', 'sw2', res={'changed': True}), event('runner_on_ok', 'sw3', res={})]
+    outcome = manage.apply_resource_changes(['sw1', 'sw2', 'sw3'],
+                                            [('vlans', [{'vlan_id': 11, 'name': 'x'}], 'merged')])
+    assert len(runner.runs) == 2
+    assert runner.runs[-1]['limit'] == 'sw1,sw2,sw3'
+    assert 'no result for host' in str(outcome['sw1'])
+    assert outcome['sw2'] is True
+    assert outcome['sw3'] is False
+    # the device state of the failed host is gathered again on next edit
+    assert ('sw1', 'vlans') not in manage.device_state
+    assert sorted(manage.device_state[('sw2', 'vlans')]) == [10, 11]
@@ -0,0 +1,32 @@
+import pytest
+
+from configurator.provider.netconf.notifications import changed_resources, is_config_change
+
+RESOURCES = ['vlans', 'interfaces']
+
+
+def config_change(*targets):
+    edits = ''.join(f'<edit><target>{target}</target><operation>merge</operation></edit>' for target in targets)
+    return ('<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">'
+            '<eventTime>2020-01-01T00:00:00Z</eventTime>'
+            '<netconf-config-change xmlns="urn:ietf:params:xml:ns:yang:ietf-netconf-notifications">'
+            f'{edits}</netconf-config-change></notification>')
+
+
+@pytest.mark.parametrize('notification, changed', [
+    (config_change(), RESOURCES),
+    (config_change("/nc:configuration/vlans/vlan[name='v10']/vlan-id"), ['vlans']),
+    (config_change("/if:interfaces/if:interface[if:name='ge-0/0/0/vlans']"), ['interfaces']),
+    (config_change('/configuration/interfaces', '/configuration/vlans'), RESOURCES),
+    (config_change('/configuration/system/host-name'), []),
+    ('<notification><commit-complete/></notification>', RESOURCES),
+    ('<notification><eventTime>2020-01-01T00:00:00Z</eventTime></notification>', []),
+    ('not xml', []),
+])
+def test_changed_resources(notification, changed):
+    assert changed_resources(notification, RESOURCES) == changed
+
+
+def test_is_config_change():
+    assert is_config_change('<notification><event><type>UI_COMMIT_COMPLETED</type></event></notification>')
+    assert not is_config_change('<notification><event><type>SNMP_TRAP</type></event></notification>')
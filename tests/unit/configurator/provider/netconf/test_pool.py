@@ -0,0 +1,144 @@
+import threading
+
+import pytest
+
+from configurator.provider.netconf.pool import NetconfSessionPool
+
+
+class StubSession(object):
+    def __init__(self, host):
+        self.host = host
+        self.connected = True
+        self.closed = False
+
+    def close_session(self):
+        self.closed = True
+        self.connected = False
+
+    def get_config(self, source, filter=None):
+        if not self.connected:
+            raise Exception(f"session to host {self.host} is closed")
+
+
+class StubConnect(object):
+    def __init__(self):
+        self.sessions = []
+
+    def __call__(self, host, **kwargs):
+        session = StubSession(host)
+        self.sessions.append(session)
+        return session
+
+
+@pytest.fixture
+def connect():
+    return StubConnect()
+
+
+@pytest.fixture
+def pool(connect):
+    pool = NetconfSessionPool({'host1': {'ansible_host': '10.0.0.1'}, 'host2': {}}, max_size=2, timeout=0.5,
+                              keepalive_interval=0, connect=connect)
+    yield pool
+    pool.close()
+
+
+def test_session_reused(pool, connect):
+    with pool.session('host1') as first:
+        pass
+    with pool.session('host1') as second:
+        pass
+    assert second is first
+    assert len(connect.sessions) == 1
+
+
+def test_session_per_host(pool, connect):
+    with pool.session('host1') as first, pool.session('host2') as second:
+        assert first is not second
+    assert [session.host for session in connect.sessions] == ['10.0.0.1', 'host2']
+
+
+def test_broken_session_evicted_and_reconnected(pool, connect):
+    with pytest.raises(Exception):
+        with pool.session('host1') as first:
+            first.connected = False
+            raise Exception("connection reset")
+    assert first.closed
+
+    with pool.session('host1') as second:
+        assert second is not first
+        assert second.connected
+    assert len(connect.sessions) == 2
+
+
+def test_disconnected_idle_session_reconnected(pool, connect):
+    with pool.session('host1') as first:
+        pass
+    # dropped by the device while idle in the pool
+    first.connected = False
+    with pool.session('host1') as second:
+        assert second is not first
+    assert len(connect.sessions) == 2
+
+
+def test_keepalive_drops_dead_session(pool, connect):
+    with pool.session('host1') as first:
+        pass
+    first.connected = False
+    pool.keepalive()
+    assert first.closed
+    with pool.session('host1') as second:
+        assert second is not first
+
+
+def test_max_sessions_limit(pool, connect):
+    with pool.session('host1'), pool.session('host1'):
+        with pytest.raises(Exception, match='timed out waiting for free netconf session'):
+            with pool.session('host1'):
+                pass
+    assert len(connect.sessions) == 2
+
+
+def test_waiter_gets_released_session(pool, connect):
+    acquired = threading.Event()
+    release = threading.Event()
+    borrowed = []
+
+    def hold():
+        with pool.session('host1') as session:
+            borrowed.append(session)
+            acquired.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    acquired.wait()
+    with pool.session('host1') as second:
+        release.set()
+        with pool.session('host1') as third:
+            # the limit is reached until the held session is returned
+            assert third is borrowed[0]
+    thread.join()
+    assert second is not borrowed[0]
+    assert len(connect.sessions) == 2
+
+
+def test_failed_connect_frees_slot(pool, connect):
+    def refuse(host, **kwargs):
+        raise Exception(f"connection to {host} refused")
+
+    pool.connect = refuse
+    for _ in range(3):
+        with pytest.raises(Exception, match='refused'):
+            with pool.session('host1'):
+                pass
+    pool.connect = connect
+    with pool.session('host1'), pool.session('host1'):
+        pass
+    assert len(connect.sessions) == 2
+
+
+def test_unknown_host(pool):
+    with pytest.raises(Exception, match='not found in inventory'):
+        with pool.session('host3'):
+            pass
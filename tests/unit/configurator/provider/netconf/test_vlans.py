@@ -0,0 +1,116 @@
+from contextlib import contextmanager
+from unittest import mock
+
+import pytest
+
+from configurator.provider.diff import to_state
+from configurator.provider.netconf.vlans import NetconfManageVlans
+
+HOSTS = ['host1', 'host2']
+
+
+class StubPool(object):
+    def __init__(self):
+        # mocked ncclient manager of each host
+        self.sessions = {host: mock.MagicMock(name=host) for host in HOSTS}
+
+    @contextmanager
+    def session(self, host):
+        yield self.sessions[host]
+
+    def start(self):
+        pass
+
+
+@pytest.fixture
+def pool():
+    return StubPool()
+
+
+@pytest.fixture
+def netconf(config, tmp_path, pool):
+    inventory = tmp_path / 'inventory'
+    inventory.mkdir()
+    (inventory / 'hosts').write_text('[network]\nhost1\nhost2\n')
+    manage_vlans = NetconfManageVlans(private_data_dir=str(tmp_path), pool=pool)
+    for host in HOSTS:
+        manage_vlans.device_state[(host, 'vlans')] = to_state([{'vlan_id': 1, 'name': 'one'}])
+    yield manage_vlans
+    manage_vlans.executor.shutdown()
+
+
+def apply(netconf):
+    return netconf.apply_resource_changes(HOSTS, [('vlans', [{'vlan_id': 10, 'name': 'ten'}], 'merged')])
+
+
+def calls(session):
+    return [call[0] for call in session.method_calls]
+
+
+def test_apply(netconf, pool):
+    assert apply(netconf) == {'host1': True, 'host2': True}
+    for session in pool.sessions.values():
+        assert calls(session) == ['lock', 'edit_config', 'validate', 'commit', 'commit', 'unlock']
+        assert session.commit.call_args_list == [mock.call(confirmed=True, timeout='60'), mock.call()]
+    assert sorted(netconf.device_state[('host1', 'vlans')]) == [1, 10]
+
+
+def test_apply_unchanged(netconf, pool):
+    netconf.device_state[('host2', 'vlans')] = to_state([{'vlan_id': 1, 'name': 'one'},
+                                                         {'vlan_id': 10, 'name': 'ten'}])
+    assert apply(netconf) == {'host1': True, 'host2': False}
+    assert calls(pool.sessions['host2']) == []
+
+
+def test_lock_failed(netconf, pool):
+    pool.sessions['host2'].lock.side_effect = Exception('candidate locked by another session')
+    outcome = apply(netconf)
+    assert str(outcome['host2']) == 'candidate locked by another session'
+    assert str(outcome['host1']) == 'rolled back on host host1, transaction failed on hosts host2'
+    # the candidate of host2 is not locked by the transaction and is left as is
+    assert calls(pool.sessions['host2']) == ['lock']
+    assert calls(pool.sessions['host1']) == ['lock', 'edit_config', 'validate', 'discard_changes', 'unlock']
+    # the state of the hosts is read again on next edit
+    assert ('host1', 'vlans') not in netconf.device_state
+
+
+def test_validate_failed(netconf, pool):
+    pool.sessions['host1'].validate.side_effect = Exception('invalid vlan')
+    outcome = apply(netconf)
+    assert str(outcome['host1']) == 'invalid vlan'
+    assert isinstance(outcome['host2'], Exception)
+    for session in pool.sessions.values():
+        assert calls(session) == ['lock', 'edit_config', 'validate', 'discard_changes', 'unlock']
+
+
+def test_confirmed_commit_failed(netconf, pool):
+    pool.sessions['host2'].commit.side_effect = Exception('commit failed')
+    outcome = apply(netconf)
+    assert str(outcome['host2']) == 'commit failed'
+    assert isinstance(outcome['host1'], Exception)
+    # the committed host cancels its confirmed commit, the other discards the candidate
+    assert calls(pool.sessions['host1']) == ['lock', 'edit_config', 'validate', 'commit', 'cancel_commit', 'unlock']
+    assert calls(pool.sessions['host2']) == ['lock', 'edit_config', 'validate', 'commit', 'discard_changes',
+                                             'unlock']
+
+
+def test_confirm_failed(netconf, pool):
+    pool.sessions['host2'].commit.side_effect = [None, Exception('session closed')]
+    outcome = apply(netconf)
+    # host2 rolls back by itself when the confirm timeout expires
+    assert outcome['host1'] is True
+    assert str(outcome['host2']) == 'session closed'
+    assert calls(pool.sessions['host2']) == ['lock', 'edit_config', 'validate', 'commit', 'commit', 'unlock']
+    assert ('host2', 'vlans') not in netconf.device_state
+    assert sorted(netconf.device_state[('host1', 'vlans')]) == [1, 10]
+
+
+def test_rollback_failed(netconf, pool):
+    pool.sessions['host2'].commit.side_effect = Exception('commit failed')
+    pool.sessions['host1'].cancel_commit.side_effect = Exception('session closed')
+    outcome = apply(netconf)
+    assert sorted(outcome) == HOSTS
+    assert all(isinstance(error, Exception) for error in outcome.values())
+    # the candidates are still unlocked
+    for session in pool.sessions.values():
+        assert calls(session)[-1] == 'unlock'
@@ -0,0 +1,146 @@
+import threading
+import time
+
+import pytest
+
+from configurator.provider import cache
+from configurator.provider.cache import DeviceStateCache
+
+
+class Loader(object):
+    """
+    Loader of the device values, counts its calls
+    """
+    def __init__(self):
+        self.calls = []
+        self.version = 0
+
+    def __call__(self, resources):
+        self.calls.append(list(resources))
+        return {resource: f'{resource}-{self.version}' for resource in resources}
+
+    def hosts(self, hosts, resources):
+        self.calls.append((list(hosts), list(resources)))
+        return {host: {resource: f'{host}-{resource}-{self.version}' for resource in resources}
+                for host in hosts if host != 'down'}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def loader():
+    return Loader()
+
+
+def wait_for(predicate, timeout=5):
+    # time.monotonic is the clock of the test
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise AssertionError("timed out waiting for condition")
+        time.sleep(0.01)
+
+
+def test_get_many(clock, loader):
+    state_cache = DeviceStateCache(ttl=30)
+    assert state_cache.get_many('host1', ['vlans', 'interfaces'], loader) == {
+        'vlans': 'vlans-0', 'interfaces': 'interfaces-0'}
+    loader.version = 1
+    assert state_cache.get_many('host1', ['vlans'], loader) == {'vlans': 'vlans-0'}
+    # the resources missing are loaded in a single call
+    assert loader.calls == [['vlans', 'interfaces']]
+    assert len(state_cache) == 2
+
+
+def test_ttl(clock, loader):
+    state_cache = DeviceStateCache(ttl=30)
+    state_cache.get_many('host1', ['vlans'], loader)
+    loader.version = 1
+    clock[0] += 29
+    assert state_cache.get_many('host1', ['vlans'], loader) == {'vlans': 'vlans-0'}
+    # an expired entry is loaded inline
+    clock[0] += 1
+    assert state_cache.get_many('host1', ['vlans'], loader) == {'vlans': 'vlans-1'}
+    assert len(loader.calls) == 2
+
+
+def test_lru(clock, loader):
+    state_cache = DeviceStateCache(ttl=30, max_entries=2)
+    state_cache.set(('host1', 'vlans'), 1)
+    state_cache.set(('host2', 'vlans'), 2)
+    # host1 is used, host2 is the least recently used
+    state_cache.get_many('host1', ['vlans'], loader)
+    state_cache.set(('host3', 'vlans'), 3)
+    assert len(state_cache) == 2
+    assert state_cache.get_many('host1', ['vlans'], loader) == {'vlans': 1}
+    assert state_cache.get_many('host2', ['vlans'], loader) == {'vlans': 'vlans-0'}
+
+
+def test_stale_while_revalidate(clock, loader):
+    state_cache = DeviceStateCache(ttl=30, stale_while_revalidate=True)
+    gate = threading.Event()
+
+    def slow_loader(resources):
+        gate.wait()
+        return loader(resources)
+
+    state_cache.set(('host1', 'vlans'), 'stale')
+    clock[0] += 60
+    loader.version = 1
+    # the stale value is returned and refreshed once in background
+    assert state_cache.get_many('host1', ['vlans'], slow_loader) == {'vlans': 'stale'}
+    assert state_cache.get_many('host1', ['vlans'], slow_loader) == {'vlans': 'stale'}
+    gate.set()
+    wait_for(lambda: state_cache.get_many('host1', ['vlans'], loader) == {'vlans': 'vlans-1'})
+    assert loader.calls == [['vlans']]
+
+
+def test_invalidate(clock, loader):
+    state_cache = DeviceStateCache(ttl=30)
+    state_cache.get_many('host1', ['vlans', 'interfaces'], loader)
+    state_cache.get_many('host2', ['vlans'], loader)
+    state_cache.invalidate('host1', 'vlans')
+    assert len(state_cache) == 2
+    state_cache.invalidate('host1')
+    assert len(state_cache) == 1
+
+
+def test_invalidate_during_load(clock, loader):
+    state_cache = DeviceStateCache(ttl=30)
+
+    def invalidating_loader(resources):
+        # an edit of host1 vlans completes while the values are loaded
+        state_cache.invalidate('host1', 'vlans')
+        return loader(resources)
+
+    state_cache.get_many('host1', ['vlans', 'interfaces'], invalidating_loader)
+    # the value loaded before the invalidate is not stored, the other key is
+    state_cache.get_many('host1', ['vlans', 'interfaces'], loader)
+    assert loader.calls == [['vlans', 'interfaces'], ['vlans']]
+
+
+def test_invalidate_other_host_during_load(clock, loader):
+    state_cache = DeviceStateCache(ttl=30)
+
+    def invalidating_loader(hosts, resources):
+        state_cache.invalidate('host3')
+        return loader.hosts(hosts, resources)
+
+    state_cache.get_hosts(['host1', 'host2'], ['vlans'], invalidating_loader)
+    # the invalidate of another host does not drop the loaded values
+    assert len(state_cache) == 2
+
+
+def test_get_hosts(clock, loader):
+    state_cache = DeviceStateCache(ttl=30)
+    values = state_cache.get_hosts(['host1', 'down'], ['vlans'], loader.hosts)
+    assert values['host1'] == {'vlans': 'host1-vlans-0'}
+    assert isinstance(values['down'], Exception)
+    # the hosts with all the values cached are not loaded again
+    state_cache.get_hosts(['host1', 'host2'], ['vlans'], loader.hosts)
+    assert loader.calls == [(['host1', 'down'], ['vlans']), (['host2'], ['vlans'])]
@@ -0,0 +1,93 @@
+import pytest
+
+from configurator.provider.diff import compute_delta, compute_deltas, desired_state, to_state, validate_changes
+from configurator.provider.resources import INTERFACES
+
+CURRENT = to_state([
+    {'vlan_id': 10, 'name': 'ten', 'description': 'd10'},
+    {'vlan_id': 20, 'name': 'twenty'},
+])
+
+
+@pytest.mark.parametrize('config, action, desired', [
+    # merged keeps the attributes not in config
+    ([{'vlan_id': 10, 'name': 'TEN'}], 'merged',
+     {10: {'vlan_id': 10, 'name': 'TEN', 'description': 'd10'}, 20: {'vlan_id': 20, 'name': 'twenty'}}),
+    ([{'vlan_id': 30, 'name': 'thirty'}], 'merged',
+     {10: CURRENT[10], 20: CURRENT[20], 30: {'vlan_id': 30, 'name': 'thirty'}}),
+    # replaced drops the attributes not in config
+    ([{'vlan_id': 10, 'name': 'TEN'}], 'replaced',
+     {10: {'vlan_id': 10, 'name': 'TEN'}, 20: CURRENT[20]}),
+    # overridden drops the items not in config
+    ([{'vlan_id': 20, 'name': 'twenty'}], 'overridden', {20: CURRENT[20]}),
+    ([], 'overridden', {}),
+    ([{'vlan_id': 10}, {'vlan_id': 30}], 'deleted', {20: CURRENT[20]}),
+    # None is same as an unset attribute, '' is a value
+    ([{'vlan_id': 10, 'name': 'ten', 'description': None}], 'merged', CURRENT),
+    ([{'vlan_id': 10, 'name': 'ten', 'description': None}], 'replaced', {10: {'vlan_id': 10, 'name': 'ten'},
+                                                                        20: CURRENT[20]}),
+    ([{'vlan_id': 20, 'name': 'twenty', 'description': ''}], 'merged',
+     {10: CURRENT[10], 20: {'vlan_id': 20, 'name': 'twenty', 'description': ''}}),
+    # unknown attributes are ignored
+    ([{'vlan_id': 20, 'name': 'twenty', 'mtu': 1500}], 'merged', CURRENT),
+])
+def test_desired_state(config, action, desired):
+    assert desired_state(CURRENT, config, action=action) == desired
+
+
+def test_desired_state_invalid_action():
+    with pytest.raises(Exception, match='Invalid vlans action gathered'):
+        desired_state(CURRENT, [], action='gathered')
+
+
+@pytest.mark.parametrize('current, desired, merged, replaced, deleted', [
+    (CURRENT, CURRENT, [], [], []),
+    # an item missing from the known state is merged
+    ({}, CURRENT, [CURRENT[10], CURRENT[20]], [], []),
+    ({20: CURRENT[20]}, CURRENT, [CURRENT[10]], [], []),
+    # an item that gains or changes an attribute is merged, one that loses an attribute is replaced
+    (CURRENT, {10: {'vlan_id': 10, 'name': 'ten', 'description': 'x'}, 20: CURRENT[20]},
+     [{'vlan_id': 10, 'name': 'ten', 'description': 'x'}], [], []),
+    (CURRENT, {10: {'vlan_id': 10, 'name': 'ten'}, 20: CURRENT[20]}, [], [{'vlan_id': 10, 'name': 'ten'}], []),
+    (CURRENT, {}, [], [], [CURRENT[10], CURRENT[20]]),
+    # an empty description differs from an unset one
+    (CURRENT, {10: CURRENT[10], 20: {'vlan_id': 20, 'name': 'twenty', 'description': ''}},
+     [{'vlan_id': 20, 'name': 'twenty', 'description': ''}], [], []),
+])
+def test_compute_delta(current, desired, merged, replaced, deleted):
+    delta = compute_delta(current, desired)
+    assert (delta.merged, delta.replaced, delta.deleted) == (merged, replaced, deleted)
+    assert bool(delta) == bool(merged or replaced or deleted)
+
+
+def test_delta_operations():
+    delta = compute_delta(CURRENT, {10: {'vlan_id': 10, 'name': 'ten'}, 30: {'vlan_id': 30, 'name': 'thirty'}})
+    assert [operation['action'] for operation in delta.operations()] == ['deleted', 'replaced', 'merged']
+
+
+def test_compute_deltas():
+    current = {'vlans': CURRENT, 'interfaces': {}}
+    changes = [
+        ('vlans', [{'vlan_id': 30, 'name': 'thirty'}], 'merged'),
+        ('interfaces', [{'name': 'ge-0/0/0', 'mtu': 1500}], 'merged'),
+        # the changes are folded in order, the vlan added above is deleted
+        ('vlans', [{'vlan_id': 30}], 'deleted'),
+    ]
+    deltas = compute_deltas(current, changes)
+    assert [(name, delta.merged) for name, _, delta in deltas] == [
+        ('interfaces', [{'name': 'ge-0/0/0', 'mtu': 1500}])]
+    assert deltas[0][1] == to_state([{'name': 'ge-0/0/0', 'mtu': 1500}], resource=INTERFACES)
+
+
+def test_compute_deltas_unchanged():
+    assert compute_deltas({'vlans': CURRENT}, [('vlans', [{'vlan_id': 20, 'name': 'twenty'}], 'merged')]) == []
+
+
+@pytest.mark.parametrize('changes', [
+    [('vlans', [{'name': 'ten'}], 'merged')],
+    [('vlans', [{'vlan_id': 10}], 'gathered')],
+    [('routes', [{'vlan_id': 10}], 'merged')],
+])
+def test_validate_changes_invalid(changes):
+    with pytest.raises(Exception):
+        validate_changes(changes)
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from configurator.provider.fanout import FanoutResult, HostResult, async_fan_out, fan_out, run_batch
+
+HOSTS = ['host1', 'host2', 'host3', 'host4']
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=len(HOSTS))
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def operation(host, fail=()):
+    if host in fail:
+        raise Exception(f"host {host} unreachable")
+    return host == 'host1' or {'host': host}
+
+
+def test_fanout_result():
+    result = FanoutResult({'host1': HostResult('host1', changed=True, data=True, latency=0.0123),
+                           'host2': HostResult('host2', data={'vlans': []}),
+                           'host3': HostResult('host3', failed=True, error='timeout')})
+    assert result.changed is True
+    assert result.failed == {'host3': 'timeout'}
+    assert result.data == {'host1': True, 'host2': {'vlans': []}}
+    assert result.all_failed is False
+    assert result.to_dict()['host1'] == {'changed': True, 'failed': False, 'latency': 0.012, 'error': None}
+    assert result.to_dict()['host3'] == {'changed': False, 'failed': True, 'latency': 0.0, 'error': 'timeout'}
+
+
+def test_fanout_result_all_failed():
+    assert FanoutResult({'host1': HostResult('host1', failed=True, error='e')}).all_failed is True
+    assert FanoutResult({'host1': HostResult('host1', data=False)}).changed is False
+    # no hosts is not a failure
+    assert FanoutResult({}).all_failed is False
+
+
+def test_fan_out(executor):
+    result = fan_out(executor, HOSTS, operation, fail=('host3',))
+    assert list(result.results) == HOSTS
+    assert [host for host, host_result in result.results.items() if host_result.changed] == ['host1']
+    # a failure on one host does not stop the other hosts
+    assert result.failed == {'host3': 'host host3 unreachable'}
+    assert result.data == {'host1': True, 'host2': {'host': 'host2'}, 'host4': {'host': 'host4'}}
+    assert all(host_result.latency >= 0 for host_result in result.results.values())
+
+
+def test_fan_out_concurrent(executor):
+    # every host waits for all the others, it passes only if they run at the same time
+    barrier = threading.Barrier(len(HOSTS), timeout=5)
+    result = fan_out(executor, HOSTS, lambda host: barrier.wait() is not None)
+    assert not result.failed
+
+
+def test_async_fan_out(executor):
+    async def coroutine(host):
+        await asyncio.sleep(0)
+        return operation(host, fail=('host2',))
+
+    for func in (coroutine, lambda host: operation(host, fail=('host2',))):
+        result = asyncio.run(async_fan_out(executor, HOSTS, func))
+        assert list(result.results) == HOSTS
+        assert result.failed == {'host2': 'host host2 unreachable'}
+        assert result.changed is True
+
+
+def test_run_batch():
+    calls = []
+
+    def batch(hosts, value):
+        calls.append(list(hosts))
+        return {'host1': value, 'host2': Exception('failed on host2'), 'host3': True}
+
+    result = run_batch(HOSTS, batch, {'vlans': []})
+    # the hosts are run in a single call
+    assert calls == [HOSTS]
+    assert result.data == {'host1': {'vlans': []}, 'host3': True}
+    assert result.failed == {'host2': 'failed on host2', 'host4': 'no result for host host4'}
+    assert result.changed is True
+
+
+def test_run_batch_failed():
+    def batch(hosts):
+        raise Exception('inventory missing')
+
+    result = run_batch(HOSTS, batch)
+    assert result.all_failed
+    assert set(result.failed.values()) == {'inventory missing'}
+
+
+def test_manage_vlans_partial_failure(manage_vlans, fake, down):
+    down.add('fake2')
+    result = manage_vlans.edit_vlans([{'vlan_id': 10, 'name': 'ten'}])
+    assert result.changed is True
+    assert result.failed == {'fake2': 'host fake2 unreachable'}
+    assert not result.all_failed
+    assert sorted(fake.config[('fake1', 'vlans')]) == [10]
+    assert fake.config[('fake2', 'vlans')] == {}
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+import pytest
+
+from configurator.provider import resources
+from configurator.provider.resources import INTERFACES, VLANS, Resource, get_resource, register_resource, \
+    stored_resources
+
+INTERFACES_CONFIG = [{'name': 'eth0', 'description': 'uplink', 'enabled': True, 'mtu': 9000, 'speed': None},
+                     {'name': 'eth1', 'description': None, 'enabled': False, 'mtu': 1500, 'speed': None}]
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # the resources registered by a test are dropped after it
+    monkeypatch.setattr(resources, 'RESOURCES', OrderedDict(resources.RESOURCES))
+    return resources.RESOURCES
+
+
+def test_registered_resources():
+    assert get_resource('vlans') is VLANS
+    assert get_resource('interfaces') is INTERFACES
+    assert VLANS.key == 'vlan_id' and VLANS.fields[0] == 'vlan_id'
+    with pytest.raises(Exception, match='Invalid resource lldp'):
+        get_resource('lldp')
+
+
+def test_key_is_first_field():
+    with pytest.raises(Exception):
+        Resource('lldp', 'name', ('enabled', 'name'))
+
+
+def test_register_resource(registry):
+    lldp = register_resource(Resource('lldp', 'name', ('name', 'enabled')))
+    assert get_resource('lldp') is lldp
+    # a resource without table is not stored in database
+    assert stored_resources() == [VLANS, INTERFACES]
+    assert stored_resources(['lldp', 'vlans']) == [VLANS]
+
+    # the resource with same name is replaced
+    replaced = register_resource(Resource('lldp', 'name', ('name', 'enabled'), table='lldp'))
+    assert get_resource('lldp') is replaced
+    assert list(registry) == ['vlans', 'interfaces', 'lldp']
+
+
+def test_stored_resources_invalid_name():
+    with pytest.raises(Exception):
+        stored_resources(['vlans', 'lldp'])
+
+
+def test_edit_resources_in_one_transaction(manage_vlans, fake):
+    result = manage_vlans.edit_resources([('vlans', [{'vlan_id': 10, 'name': 'ten'}], 'merged'),
+                                          ('interfaces', INTERFACES_CONFIG, 'merged')])
+    assert result.changed and not result.failed
+    # a single commit on each host for both the resources
+    assert fake.commits == {'fake1': 1, 'fake2': 1}
+    assert sorted(fake.config[('fake2', 'interfaces')]) == ['eth0', 'eth1']
+
+    result = manage_vlans.get_resources(['vlans', 'interfaces'], cached=False)
+    assert [vlan['vlan_id'] for vlan in result.data['fake1']['vlans']] == [10]
+    assert sorted(item['name'] for item in result.data['fake1']['interfaces']) == ['eth0', 'eth1']
@@ -0,0 +1,55 @@
+import pytest
+
+from configurator.provider import vlanstate
+from configurator.provider.vlanstate import VlanState, intern_record, vlan_ids
+
+CONFIG = [{'vlan_id': 10, 'name': 'ten', 'description': 'd10'}, {'vlan_id': 20, 'name': 'twenty', 'description': None}]
+
+
+def test_vlan_state():
+    state = VlanState.from_config(CONFIG)
+    assert len(state) == 2
+    assert vlan_ids(state.bitmap) == [10, 20]
+    assert state.get(20) == (20, 'twenty', None)
+    assert state.get(30) is None
+    assert state.get(5000) is None
+    assert state.to_config() == CONFIG
+
+
+@pytest.mark.parametrize('vlan_id', [-1, 4096, '10', None])
+def test_invalid_vlan_id(vlan_id):
+    with pytest.raises(ValueError):
+        VlanState([(vlan_id, 'a', None)])
+
+
+def test_diff():
+    state = VlanState.from_config(CONFIG)
+    other = VlanState([(10, 'ten', 'changed'), (30, 'thirty', None)])
+    assert state.diff(other) == ([(30, 'thirty', None)], [(10, 'ten', 'changed')], [(20, 'twenty', None)])
+    assert state.diff(VlanState.from_config(CONFIG)) == ([], [], [])
+    # same membership with a changed record
+    assert state.diff(VlanState([(10, 'ten', 'd10'), (20, 'TWENTY', None)])) == ([], [(20, 'TWENTY', None)], [])
+
+
+def test_equal_states_shared():
+    state = VlanState.from_config(CONFIG)
+    other = VlanState.from_config(list(reversed(CONFIG)))
+    assert state == other and hash(state) == hash(other)
+    assert state != VlanState.from_config(CONFIG[:1])
+    assert state.intern() is other.intern()
+    # the devices with the same vlans share the records
+    assert all(mine is theirs for mine, theirs in zip(state.records, other.records))
+
+
+def test_records_bounded():
+    state = VlanState([(vlan_id, f'kept{vlan_id}', None) for vlan_id in range(100)])
+    assert intern_record('kept5', None) is state.records[5]
+
+    # the least recently used records are dropped beyond the limit
+    for index in range(vlanstate.MAX_RECORDS):
+        intern_record(f'other{index}', None)
+    assert vlanstate._shared_record.cache_info().currsize == vlanstate.MAX_RECORDS
+    record = intern_record('kept5', None)
+    assert record == state.records[5] and record is not state.records[5]
+    # a state with a dropped record is still equal to a new one
+    assert state == VlanState([(vlan_id, f'kept{vlan_id}', None) for vlan_id in range(100)])
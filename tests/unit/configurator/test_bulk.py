@@ -0,0 +1,129 @@
+import io
+
+import pytest
+
+from bulk import chunked, expand_range, iter_ndjson, parse_intervals, validate_vlan
+
+
+@pytest.mark.parametrize('value, intervals', [
+    ('5', [(5, 5)]),
+    ('100-900,905', [(100, 900), (905, 905)]),
+    (' 1 - 3 , ,7', [(1, 3), (7, 7)]),
+    ('1024', [(1024, 1024)]),
+    ('', []),
+])
+def test_parse_intervals(value, intervals):
+    assert parse_intervals(value) == intervals
+
+
+@pytest.mark.parametrize('value', ['x', '1-y', '5-3', '0', '1-1025', '1--3'])
+def test_parse_intervals_invalid(value):
+    with pytest.raises(ValueError):
+        parse_intervals(value)
+
+
+def test_expand_range():
+    assert list(expand_range({'range': '1-2,5', 'name_template': 'v{id}', 'description_template': 'd {id}'})) == [
+        {'vlan_id': 1, 'name': 'v1', 'description': 'd 1'},
+        {'vlan_id': 2, 'name': 'v2', 'description': 'd 2'},
+        {'vlan_id': 5, 'name': 'v5', 'description': 'd 5'},
+    ]
+
+
+def test_expand_range_default_name():
+    assert list(expand_range({'range': '7'})) == [{'vlan_id': 7, 'name': 'vlan7'}]
+
+
+@pytest.mark.parametrize('body', [
+    {},
+    {'range': 5},
+    {'range': '1-3', 'mtu': 1500},
+    {'range': '1-x'},
+    {'range': '1-3', 'name_template': 5},
+    {'range': '1-3', 'name_template': ''},
+    {'range': '1-3', 'name_template': None},
+    {'range': '1-3', 'description_template': ['d']},
+])
+def test_expand_range_invalid(body):
+    # raised on call, before the first item is streamed
+    with pytest.raises(ValueError):
+        expand_range(body)
+
+
+def test_iter_ndjson():
+    stream = io.BytesIO(b'{"vlan_id": 1, "name": "a"}\n\n  \nnot json\n{"vlan_id": 2, "name": "b"}')
+    items = list(iter_ndjson(stream))
+    assert items[0] == (1, {'vlan_id': 1, 'name': 'a'})
+    assert items[1][0] == 4
+    assert items[1][1].startswith('invalid json at line 4')
+    assert items[2] == (5, {'vlan_id': 2, 'name': 'b'})
+
+
+@pytest.mark.parametrize('vlan, valid', [
+    ({'vlan_id': 1, 'name': 'a'}, True),
+    ({'vlan_id': 1024, 'name': 'a', 'description': 'd'}, True),
+    ({'vlan_id': 1, 'name': 'a', 'description': None}, True),
+    ({'vlan_id': True, 'name': 'a'}, False),
+    ({'vlan_id': '1', 'name': 'a'}, False),
+    ({'vlan_id': 0, 'name': 'a'}, False),
+    ({'vlan_id': 1025, 'name': 'a'}, False),
+    ({'vlan_id': 1}, False),
+    ({'vlan_id': 1, 'name': 5}, False),
+    ({'vlan_id': 1, 'name': 'a', 'description': 5}, False),
+    ({'vlan_id': 1, 'name': 'a', 'mtu': 1500}, False),
+    ('vlan1', False),
+])
+def test_validate_vlan(vlan, valid):
+    assert (validate_vlan(vlan) is None) == valid
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []
+
+
+def apply_chunk(app, chunk):
+    import server
+    from database import db
+
+    with app.app_context():
+        try:
+            return server.apply_bulk_chunk(chunk)
+        finally:
+            db.session.remove()
+
+
+def test_apply_bulk_chunk(app, fake):
+    chunk = [(1, {'vlan_id': 5, 'name': 'a'}), (2, 'invalid json at line 2'), (3, {'vlan_id': 6, 'name': 'b'}),
+             (4, {'vlan_id': 5, 'name': 'c'}), (5, {'vlan_id': True, 'name': 'd'})]
+    assert apply_chunk(app, chunk) == [
+        {'item': 1, 'vlan_id': 5, 'status': 'superseded', 'by': 4},
+        {'item': 2, 'status': 'invalid', 'error': 'invalid json at line 2'},
+        {'item': 3, 'vlan_id': 6, 'status': 'applied'},
+        {'item': 4, 'vlan_id': 5, 'status': 'applied'},
+        {'item': 5, 'status': 'invalid', 'error': "invalid vlan_id value True in config dict "
+                                                  "{'vlan_id': True, 'name': 'd'}"},
+    ]
+    assert sorted((vlan_id, vlan['name']) for vlan_id, vlan in fake.config[('fake1', 'vlans')].items()) == [
+        (5, 'c'), (6, 'b')]
+
+
+def test_apply_bulk_chunk_all_invalid(app):
+    assert apply_chunk(app, [(1, {'vlan_id': 0, 'name': 'a'})])[0]['status'] == 'invalid'
+
+
+def test_apply_bulk_chunk_partial(app, fake, down):
+    down.add('fake2')
+    results = apply_chunk(app, [(1, {'vlan_id': 5, 'name': 'a'})])
+    assert results == [{'item': 1, 'vlan_id': 5, 'status': 'partial', 'failed': {'fake2': 'host fake2 unreachable'}}]
+
+
+def test_apply_bulk_chunk_failed(app, fake, down):
+    down.update(fake.hosts)
+    results = apply_chunk(app, [(1, {'vlan_id': 5, 'name': 'a'}), (2, {'vlan_id': 6, 'name': 'b'})])
+    assert [result['status'] for result in results] == ['failed', 'failed']
+
+    from database import Vlans
+    with app.app_context():
+        # the chunk is rolled back in database
+        assert Vlans.query.count() == 0
@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def replayer(app, manage_vlans):
+    from changelog import ChangeReplayer
+    return ChangeReplayer(manage_vlans, app=app, batch_size=2)
+
+
+@pytest.fixture
+def gathered(manage_vlans, monkeypatch):
+    '''
+    Hosts of which the state is read by the replay before it is overridden
+    '''
+    hosts = []
+    get_vlans = manage_vlans.get_vlans
+
+    def _get_vlans(hosts=None, cached=True):
+        gathered.extend(hosts)
+        return get_vlans(hosts=hosts, cached=cached)
+
+    gathered = hosts
+    monkeypatch.setattr(manage_vlans, 'get_vlans', _get_vlans)
+    return hosts
+
+
+def write(app, *vlans):
+    import changelog
+    from database import Vlans, db
+
+    with app.app_context():
+        try:
+            for vlan in vlans:
+                db.session.add(Vlans(**vlan))
+            seq = changelog.append(list(vlans), 'merged')
+            db.session.commit()
+            return seq
+        finally:
+            db.session.remove()
+
+
+def acks(app):
+    from database import ChangeLogAck, db
+
+    with app.app_context():
+        try:
+            return dict(db.session.query(ChangeLogAck.host, ChangeLogAck.seq))
+        finally:
+            db.session.remove()
+
+
+def device_vlans(fake, host):
+    return sorted(fake.config[(host, 'vlans')])
+
+
+def test_replay_host_behind(app, fake, replayer, gathered):
+    assert write(app, {'vlan_id': 10, 'name': 'ten'}) == 1
+    # the hosts without acknowledged change get the database state
+    assert not replayer.replay().failed
+    assert sorted(gathered) == ['fake1', 'fake2']
+    assert acks(app) == {'fake1': 1, 'fake2': 1}
+
+    # every round trip fails, the hosts stay at the acknowledged change
+    fake.failure_rate = 1
+    for vlan_id in (11, 12, 13):
+        write(app, {'vlan_id': vlan_id, 'name': f'v{vlan_id}'})
+    assert list(replayer.replay(hosts=['fake2']).failed) == ['fake2']
+    assert replayer.behind() == ['fake1', 'fake2']
+
+    fake.failure_rate = 0
+    assert not replayer.replay(hosts=['fake1']).failed
+    assert replayer.behind() == ['fake2']
+    assert device_vlans(fake, 'fake1') == [10, 11, 12, 13]
+    assert device_vlans(fake, 'fake2') == [10]
+
+    # the host behind gets the logged changes in batches, its state is not read
+    del gathered[:]
+    result = replayer.replay()
+    assert [host for host, host_result in result.results.items() if host_result.changed] == ['fake2']
+    assert gathered == []
+    assert device_vlans(fake, 'fake2') == [10, 11, 12, 13]
+    assert acks(app) == {'fake1': 4, 'fake2': 4}
+    assert replayer.behind() == []
+
+
+def test_replay_after_truncate(app, fake, replayer, gathered):
+    write(app, {'vlan_id': 10, 'name': 'ten'})
+    replayer.replay()
+    write(app, {'vlan_id': 11, 'name': 'eleven'})
+    write(app, {'vlan_id': 12, 'name': 'twelve'})
+    replayer.replay(hosts=['fake1'])
+
+    # the log is truncated past the change acknowledged by fake2
+    assert replayer._in_context(replayer._truncate, {'fake1'}) == 3
+    fake.configure('fake2', [{'vlan_id': 20, 'name': 'drift'}])
+
+    # fake2 cannot catch up from the log and is overridden with database state
+    del gathered[:]
+    assert not replayer.replay().failed
+    assert gathered == ['fake2']
+    assert device_vlans(fake, 'fake2') == [10, 11, 12]
+    assert acks(app) == {'fake1': 3, 'fake2': 3}
+
+
+def test_replay_unreachable_host_not_acknowledged(app, fake, replayer, gathered):
+    write(app, {'vlan_id': 10, 'name': 'ten'})
+    fake.failure_rate = 1
+    assert sorted(replayer.replay().failed) == ['fake1', 'fake2']
+    assert acks(app) == {}
+    assert replayer.truncate() == 0
+
+
+def test_truncate(app, replayer):
+    for vlan_id in (10, 11, 12):
+        write(app, {'vlan_id': vlan_id, 'name': f'v{vlan_id}'})
+    replayer.replay(hosts=['fake1'])
+    # fake2 never acknowledged a change and is overridden on replay
+    assert replayer.truncate() == 3
+    assert replayer.truncate() == 0
+
+
+def test_next_seq_concurrent(app):
+    from database import ChangeLog
+
+    errors = []
+
+    def run(offset):
+        try:
+            for vlan_id in range(offset, offset + 10):
+                write(app, {'vlan_id': vlan_id, 'name': f'v{vlan_id}'})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(offset,)) for offset in range(1, 81, 10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with app.app_context():
+        # gapless and without duplicate
+        assert sorted(seq for seq, in ChangeLog.query.with_entities(ChangeLog.seq)) == list(range(1, 81))
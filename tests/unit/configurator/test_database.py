@@ -0,0 +1,181 @@
+import os
+import sqlite3
+
+import pytest
+
+from sqlalchemy.exc import IntegrityError
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, os.pardir, 'migrations')
+
+
+def test_migration_adds_vlan_version(config, tmp_path):
+    from flask_migrate import Migrate, downgrade, upgrade
+
+    import server
+    from database import TableVersion, Vlans, db
+
+    # table of a database created before vlans had a version
+    path = tmp_path / 'configurator.db'
+    with sqlite3.connect(path) as connection:
+        connection.execute('CREATE TABLE vlans (vlan_id INTEGER NOT NULL, name VARCHAR(255) NOT NULL, '
+                           'description VARCHAR(255), PRIMARY KEY (vlan_id))')
+        connection.execute("INSERT INTO vlans VALUES (10, 'ten', NULL)")
+
+    app = server.create_app()
+    Migrate(app, db)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        assert Vlans.query.get(10).version == 1
+        db.session.add(Vlans(vlan_id=11, name='eleven'))
+        db.session.commit()
+        assert Vlans.query.get(11).version == 1
+        # the change counter of the vlans listing
+        assert TableVersion.query.get('vlans').version == 0
+        db.session.remove()
+
+        downgrade(directory=MIGRATIONS, revision='base')
+    with sqlite3.connect(path) as connection:
+        assert [row[1] for row in connection.execute('PRAGMA table_info(vlans)')] == ['vlan_id', 'name', 'description']
+        assert not connection.execute("SELECT name FROM sqlite_master WHERE name = 'table_versions'").fetchall()
+
+
+def test_migration_of_created_tables(app):
+    from flask_migrate import Migrate, upgrade
+
+    from database import Vlans, db
+
+    # the tables created by db.create_all() already have the column
+    Migrate(app, db)
+    with app.app_context():
+        db.session.add(Vlans(vlan_id=10, name='ten', version=3))
+        db.session.commit()
+        upgrade(directory=MIGRATIONS)
+        assert Vlans.query.get(10).version == 3
+        db.session.remove()
+
+
+@pytest.fixture
+def session(app):
+    from database import db
+
+    with app.app_context():
+        yield db.session
+        db.session.remove()
+
+
+@pytest.fixture
+def statements(session):
+    '''
+    List of the statements sent to the database, an executemany is one statement
+    '''
+    from database import db
+
+    sent = []
+
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        sent.append(statement.split(' ', 1)[0])
+
+    db.event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield sent
+    db.event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def vlans():
+    from database import Vlans
+
+    return [(vlan.vlan_id, vlan.name, vlan.description, vlan.version) for vlan in Vlans.query.order_by(Vlans.vlan_id)]
+
+
+def table_version():
+    from database import TableVersion
+
+    return TableVersion.query.get('vlans').version
+
+
+def test_add_vlans(session, statements):
+    from database import update_vlans_db
+
+    update_vlans_db([{'vlan_id': vlan_id, 'name': f'v{vlan_id}'} for vlan_id in range(1, 101)])
+    # a single insert of all the vlans and the bump of the table version
+    assert statements == ['INSERT', 'UPDATE']
+    session.commit()
+    assert len(vlans()) == 100
+    assert vlans()[0] == (1, 'v1', None, 1)
+    assert table_version() == 1
+
+
+def test_add_existing_vlan(session):
+    from database import update_vlans_db
+
+    update_vlans_db([{'vlan_id': 1, 'name': 'a'}])
+    session.commit()
+    with pytest.raises(IntegrityError):
+        update_vlans_db([{'vlan_id': 2, 'name': 'b'}, {'vlan_id': 1, 'name': 'again'}])
+    session.rollback()
+    assert vlans() == [(1, 'a', None, 1)]
+
+
+def test_update_vlans(session, statements):
+    from database import update_vlans_db
+
+    update_vlans_db([{'vlan_id': vlan_id, 'name': f'v{vlan_id}', 'description': 'd'} for vlan_id in range(1, 5)])
+    session.commit()
+    del statements[:]
+
+    update_vlans_db([{'vlan_id': 1, 'name': 'one'}, {'vlan_id': 2, 'name': 'two', 'description': 'x'},
+                     {'vlan_id': 3, 'name': 'three'}, {'vlan_id': 7, 'name': 'seven'}], action='update')
+    # a read of the existing vlans, an update per set of the fields, an
+    # insert of the missing vlans and the bump of the table version
+    assert statements == ['SELECT', 'UPDATE', 'UPDATE', 'INSERT', 'UPDATE']
+    session.commit()
+    # the description is kept if not given and the version of the updated vlans is bumped
+    assert vlans() == [(1, 'one', 'd', 2), (2, 'two', 'x', 2), (3, 'three', 'd', 2), (4, 'v4', 'd', 1),
+                       (7, 'seven', None, 1)]
+    assert table_version() == 2
+
+
+def test_update_vlans_versions(session):
+    from database import VersionConflict, update_vlans_db
+
+    update_vlans_db([{'vlan_id': 1, 'name': 'a'}, {'vlan_id': 2, 'name': 'b'}])
+    session.commit()
+    update_vlans_db([{'vlan_id': 1, 'name': 'A'}], action='update', versions={1: 1})
+    session.commit()
+
+    # the whole write fails if any of the vlans has another version
+    with pytest.raises(VersionConflict):
+        update_vlans_db([{'vlan_id': 1, 'name': 'x'}, {'vlan_id': 2, 'name': 'y'}], action='update',
+                        versions={1: 1, 2: 1})
+    session.rollback()
+    # a missing vlan is not created
+    with pytest.raises(VersionConflict):
+        update_vlans_db([{'vlan_id': 3, 'name': 'c'}], action='update', versions={3: 1})
+    session.rollback()
+    assert vlans() == [(1, 'A', None, 2), (2, 'b', None, 1)]
+
+
+def test_delete_vlans(session, statements):
+    from database import VersionConflict, update_vlans_db
+
+    update_vlans_db([{'vlan_id': vlan_id, 'name': f'v{vlan_id}'} for vlan_id in range(1, 6)])
+    session.commit()
+    del statements[:]
+
+    update_vlans_db([{'vlan_id': 1}, {'vlan_id': 2}, {'vlan_id': 9}], action='delete')
+    assert statements == ['DELETE', 'UPDATE']
+    session.commit()
+    assert [vlan[0] for vlan in vlans()] == [3, 4, 5]
+
+    with pytest.raises(VersionConflict):
+        update_vlans_db([{'vlan_id': 3}, {'vlan_id': 4}], action='delete', versions={3: 1, 4: 2})
+    session.rollback()
+    update_vlans_db([{'vlan_id': 3}], action='delete', versions={3: 1})
+    session.commit()
+    assert [vlan[0] for vlan in vlans()] == [4, 5]
+
+
+def test_update_vlans_empty(session, statements):
+    from database import update_vlans_db
+
+    update_vlans_db([], action='update')
+    assert statements == []
@@ -0,0 +1,34 @@
+from drift import drift_report
+
+
+def add_vlans(app, *vlans):
+    from database import Vlans, db
+
+    with app.app_context():
+        db.session.add_all(Vlans(**vlan) for vlan in vlans)
+        db.session.commit()
+        db.session.remove()
+
+
+def test_drift_report(app, manage_vlans, fake, down):
+    add_vlans(app, {'vlan_id': 10, 'name': 'ten', 'description': ''}, {'vlan_id': 11, 'name': 'eleven'})
+    fake.configure('fake1', [{'vlan_id': 10, 'name': 'ten'}, {'vlan_id': 11, 'name': 'eleven'}])
+    fake.configure('fake2', [{'vlan_id': 10, 'name': 'TEN'}, {'vlan_id': 12, 'name': 'twelve'}])
+
+    report = drift_report(manage_vlans, app=app)
+    assert report['in_sync'] == ['fake1']
+    assert report['diverged'] == ['fake2']
+    in_sync, diverged = sorted(report['groups'], key=lambda group: group['hosts'])
+    # an empty description in database is same as none on device
+    assert report['db'] == {'digest': in_sync['digest'], 'vlans': 2}
+    assert diverged['extra'] == [{'vlan_id': 12, 'name': 'twelve', 'description': None}]
+    assert diverged['changed'] == [{'vlan_id': 10, 'name': 'TEN', 'description': None}]
+    assert diverged['missing'] == [{'vlan_id': 11, 'name': 'eleven', 'description': None}]
+
+
+def test_drift_report_failed_host(app, manage_vlans, fake, down):
+    down.add('fake2')
+    report = drift_report(manage_vlans, app=app)
+    assert report['in_sync'] == ['fake1']
+    assert list(report['failed']) == ['fake2']
+    assert report['hosts'] == 2
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+from jobs import FAILED, PENDING, RUNNING, SUCCEEDED, JobQueue
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for condition")
+        time.sleep(0.01)
+
+
+def commit(app, vlans=(), deleted=()):
+    from database import Vlans, db
+
+    with app.app_context():
+        for vlan in vlans:
+            db.session.merge(Vlans(**vlan))
+        for vlan_id in deleted:
+            Vlans.query.filter(Vlans.vlan_id == vlan_id).delete()
+        db.session.commit()
+        db.session.remove()
+
+
+class Pushes(list):
+    """
+    Changes of each device push, the pushes wait while the gate is closed
+    """
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.gate.set()
+
+
+@pytest.fixture
+def pushes(manage_vlans, monkeypatch):
+    pushes = Pushes()
+    edit_resources = manage_vlans.edit_resources
+
+    def _edit_resources(changes, hosts=None):
+        pushes.append((hosts, changes))
+        pushes.gate.wait()
+        return edit_resources(changes, hosts=hosts)
+
+    monkeypatch.setattr(manage_vlans, 'edit_resources', _edit_resources)
+    return pushes
+
+
+@pytest.fixture
+def job_queue(app, manage_vlans):
+    return JobQueue(manage_vlans, workers=2, app=app)
+
+
+def test_job_lifecycle(app, fake, job_queue, pushes):
+    commit(app, [{'vlan_id': 10, 'name': 'ten'}])
+    job = job_queue.submit([{'vlan_id': 10, 'name': 'ten'}], 'merged')
+    assert job_queue.get(job.id) is job
+    wait_for(lambda: job.status == SUCCEEDED)
+
+    assert sorted(job.results) == ['fake1', 'fake2']
+    assert job.results['fake1']['changed'] and not job.results['fake1']['failed']
+    assert job.to_dict()['hosts'] == job.results
+    assert job.finished >= job.created
+    assert sorted(fake.config[('fake1', 'vlans')]) == [10]
+    # only the changed vlan is pushed
+    assert pushes[0][1] == [('vlans', [{'vlan_id': 10, 'name': 'ten', 'description': None}], 'replaced')]
+
+
+def test_jobs_coalesced(app, fake, job_queue, pushes):
+    fake.configure('fake1', [{'vlan_id': 20, 'name': 'not in db'}])
+    pushes.gate.clear()
+    commit(app, [{'vlan_id': 10, 'name': 'ten'}])
+    first = job_queue.submit([{'vlan_id': 10, 'name': 'ten'}], 'merged', hosts=['fake1'])
+    wait_for(lambda: first.status == RUNNING)
+
+    # queued while the device is busy
+    commit(app, [{'vlan_id': 11, 'name': 'eleven'}, {'vlan_id': 10, 'name': 'TEN'}])
+    second = job_queue.submit([{'vlan_id': 11, 'name': 'eleven'}], 'merged', hosts=['fake1'])
+    third = job_queue.submit([{'vlan_id': 10, 'name': 'TEN'}], 'replaced', hosts=['fake1'])
+    commit(app, deleted=[11])
+    fourth = job_queue.submit([{'vlan_id': 11, 'name': 'eleven'}], 'deleted', hosts=['fake1'])
+    assert [job.status for job in (second, third, fourth)] == [PENDING] * 3
+
+    pushes.gate.set()
+    wait_for(lambda: fourth.status == SUCCEEDED)
+    assert [job.status for job in (first, second, third)] == [SUCCEEDED] * 3
+    # the three queued jobs are a single push of the final database state
+    assert len(pushes) == 2
+    assert pushes[1][1] == [('vlans', [{'vlan_id': 11}], 'deleted'),
+                            ('vlans', [{'vlan_id': 10, 'name': 'TEN', 'description': None}], 'replaced')]
+    # the vlans not changed by the jobs are left as is
+    assert fake.config[('fake1', 'vlans')] == {10: {'vlan_id': 10, 'name': 'TEN'},
+                                               20: {'vlan_id': 20, 'name': 'not in db'}}
+
+
+def test_job_failed(app, fake, down, job_queue):
+    down.add('fake2')
+    commit(app, [{'vlan_id': 10, 'name': 'ten'}])
+    job = job_queue.submit([{'vlan_id': 10, 'name': 'ten'}], 'merged')
+    wait_for(lambda: job.status == FAILED)
+    assert not job.results['fake1']['failed']
+    assert job.results['fake2']['error'] == 'host fake2 unreachable'
+
+
+def test_finished_jobs_evicted(app, manage_vlans):
+    commit(app, [{'vlan_id': 10, 'name': 'ten'}])
+    job_queue = JobQueue(manage_vlans, workers=1, max_jobs=2, app=app)
+    jobs = []
+    for _ in range(3):
+        jobs.append(job_queue.submit([{'vlan_id': 10, 'name': 'ten'}], 'merged'))
+        wait_for(lambda: jobs[-1].status == SUCCEEDED)
+    assert job_queue.get(jobs[0].id) is None
+    assert job_queue.get(jobs[2].id) is jobs[2]
+
+
+def test_jobs_api(config, client, fake):
+    config['jobs'] = {'enabled': True, 'workers': 2}
+    response = client.request('POST', '/config/vlans', json=[{'vlan_id': 10, 'name': 'ten'}])
+    assert response.status == 202
+    assert response.headers['location'].endswith(f"/jobs/{response.json['job_id']}")
+    # the change is committed in database before the push
+    assert client.request('GET', '/config/vlans/10').status == 200
+
+    wait_for(lambda: client.request('GET', f"/jobs/{response.json['job_id']}").json['status'] == SUCCEEDED)
+    assert sorted(fake.config[('fake2', 'vlans')]) == [10]
+
+    response = client.request('DELETE', '/config/vlans/10/ten')
+    assert response.status == 202
+    wait_for(lambda: client.request('GET', f"/jobs/{response.json['job_id']}").json['status'] == SUCCEEDED)
+    assert fake.config[('fake2', 'vlans')] == {}
@@ -0,0 +1,153 @@
+import pytest
+import sqlalchemy as db
+
+import synchronizer
+from listing import VlanQuery
+
+VLANS = [{'vlan_id': 1, 'name': 'blue', 'description': 'b'}, {'vlan_id': 2, 'name': 'green'},
+         {'vlan_id': 3, 'name': 'blue_2'}, {'vlan_id': 10, 'name': 'red'}, {'vlan_id': 20, 'name': 'blue%'}]
+
+
+@pytest.fixture
+def vlans(client):
+    assert client.request('POST', '/config/vlans', json=VLANS).status == 201
+    return client
+
+
+def list_ids(client, args=''):
+    response = client.request('GET', f'/config/vlans{args}')
+    assert response.status == 200
+    return [vlan['vlan_id'] for vlan in response.json]
+
+
+def etag(client):
+    return client.request('GET', '/config/vlans').headers['etag']
+
+
+def test_cursor(vlans):
+    response = vlans.request('GET', '/config/vlans?limit=2')
+    assert [vlan['vlan_id'] for vlan in response.json] == [1, 2]
+    assert response.headers['link'] == '</config/vlans?after=2&limit=2>; rel="next"'
+
+    response = vlans.request('GET', '/config/vlans?after=2&limit=2')
+    assert [vlan['vlan_id'] for vlan in response.json] == [3, 10]
+    assert 'after=10' in response.headers['link']
+
+    # no link on the last page
+    response = vlans.request('GET', '/config/vlans?after=10&limit=2')
+    assert [vlan['vlan_id'] for vlan in response.json] == [20]
+    assert 'link' not in response.headers
+    assert list_ids(vlans, '?after=20') == []
+
+
+def test_cursor_keeps_filters(vlans):
+    response = vlans.request('GET', '/config/vlans?name=blue*&fields=name&limit=1')
+    assert response.json == [{'vlan_id': 1, 'name': 'blue'}]
+    assert response.headers['link'] == '</config/vlans?fields=vlan_id%2Cname&name=blue%2A&after=1&limit=1>; rel="next"'
+
+
+@pytest.mark.parametrize('fields, keys', [
+    ('name', {'vlan_id', 'name'}),
+    ('description,vlan_id', {'vlan_id', 'description'}),
+    ('name,name', {'vlan_id', 'name'}),
+    ('vlan_id,name,description', {'vlan_id', 'name', 'description'}),
+])
+def test_fields(vlans, fields, keys):
+    response = vlans.request('GET', f'/config/vlans?fields={fields}')
+    assert [set(vlan) for vlan in response.json] == [keys] * len(VLANS)
+
+
+@pytest.mark.parametrize('args', ['fields=mtu', 'fields=name,mtu', 'fields=,', 'after=x', 'limit=0', 'range=1-x',
+                                  'range=5-3'])
+def test_invalid_arguments(vlans, args):
+    response = vlans.request('GET', f'/config/vlans?{args}')
+    assert response.status == 400
+    assert 'error' in response.json
+
+
+@pytest.mark.parametrize('name, vlan_ids', [
+    ('blue', [1]),
+    ('blue*', [1, 3, 20]),
+    ('*e*', [1, 2, 3, 10, 20]),
+    # the wildcard of SQL like is matched literally
+    ('blue_2', [3]),
+    ('blue_', []),
+    ('blue%', [20]),
+    ('yellow', []),
+])
+def test_name(vlans, name, vlan_ids):
+    assert list_ids(vlans, f'?name={name.replace("%", "%25")}') == vlan_ids
+
+
+@pytest.mark.parametrize('vlan_range, vlan_ids', [
+    ('2', [2]),
+    ('1-3', [1, 2, 3]),
+    ('2-3,20', [2, 3, 20]),
+    ('4-9', []),
+])
+def test_range(vlans, vlan_range, vlan_ids):
+    assert list_ids(vlans, f'?range={vlan_range}') == vlan_ids
+
+
+def test_range_and_name(vlans):
+    assert list_ids(vlans, '?range=1-10&name=blue*') == [1, 3]
+
+
+def test_vlan_query_from_args():
+    # the cursor vlan_id is always the first field
+    query = VlanQuery.from_args({'fields': 'description,name,vlan_id', 'after': '5', 'limit': '10', 'name': '',
+                                 'range': ''})
+    assert query.fields == ('vlan_id', 'description', 'name')
+    assert (query.after, query.limit, query.name, query.vlan_range) == (5, 10, None, None)
+
+
+def test_etag_of_query(vlans):
+    # the same table with another query has another ETag
+    assert vlans.request('GET', '/config/vlans?limit=2').headers['etag'] != etag(vlans)
+
+
+def test_etag_changes_on_write(vlans):
+    before = etag(vlans)
+    # reads do not change the ETag
+    vlans.request('GET', '/config/vlans/1')
+    assert etag(vlans) == before
+    assert vlans.request('GET', '/config/vlans', headers={'If-None-Match': before}).status == 304
+
+    vlans.request('PUT', '/config/vlans/1', json={'vlan_id': 1, 'name': 'blue', 'description': 'c'})
+    updated = etag(vlans)
+    assert updated != before
+
+    vlans.request('DELETE', '/config/vlans/2/green')
+    deleted = etag(vlans)
+    assert deleted not in (before, updated)
+
+    # a vlan created again with the same content has another ETag
+    vlans.request('POST', '/config/vlans', json=[{'vlan_id': 2, 'name': 'green'}])
+    assert etag(vlans) not in (before, updated, deleted)
+
+
+def test_etag_unchanged_on_failed_write(vlans, fake, down):
+    before = etag(vlans)
+    down.update(fake.hosts)
+    assert vlans.request('PUT', '/config/vlans/1', json={'vlan_id': 1, 'name': 'x'}).status == 400
+    assert etag(vlans) == before
+
+
+def test_etag_changes_on_sync(vlans, fake, manage_vlans, monkeypatch):
+    monkeypatch.setattr(synchronizer, 'engine', None)
+    monkeypatch.setattr(synchronizer, 'metadata', db.MetaData())
+    before = etag(vlans)
+    try:
+        # nothing to sync
+        with synchronizer.resources_db() as resource_dbs:
+            synchronizer.sync_resources(resource_dbs, manage_vlans, synchronizer.SyncState())
+        assert etag(vlans) == before
+
+        for host in fake.hosts:
+            fake.configure(host, VLANS + [{'vlan_id': 30, 'name': 'new'}])
+        with synchronizer.resources_db() as resource_dbs:
+            synchronizer.sync_resources(resource_dbs, manage_vlans, synchronizer.SyncState())
+        assert list_ids(vlans) == [1, 2, 3, 10, 20, 30]
+        assert etag(vlans) != before
+    finally:
+        synchronizer.engine.dispose()
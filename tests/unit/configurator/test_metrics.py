@@ -0,0 +1,109 @@
+import urllib.error
+import urllib.request
+
+import pytest
+import sqlalchemy as db
+
+from configurator.provider.fanout import FanoutResult, HostResult
+from metrics import CONTENT_TYPE, DB_SECONDS, DEVICE_CHANGES, DEVICE_FAILURES, DEVICE_SECONDS, HTTP_REQUEST_SECONDS, \
+    Counter, Histogram, Registry, instrument_engine, record_result, start_http_server
+
+
+def test_counter():
+    counter = Counter('test_total', 'Test counter', ('host',))
+    counter.inc(host='h1')
+    counter.inc(2, host='h1')
+    counter.inc(host='h"2')
+    assert counter.value(host='h1') == 3
+    assert counter.value(host='h3') == 0
+    assert counter.render() == ['# HELP test_total Test counter', '# TYPE test_total counter',
+                                'test_total{host="h\\"2"} 1', 'test_total{host="h1"} 3']
+
+
+def test_labels_checked():
+    counter = Counter('test_total', 'Test counter', ('host', 'action'))
+    with pytest.raises(Exception, match='expects labels host, action'):
+        counter.inc(host='h1')
+
+
+def test_histogram():
+    histogram = Histogram('test_seconds', 'Test histogram', buckets=(1, 0.1))
+    # a value on the bound is counted in its bucket
+    for value in (0.05, 0.1, 0.5, 7):
+        histogram.observe(value)
+    assert histogram.count() == 4
+    assert histogram.render()[2:] == ['test_seconds_bucket{le="0.1"} 2', 'test_seconds_bucket{le="1"} 3',
+                                      'test_seconds_bucket{le="+Inf"} 4', 'test_seconds_sum 7.65',
+                                      'test_seconds_count 4']
+
+
+def test_histogram_time():
+    histogram = Histogram('test_seconds', 'Test histogram', ('action',))
+    with pytest.raises(ValueError):
+        with histogram.time(action='edit'):
+            raise ValueError()
+    # the block that raised is observed too
+    assert histogram.count(action='edit') == 1
+
+
+def test_registry():
+    registry = Registry()
+    registry.register(Counter('a_total', 'A')).inc()
+    registry.register(Counter('b_total', 'B'))
+    assert registry.render() == '# HELP a_total A\n# TYPE a_total counter\na_total 1\n# HELP b_total B\n' \
+                                '# TYPE b_total counter\n'
+
+
+def test_instrument_engine(tmp_path):
+    engine = db.create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    instrument_engine(engine, 'test')
+    with engine.connect() as connection:
+        connection.execute(db.text('CREATE TABLE items (id INTEGER)'))
+        connection.execute(db.text('INSERT INTO items VALUES (1)'))
+        with pytest.raises(Exception):
+            connection.execute(db.text('SELECT * FROM missing'))
+        connection.execute(db.text('select * from items'))
+        # the start time of the failed statement is dropped
+        assert connection.info['metrics_start'] == []
+    assert DB_SECONDS.count(component='test', operation='INSERT') == 1
+    assert DB_SECONDS.count(component='test', operation='SELECT') == 1
+
+
+def test_record_result():
+    before = (DEVICE_CHANGES.value(host='m1', action='test'), DEVICE_FAILURES.value(host='m2', action='test'))
+    record_result(FanoutResult({'m1': HostResult('m1', changed=True), 'm2': HostResult('m2', failed=True),
+                                'm3': HostResult('m3')}), 'test')
+    assert DEVICE_CHANGES.value(host='m1', action='test') == before[0] + 1
+    assert DEVICE_FAILURES.value(host='m2', action='test') == before[1] + 1
+    assert DEVICE_CHANGES.value(host='m3', action='test') == 0
+
+
+def test_http_server():
+    server = start_http_server(0, address='127.0.0.1')
+    try:
+        url = f'http://127.0.0.1:{server.server_port}'
+        with urllib.request.urlopen(f'{url}/metrics') as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            assert b'# TYPE configurator_sync_cycle_seconds histogram' in response.read()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'{url}/other')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_metrics_of_requests(client, fake):
+    labels = {'method': 'POST', 'endpoint': 'api.create_vlans', 'status': 201}
+    requests = HTTP_REQUEST_SECONDS.count(**labels)
+    edits = DEVICE_SECONDS.count(host='fake1', action='edit')
+    inserts = DB_SECONDS.count(component='app', operation='INSERT')
+
+    assert client.request('POST', '/config/vlans', json=[{'vlan_id': 10, 'name': 'ten'}]).status == 201
+    assert HTTP_REQUEST_SECONDS.count(**labels) == requests + 1
+    assert DEVICE_SECONDS.count(host='fake1', action='edit') == edits + 1
+    assert DB_SECONDS.count(component='app', operation='INSERT') > inserts
+
+    response = client.request('GET', '/metrics')
+    assert response.headers['content-type'] == CONTENT_TYPE
+    assert 'configurator_http_request_seconds_count{method="POST",endpoint="api.create_vlans",status="201"}' in \
+           response.body.decode('utf-8')
@@ -0,0 +1,53 @@
+import pytest
+
+from reconciler import DriftReconciler, config_digest, get_db_config
+
+
+@pytest.fixture
+def reconciler(app, manage_vlans):
+    # registered on the app as by start_background, without its thread
+    reconciler = DriftReconciler(manage_vlans, app=app)
+    app.extensions['reconciler'] = reconciler
+    return reconciler
+
+
+def test_mark_applied_keeps_request_session(app, manage_vlans, reconciler):
+    import server
+    from database import Vlans, db
+
+    with app.app_context():
+        db.session.add(Vlans(vlan_id=10, name='ten'))
+        db.session.commit()
+        db.session.remove()
+
+    with app.test_request_context():
+        vlan = Vlans.query.get(10)
+        server.mark_applied(manage_vlans.edit_vlans({'vlan_id': 10, 'name': 'ten'}))
+        # the objects of the request are still in its session
+        assert vlan in db.session
+        assert reconciler.applied_digest == config_digest(get_db_config(app))
+        db.session.remove()
+
+
+def test_write_marks_applied(client, fake, reconciler):
+    response = client.request('POST', '/config/vlans', json=[{'vlan_id': 10, 'name': 'ten'}])
+    assert response.status == 201
+    response = client.request('PUT', '/config/vlans/10', json={'vlan_id': 10, 'name': 'TEN'})
+    assert response.headers['etag'] == '"2"'
+
+    # the database state is already on the devices
+    commits = dict(fake.commits)
+    assert reconciler.reconcile() is False
+    assert fake.commits == commits
+
+
+def test_partial_write_not_marked(client, fake, down, reconciler):
+    down.add('fake2')
+    assert client.request('POST', '/config/vlans', json=[{'vlan_id': 10, 'name': 'ten'}]).status == 207
+    assert reconciler.applied_digest is None
+
+    # the failed host is reconciled on next cycle
+    down.clear()
+    assert reconciler.reconcile() is True
+    assert sorted(fake.config[('fake2', 'vlans')]) == [10]
+    assert reconciler.applied_digest == config_digest([{'vlan_id': 10, 'name': 'ten', 'description': None}])
@@ -0,0 +1,279 @@
+import pytest
+
+
+def create(client, *vlans):
+    return client.request('POST', '/config/vlans', json=list(vlans))
+
+
+def device_vlans(fake, host):
+    return sorted((vlan_id, vlan.get('name')) for vlan_id, vlan in fake.config[(host, 'vlans')].items())
+
+
+def test_index(client):
+    response = client.request('GET', '/')
+    assert response.status == 200
+    assert response.body == b'Welcome to configurator!'
+
+
+def test_unknown_path(client):
+    assert client.request('GET', '/config/interfaces').status == 404
+
+
+def test_method_not_allowed(client):
+    assert client.request('PATCH', '/config/vlans').status == 405
+
+
+def test_create_vlans(client, fake):
+    response = create(client, {'vlan_id': 10, 'name': 'ten'}, {'vlan_id': 11, 'name': 'eleven', 'description': 'x'})
+    assert response.status == 201
+    assert response.json == [{'vlan_id': 10, 'name': 'ten'}, {'vlan_id': 11, 'name': 'eleven', 'description': 'x'}]
+    for host in fake.hosts:
+        assert device_vlans(fake, host) == [(10, 'ten'), (11, 'eleven')]
+
+    response = client.request('GET', '/config/vlans/11')
+    assert response.status == 200
+    assert response.json == [{'vlan_id': 11, 'name': 'eleven', 'description': 'x'}]
+    assert response.headers['etag'] == '"1"'
+
+
+@pytest.mark.parametrize('body', [
+    [{'vlan_id': 'x', 'name': 'a'}],
+    [{'vlan_id': 0, 'name': 'a'}],
+    [{'vlan_id': 1025, 'name': 'a'}],
+    [{'vlan_id': 5, 'name': 'a', 'mtu': 1500}],
+    [{'vlan_id': 5}],
+    ['vlan5'],
+    [],
+    {'vlan_id': 5, 'name': 'a'},
+])
+def test_create_invalid_body(client, fake, body):
+    response = client.request('POST', '/config/vlans', json=body)
+    assert response.status == 400
+    assert 'error' in response.json
+    assert device_vlans(fake, 'fake1') == []
+
+
+def test_create_existing_vlan(client):
+    assert create(client, {'vlan_id': 10, 'name': 'ten'}).status == 201
+    response = create(client, {'vlan_id': 10, 'name': 'again'})
+    assert response.status == 400
+    assert client.request('GET', '/config/vlans/10').json == [{'vlan_id': 10, 'name': 'ten', 'description': None}]
+
+
+def test_create_fails_on_all_hosts(client, fake, down):
+    down.update(fake.hosts)
+    response = create(client, {'vlan_id': 10, 'name': 'ten'})
+    assert response.status == 400
+    # the database is rolled back
+    assert client.request('GET', '/config/vlans/10').status == 404
+
+
+def test_create_fails_on_some_hosts(client, fake, down):
+    down.add('fake2')
+    response = create(client, {'vlan_id': 10, 'name': 'ten'})
+    assert response.status == 207
+    assert response.json['hosts']['fake2']['failed']
+    assert not response.json['hosts']['fake1']['failed']
+    assert device_vlans(fake, 'fake1') == [(10, 'ten')]
+    assert client.request('GET', '/config/vlans/10').status == 200
+
+
+def test_update_vlan(client, fake):
+    create(client, {'vlan_id': 10, 'name': 'ten'})
+    response = client.request('PUT', '/config/vlans/10', json={'vlan_id': 10, 'name': 'TEN'})
+    assert response.status == 201
+    assert response.headers['etag'] == '"2"'
+    assert device_vlans(fake, 'fake2') == [(10, 'TEN')]
+
+
+def test_update_creates_missing_vlan(client, fake):
+    response = client.request('PUT', '/config/vlans/20', json={'vlan_id': 20, 'name': 'twenty'})
+    assert response.status == 201
+    assert response.headers['etag'] == '"1"'
+    assert device_vlans(fake, 'fake1') == [(20, 'twenty')]
+
+
+@pytest.mark.parametrize('body', [
+    {'vlan_id': 10},
+    {'vlan_id': 11, 'name': 'a'},
+    {'vlan_id': 10, 'name': 'a', 'mtu': 1500},
+    ['a'],
+])
+def test_update_invalid_body(client, body):
+    assert client.request('PUT', '/config/vlans/10', json=body).status == 400
+
+
+def test_delete_vlan(client, fake):
+    create(client, {'vlan_id': 10, 'name': 'ten'}, {'vlan_id': 11, 'name': 'eleven'})
+    response = client.request('DELETE', '/config/vlans/10/ten')
+    assert response.status == 200
+    assert response.json == {'result': True}
+    assert device_vlans(fake, 'fake1') == [(11, 'eleven')]
+    assert client.request('GET', '/config/vlans/10').status == 404
+
+
+def test_delete_missing_vlan(client):
+    assert client.request('DELETE', '/config/vlans/10/ten').status == 404
+
+
+def test_delete_fails_on_all_hosts(client, fake, down):
+    create(client, {'vlan_id': 10, 'name': 'ten'})
+    down.update(fake.hosts)
+    assert client.request('DELETE', '/config/vlans/10/ten').status == 400
+    assert client.request('GET', '/config/vlans/10').status == 200
+
+
+def test_list_vlans(client):
+    create(client, *[{'vlan_id': vlan_id, 'name': f'v{vlan_id}'} for vlan_id in range(1, 6)])
+    response = client.request('GET', '/config/vlans?limit=2')
+    assert response.status == 200
+    assert [vlan['vlan_id'] for vlan in response.json] == [1, 2]
+    assert 'after=2' in response.headers['link']
+
+    etag = client.request('GET', '/config/vlans').headers['etag']
+    assert client.request('GET', '/config/vlans', headers={'If-None-Match': etag}).status == 304
+    client.request('PUT', '/config/vlans/3', json={'vlan_id': 3, 'name': 'three'})
+    assert client.request('GET', '/config/vlans', headers={'If-None-Match': etag}).status == 200
+
+
+def test_list_invalid_argument(client):
+    assert client.request('GET', '/config/vlans?limit=x').status == 400
+
+
+def test_bulk_range(client, fake):
+    response = client.request('POST', '/config/vlans/bulk',
+                              json={'range': '5-7', 'name_template': 'v{id}', 'description_template': 'd{id}'})
+    assert response.status == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert response.lines() == [{'item': index, 'vlan_id': vlan_id, 'status': 'applied'}
+                                for index, vlan_id in enumerate(range(5, 8), start=1)]
+    assert device_vlans(fake, 'fake2') == [(5, 'v5'), (6, 'v6'), (7, 'v7')]
+
+
+def test_bulk_ndjson(client, fake):
+    data = '\n'.join(['{"vlan_id": 5, "name": "a"}', '{"name": "x"}', '{"vlan_id": 5, "name": "b"}', 'junk'])
+    response = client.request('POST', '/config/vlans/bulk', data=data, content_type='application/x-ndjson')
+    assert response.status == 200
+    assert [(line['item'], line['status']) for line in response.lines()] == [
+        (1, 'superseded'), (2, 'invalid'), (3, 'applied'), (4, 'invalid')]
+    assert device_vlans(fake, 'fake1') == [(5, 'b')]
+
+
+@pytest.mark.parametrize('body', [
+    {'range': '1-x'},
+    {'range': 5},
+    {'range': '1-3', 'mtu': 1500},
+    ['1-3'],
+])
+def test_bulk_invalid_request(client, body):
+    assert client.request('POST', '/config/vlans/bulk', json=body).status == 400
+
+
+def test_job_not_found(client):
+    assert client.request('GET', '/jobs/unknown').status == 404
+
+
+def test_drift(client, fake):
+    create(client, {'vlan_id': 10, 'name': 'ten'})
+    fake.configure('fake2', [{'vlan_id': 11, 'name': 'extra'}])
+    report = client.request('GET', '/drift').json
+    assert report['in_sync'] == ['fake1']
+    assert report['diverged'] == ['fake2']
+    assert client.request('GET', '/drift?hosts=fake3').status == 400
+
+
+def test_metrics(client):
+    client.request('GET', '/')
+    response = client.request('GET', '/metrics')
+    assert response.status == 200
+    assert b'configurator_http_request_seconds' in response.body
+
+
+@pytest.mark.parametrize('body', [
+    {'range': '1-3', 'name_template': 5},
+    {'range': '1-3', 'description_template': 5},
+])
+def test_bulk_invalid_template(client, fake, body):
+    # rejected before the stream starts
+    response = client.request('POST', '/config/vlans/bulk', json=body)
+    assert response.status == 400
+    assert 'error' in response.json
+    assert fake.config[('fake1', 'vlans')] == {}
+
+
+def test_create_bool_vlan_id(client):
+    assert create(client, {'vlan_id': True, 'name': 'a'}).status == 400
+
+
+def test_update_if_match(client, fake):
+    create(client, {'vlan_id': 10, 'name': 'ten'})
+    etag = client.request('GET', '/config/vlans/10').headers['etag']
+    response = client.request('PUT', '/config/vlans/10', json={'vlan_id': 10, 'name': 'TEN'}, headers={'If-Match': etag})
+    assert response.status == 201
+    # every write bumps the version
+    assert response.headers['etag'] == '"2"'
+    assert client.request('GET', '/config/vlans/10').headers['etag'] == '"2"'
+
+    # the stale version is rejected and neither the database nor the device changes
+    response = client.request('PUT', '/config/vlans/10', json={'vlan_id': 10, 'name': 'x'}, headers={'If-Match': etag})
+    assert response.status == 412
+    assert 'error' in response.json
+    assert client.request('GET', '/config/vlans/10').json[0]['name'] == 'TEN'
+    assert device_vlans(fake, 'fake1') == [(10, 'TEN')]
+
+
+def test_update_if_match_star(client, fake):
+    # If-Match: * requires an existing vlan
+    response = client.request('PUT', '/config/vlans/10', json={'vlan_id': 10, 'name': 'ten'}, headers={'If-Match': '*'})
+    assert response.status == 412
+    assert client.request('GET', '/config/vlans/10').status == 404
+    assert device_vlans(fake, 'fake1') == []
+
+    create(client, {'vlan_id': 10, 'name': 'ten'})
+    response = client.request('PUT', '/config/vlans/10', json={'vlan_id': 10, 'name': 'TEN'}, headers={'If-Match': '*'})
+    assert response.status == 201
+
+
+def test_delete_if_match(client, fake):
+    create(client, {'vlan_id': 10, 'name': 'ten'})
+    client.request('PUT', '/config/vlans/10', json={'vlan_id': 10, 'name': 'ten', 'description': 'd'})
+
+    assert client.request('DELETE', '/config/vlans/10/ten', headers={'If-Match': '"1"'}).status == 412
+    assert client.request('GET', '/config/vlans/10').status == 200
+    assert device_vlans(fake, 'fake2') == [(10, 'ten')]
+
+    assert client.request('DELETE', '/config/vlans/10/ten', headers={'If-Match': '"2"'}).status == 200
+    assert client.request('GET', '/config/vlans/10').status == 404
+
+
+def test_create_app_is_lazy(config, tmp_path, monkeypatch):
+    import server
+    from configurator.provider.fake import vlans
+
+    created = []
+    init = vlans.FakeManageVlans.__init__
+
+    def create_provider(self, *args, **kwargs):
+        created.append('provider')
+        init(self, *args, **kwargs)
+
+    monkeypatch.setattr(vlans.FakeManageVlans, '__init__', create_provider)
+
+    app = server.create_app()
+    # no database connection and no provider until the first request
+    assert not (tmp_path / 'configurator.db').exists()
+    assert 'manage_vlans' not in app.extensions
+    assert created == []
+
+    client = app.test_client()
+    assert client.get('/config/vlans').status_code == 200
+    assert (tmp_path / 'configurator.db').exists()
+    assert 'manage_vlans' not in app.extensions
+
+    assert client.post('/config/vlans', json=[{'vlan_id': 10, 'name': 'ten'}]).status_code == 201
+    assert created == ['provider']
+    manage_vlans = app.extensions['manage_vlans']
+    assert client.put('/config/vlans/10', json={'vlan_id': 10, 'name': 'TEN'}).status_code == 201
+    # the provider is created once
+    assert app.extensions['manage_vlans'] is manage_vlans
+    assert created == ['provider']
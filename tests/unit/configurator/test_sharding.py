@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+import sqlalchemy as db
+
+import sharding
+import synchronizer
+from sharding import AdvisoryLock, HashRing, WorkerRegistry
+
+HOSTS = [f'host{index}' for index in range(200)]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return db.create_engine(f"sqlite:///{tmp_path / 'sharding.db'}")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''
+    Time of the sharding module, moved forward by the test
+    '''
+    now = [time.time()]
+    monkeypatch.setattr(sharding.time, 'time', lambda: now[0])
+    return now
+
+
+def owners(ring):
+    return {host: ring.owner(host) for host in HOSTS}
+
+
+def test_hash_ring():
+    ring = HashRing(['w2', 'w1', 'w3'])
+    assert ring.members == ['w1', 'w2', 'w3']
+    assert set(owners(ring).values()) == {'w1', 'w2', 'w3'}
+    # same owners whatever the order of members
+    assert owners(ring) == owners(HashRing(['w3', 'w1', 'w2']))
+    assert HashRing([]).owner('host1') is None
+
+
+def test_hash_ring_join():
+    before = owners(HashRing(['w1', 'w2', 'w3']))
+    after = owners(HashRing(['w1', 'w2', 'w3', 'w4']))
+    moved = [host for host in HOSTS if before[host] != after[host]]
+    # only the hosts taken by the new worker move
+    assert moved and all(after[host] == 'w4' for host in moved)
+    assert len(moved) < len(HOSTS) / 2
+
+
+def test_hash_ring_leave():
+    before = owners(HashRing(['w1', 'w2', 'w3']))
+    after = owners(HashRing(['w1', 'w3']))
+    # only the hosts of the worker gone move
+    assert [host for host in HOSTS if before[host] != after[host]] == [
+        host for host in HOSTS if before[host] == 'w2']
+
+
+def test_worker_registry(engine, clock):
+    metadata = db.MetaData()
+    worker1 = WorkerRegistry(engine, metadata, worker_id='w1', ttl=30)
+    worker2 = WorkerRegistry(engine, metadata, worker_id='w2', ttl=30)
+    worker1.heartbeat()
+    worker2.heartbeat()
+    assert sorted(worker1.live_workers()) == ['w1', 'w2']
+
+    # w2 misses its heartbeats beyond ttl
+    clock[0] += 20
+    worker1.heartbeat()
+    clock[0] += 20
+    assert worker1.live_workers() == ['w1']
+    worker2.heartbeat()
+    assert sorted(worker1.live_workers()) == ['w1', 'w2']
+
+    worker2.leave()
+    assert worker1.live_workers() == ['w1']
+
+
+def test_lease(engine, clock):
+    metadata = db.MetaData()
+    lock1 = AdvisoryLock(engine, metadata, 'leader', 'w1', ttl=30)
+    lock2 = AdvisoryLock(engine, metadata, 'leader', 'w2', ttl=30)
+    assert lock1.acquire()
+    assert not lock2.acquire()
+
+    # renewed by the owner within ttl
+    clock[0] += 20
+    assert lock1.acquire()
+    clock[0] += 20
+    assert not lock2.acquire()
+
+    # taken over once the lease expires
+    clock[0] += 20
+    assert lock2.acquire()
+    assert not lock1.acquire()
+
+    # released by the owner only
+    lock1.release()
+    assert not lock1.acquire()
+    lock2.release()
+    assert lock1.acquire()
+
+
+def test_lease_other_lock(engine):
+    metadata = db.MetaData()
+    assert AdvisoryLock(engine, metadata, 'leader', 'w1').acquire()
+    assert AdvisoryLock(engine, metadata, 'other', 'w2').acquire()
+
+
+def test_run_sharded_stores_fingerprints_after_reconcile(config, app, manage_vlans, fake, monkeypatch):
+    from database import Vlans, db as app_db
+
+    config['synchronizer'] = {'interval': 0.01}
+    config['sharding'] = {'worker_id': 'w1'}
+    monkeypatch.setattr(synchronizer, 'engine', None)
+    monkeypatch.setattr(synchronizer, 'metadata', db.MetaData())
+    with app.app_context():
+        app_db.session.add(Vlans(vlan_id=10, name='ten'))
+        app_db.session.commit()
+        app_db.session.remove()
+    # the reference device has the database state, fake2 drifted
+    fake.configure('fake1', [{'vlan_id': 10, 'name': 'ten'}])
+
+    stop = threading.Event()
+    reconciled = []
+    cycles = []
+    reconcile_hosts = synchronizer.reconcile_hosts
+    sync_resources = synchronizer.sync_resources
+
+    def _reconcile_hosts(resource_dbs, manage_vlans, hosts):
+        reconciled.append(hosts)
+        return reconcile_hosts(resource_dbs, manage_vlans, hosts)
+
+    def _sync_resources(resource_dbs, manage_vlans, state, lease=None):
+        cycles.append(state)
+        if len(cycles) == 4:
+            stop.set()
+        return sync_resources(resource_dbs, manage_vlans, state, lease=lease)
+
+    monkeypatch.setattr(synchronizer, 'reconcile_hosts', _reconcile_hosts)
+    monkeypatch.setattr(synchronizer, 'sync_resources', _sync_resources)
+    synchronizer.run_sharded(manage_vlans, synchronizer.SyncState(), stop)
+
+    # the commit of the reconcile does not trigger another one
+    assert reconciled == [['fake2']]
+    assert sorted(fake.config[('fake2', 'vlans')]) == [10]
+    synchronizer.engine.dispose()
@@ -0,0 +1,261 @@
+import threading
+import time
+
+from contextlib import contextmanager
+
+import pytest
+
+import synchronizer
+from configurator.provider import manage
+from configurator.provider.fake.vlans import FakeManageVlans
+
+COMMIT_NOTIFICATION = ('<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">'
+                       '<netconf-config-change xmlns="urn:ietf:params:xml:ns:yang:ietf-netconf-notifications"/>'
+                       '</notification>')
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for condition")
+        time.sleep(0.01)
+
+
+class StubResourceDb(object):
+    def __init__(self, resource):
+        self.resource = resource
+
+
+def edit_notification(*targets):
+    edits = ''.join(f'<edit><target>{target}</target></edit>' for target in targets)
+    return ('<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">'
+            '<netconf-config-change xmlns="urn:ietf:params:xml:ns:yang:ietf-netconf-notifications">'
+            f'{edits}</netconf-config-change></notification>')
+
+
+@pytest.fixture
+def resources():
+    # the resources synced by the synchronizer
+    return ['vlans']
+
+
+@pytest.fixture
+def events(config, resources, monkeypatch):
+    config['synchronizer'] = {'resources': resources}
+    calls = {'sync': [], 'reconcile': []}
+
+    @contextmanager
+    def resources_db(resources=None):
+        yield [StubResourceDb(resource) for resource in resources or synchronizer.synced_resources()]
+
+    monkeypatch.setattr(synchronizer, 'resources_db', resources_db)
+    monkeypatch.setattr(synchronizer, 'sync_resources', lambda resource_dbs, manage_vlans, state: calls['sync'].append(
+        [resource_db.resource.name for resource_db in resource_dbs]))
+    monkeypatch.setattr(synchronizer, 'reconcile_hosts', lambda resource_dbs, manage_vlans, hosts: calls[
+        'reconcile'].append(([resource_db.resource.name for resource_db in resource_dbs], hosts)))
+
+    fake = FakeManageVlans(hosts=2)
+    stop = threading.Event()
+    thread = threading.Thread(target=synchronizer.run_events,
+                              args=(manage.ManageVlans(obj=fake), synchronizer.SyncState(), stop))
+    thread.start()
+    # the fallback full sync runs on start
+    wait_for(lambda: calls['sync'] and all(source.opened for source in fake.sources.values()))
+    yield fake, calls
+    stop.set()
+    thread.join()
+
+
+def test_commit_event_on_reference_host_syncs_once(events):
+    fake, calls = events
+    fake.sources['fake1'].push(COMMIT_NOTIFICATION)
+    wait_for(lambda: len(calls['sync']) == 2)
+    time.sleep(0.2)
+    assert calls['sync'] == [['vlans'], ['vlans']]
+    assert calls['reconcile'] == []
+
+
+def test_commit_event_on_host_reconciles_the_host(events):
+    fake, calls = events
+    fake.sources['fake2'].push(COMMIT_NOTIFICATION)
+    wait_for(lambda: calls['reconcile'])
+    time.sleep(0.2)
+    assert calls['reconcile'] == [(['vlans'], ['fake2'])]
+    assert calls['sync'] == [['vlans']]
+
+
+def test_other_notification_ignored(events):
+    fake, calls = events
+    fake.sources['fake1'].push('<notification><eventTime>2020-01-01T00:00:00Z</eventTime></notification>')
+    time.sleep(0.2)
+    assert calls['sync'] == [['vlans']]
+    assert calls['reconcile'] == []
+
+
+@pytest.mark.parametrize('resources', [['vlans', 'interfaces']])
+def test_edit_event_reconciles_the_changed_resource(events):
+    fake, calls = events
+    fake.sources['fake2'].push(edit_notification("/if:interfaces/if:interface[if:name='ge-0/0/0']/if:mtu"))
+    wait_for(lambda: calls['reconcile'])
+    time.sleep(0.2)
+    assert calls['reconcile'] == [(['interfaces'], ['fake2'])]
+
+    # a commit notification without edit targets reports all the resources
+    fake.sources['fake2'].push(COMMIT_NOTIFICATION)
+    wait_for(lambda: len(calls['reconcile']) == 2)
+    assert calls['reconcile'][1] == (['vlans', 'interfaces'], ['fake2'])
+
+
+@pytest.mark.parametrize('resources', [['vlans', 'interfaces']])
+def test_commit_on_fake_device_notifies_its_resources(events):
+    fake, calls = events
+    fake.configure('fake2', [{'vlan_id': 10, 'name': 'ten'}])
+    wait_for(lambda: calls['reconcile'])
+    assert calls['reconcile'] == [(['vlans'], ['fake2'])]
+
+
+@pytest.mark.parametrize('resources', [['vlans', 'interfaces']])
+def test_edit_event_of_other_resource_ignored(events):
+    fake, calls = events
+    fake.sources['fake2'].push(edit_notification('/system/host-name'))
+    time.sleep(0.2)
+    assert calls['reconcile'] == []
+
+
+def test_failed_event_sync_keeps_running(events, monkeypatch):
+    fake, calls = events
+
+    def reconcile_hosts(resource_dbs, manage_vlans, hosts):
+        calls['reconcile'].append(hosts)
+        if len(calls['reconcile']) == 1:
+            raise Exception('database unreachable')
+
+    monkeypatch.setattr(synchronizer, 'reconcile_hosts', reconcile_hosts)
+    fake.sources['fake2'].push(COMMIT_NOTIFICATION)
+    wait_for(lambda: calls['reconcile'])
+    fake.sources['fake2'].push(COMMIT_NOTIFICATION)
+    wait_for(lambda: len(calls['reconcile']) == 2)
+
+
+def test_failed_poll_cycle_keeps_running(config, monkeypatch):
+    config['synchronizer'] = {'interval': 0.01}
+    stop = threading.Event()
+    cycles = []
+
+    @contextmanager
+    def resources_db(resources=None):
+        cycles.append(len(cycles))
+        if len(cycles) == 1:
+            raise Exception('database unreachable')
+        yield []
+
+    def sync_resources(resource_dbs, manage_vlans, state):
+        if len(cycles) == 3:
+            stop.set()
+
+    monkeypatch.setattr(synchronizer, 'resources_db', resources_db)
+    monkeypatch.setattr(synchronizer, 'sync_resources', sync_resources)
+    synchronizer.run_poll(None, synchronizer.SyncState(), stop)
+    assert cycles == [0, 1, 2]
+
+
+@pytest.fixture
+def sync_db(app, fake, manage_vlans, monkeypatch):
+    '''
+    Run a sync cycle against the SQLite database of the app, the checksum
+    of the rows stands for the MySQL CHECKSUM TABLE
+    '''
+    import sqlalchemy as db
+
+    monkeypatch.setattr(synchronizer, 'engine', None)
+    monkeypatch.setattr(synchronizer, 'metadata', db.MetaData())
+    monkeypatch.setattr(synchronizer.ResourceDb, 'checksum',
+                        lambda self: hash(tuple(sorted(map(tuple, self.get_records())))))
+
+    def sync(state):
+        with synchronizer.resources_db() as resource_dbs:
+            return synchronizer._sync_resources(resource_dbs, manage_vlans, state)
+
+    yield sync
+    synchronizer.engine.dispose()
+
+
+def db_vlans():
+    with synchronizer.resources_db() as resource_dbs:
+        return sorted(tuple(record) for record in resource_dbs[0].get_records())
+
+
+def configure(fake, config):
+    for host in fake.hosts:
+        fake.configure(host, config)
+
+
+def test_incremental_sync_skips_unchanged_cycle(sync_db, fake):
+    configure(fake, [{'vlan_id': 10, 'name': 'ten'}])
+    state = synchronizer.SyncState()
+    assert sync_db(state) == 'synced'
+    assert db_vlans() == [(10, 'ten', None)]
+
+    # a fingerprint round trip only, the config is not gathered
+    round_trips = fake.round_trips
+    assert sync_db(state) == 'skipped'
+    assert fake.round_trips == round_trips + 1
+
+
+def test_incremental_sync_on_device_change(sync_db, fake):
+    state = synchronizer.SyncState()
+    assert sync_db(state) == 'unchanged'
+    configure(fake, [{'vlan_id': 10, 'name': 'ten'}])
+    assert sync_db(state) == 'synced'
+    assert db_vlans() == [(10, 'ten', None)]
+    assert sync_db(state) == 'skipped'
+
+
+def test_incremental_sync_on_db_change(sync_db, fake):
+    configure(fake, [{'vlan_id': 10, 'name': 'ten'}])
+    state = synchronizer.SyncState()
+    sync_db(state)
+
+    # a vlan added in database only, the device config wins
+    with synchronizer.resources_db() as resource_dbs:
+        resource_dbs[0].create_records([(11, 'eleven', None)])
+    assert sync_db(state) == 'synced'
+    assert db_vlans() == [(10, 'ten', None)]
+
+
+def test_full_sync_never_skips(sync_db, fake):
+    configure(fake, [{'vlan_id': 10, 'name': 'ten'}])
+    state = synchronizer.SyncState(incremental=False)
+    assert sync_db(state) == 'synced'
+    round_trips = fake.round_trips
+    assert sync_db(state) == 'unchanged'
+    # the config is gathered again
+    assert fake.round_trips > round_trips
+
+
+def test_incremental_sync_without_checksum(sync_db, fake, monkeypatch):
+    # the database dialect has no cheap checksum
+    monkeypatch.setattr(synchronizer.ResourceDb, 'checksum', lambda self: None)
+    state = synchronizer.SyncState()
+    assert sync_db(state) == 'unchanged'
+    assert sync_db(state) == 'unchanged'
+
+
+def test_sync_of_many_resources(sync_db, config, fake):
+    config['synchronizer'] = {'resources': ['vlans', 'interfaces']}
+    configure(fake, [{'vlan_id': 10, 'name': 'ten'}])
+    for host in fake.hosts:
+        fake.configure(host, [{'name': 'eth0', 'description': 'uplink', 'enabled': True, 'mtu': 9000}],
+                       resource='interfaces')
+    state = synchronizer.SyncState()
+    round_trips = fake.round_trips
+    assert sync_db(state) == 'synced'
+    # a fingerprint and a single gather of all the resources
+    assert fake.round_trips == round_trips + 2
+    assert set(state.db_snapshots) == {'vlans', 'interfaces'}
+
+    with synchronizer.resources_db() as resource_dbs:
+        assert [resource_db.resource.name for resource_db in resource_dbs] == ['vlans', 'interfaces']
+        assert [tuple(record) for record in resource_dbs[1].get_records()] == [('eth0', 'uplink', True, 9000, None)]
+    assert db_vlans() == [(10, 'ten', None)]